@@ -12,6 +12,7 @@ import logging
 from pytest import yield_fixture, fixture
 import devpi_server as _devpi_server
 from devpi.main import main as devpi_client
+from pytest_server_fixtures import snapshot
 from pytest_server_fixtures.http import HTTPTestServer
 
 log = logging.getLogger(__name__)
@@ -120,9 +121,12 @@ class DevpiServer(HTTPTestServer):
             log.info("Extracting initial server data from {}".format(self.data))
             zipfile.ZipFile(self.data, 'r').extractall(str(self.server_dir))
         else:
-            self.run([os.path.join(sys.exec_prefix, "bin", "devpi-init"),
-                    '--serverdir', str(self.server_dir),
-                    ])
+            # devpi-init is slow and always produces the same thing, so it is done once and snapshotted
+            key = snapshot.get_key(_devpi_server.__version__, sys.executable)
+            snapshot.cached('devpi-init', key, self.server_dir,
+                            lambda path: self.run([os.path.join(sys.exec_prefix, "bin", "devpi-init"),
+                                                   '--serverdir', str(path),
+                                                   ]))
 
 
     def post_setup(self):
@@ -1,16 +1,43 @@
 """ Fixture configuration
 """
 import functools
+import threading
 
 import pytest
 
 
+class lazy(object):
+    """ A config value that is only worked out when it is first used, eg. one needing a DNS lookup.
+        Wraps a function returning the value, which is called at most once.
+    """
+    __slots__ = ('_func', '_value', '_lock')
+
+    def __init__(self, func):
+        self._func = func
+        self._value = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        with self._lock:
+            if self._func is not None:
+                self._value = self._func()
+                self._func = None
+            return self._value
+
+
 class Config(object):
     __slots__ = ()
 
     def __init__(self, **kwargs):
         [setattr(self, k, v) for (k, v) in kwargs.items()]
 
+    def __getattribute__(self, name):
+        value = object.__getattribute__(self, name)
+        if isinstance(value, lazy):
+            value = value.resolve()
+            object.__setattr__(self, name, value)
+        return value
+
     def update(self, cfg):
         for k in cfg:
             if k not in self.__slots__:
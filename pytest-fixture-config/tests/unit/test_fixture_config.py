@@ -8,7 +8,7 @@ import pytest
 import pytest_fixture_config
 importlib.reload(pytest_fixture_config)
 
-from pytest_fixture_config import Config, requires_config, yield_requires_config
+from pytest_fixture_config import Config, lazy, requires_config, yield_requires_config
 
 class DummyConfig(Config):
     __slots__ = ('foo', 'bar')
@@ -25,6 +25,26 @@ def test_config_update():
         cfg.update({"baz": 30})
 
 
+def test_lazy_config_value():
+    calls = []
+
+    def get_foo():
+        calls.append(1)
+        return 'foo'
+
+    cfg = DummyConfig(foo=lazy(get_foo), bar=2)
+    assert not calls
+    assert cfg.foo == 'foo'
+    assert cfg.foo == 'foo'
+    assert calls == [1]
+
+
+def test_update_replaces_lazy_config_value():
+    cfg = DummyConfig(foo=lazy(lambda: 1 / 0), bar=2)
+    cfg.update({"foo": 10})
+    assert cfg.foo == 10
+
+
 CONFIG1 = DummyConfig(foo=None, bar=1)
 
 @pytest.fixture
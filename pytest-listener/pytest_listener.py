@@ -10,7 +10,8 @@ from threading import Thread, Event
 from time import sleep
 
 import pytest
-from pytest_server_fixtures.base import get_ephemeral_port, get_ephemeral_host
+from pytest_server_fixtures.base import get_ephemeral_host
+from pytest_server_fixtures.ports import allocate_port, release_port
 
 TERMINATOR = json.dumps(['STOP']).encode('utf-8')
 CLEAR = json.dumps(['CLEAR']).encode('utf-8')
@@ -71,13 +72,14 @@ class Listener(Thread):
     def __init__(self, host=None):
         super(Listener, self).__init__()
         self.host = host or get_ephemeral_host()
-        self.port = get_ephemeral_port(host=self.host)
+        self.port = allocate_port(self.host)
         self._stop_event = Event()
         self.clear_time = None
 
         self.s = socket.socket()
         self.queue = collections.deque()
         self.s.bind((self.host, self.port))
+        release_port(self.port)
 
     def run(self):
         if DEBUG:
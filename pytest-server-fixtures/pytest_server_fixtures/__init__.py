@@ -1,7 +1,7 @@
 import socket
 import os
 
-from pytest_fixture_config import Config
+from pytest_fixture_config import Config, lazy
 from .util import get_random_id
 
 
@@ -17,9 +17,12 @@ class FixtureConfig(Config):
         'minio_image',
         'mongo_bin',
         'mongo_image',
+        'mongo_profile',
+        'mongo_max_pool_size',
         'pg_config_executable',
         'redis_executable',
         'redis_image',
+        'redis_databases',
         'httpd_executable',
         'httpd_image',
         'httpd_modules',
@@ -29,19 +32,51 @@ class FixtureConfig(Config):
         'server_class',
         'session_id',
         'k8s_namespace',
-        'k8s_local_test'
+        'k8s_local_test',
+        'k8s_pool_size',
+        'server_pool_size',
+        'port_range',
+        'xdist_partition',
+        'trace_file',
+        'log_dir',
+        'log_lines',
+        'docker_reuse',
+        'docker_reuse_ttl',
+        'reap_orphans',
+        'storage',
+        'snapshots',
+        'snapshot_dir',
     )
 
+
+def _get_default_hostname():
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except socket.gaierror:
+        return '127.0.0.1'
+
+
 # Default values for system resource locations - patch this to change defaults
-try:
-    DEFAULT_SERVER_FIXTURES_HOSTNAME = socket.gethostbyname(socket.gethostname())
-except socket.gaierror:
-    DEFAULT_SERVER_FIXTURES_HOSTNAME = '127.0.0.1'
+# The hostname needs a DNS lookup, so it is only looked up when it is first used
+DEFAULT_SERVER_FIXTURES_HOSTNAME = lazy(_get_default_hostname)
 DEFAULT_SERVER_FIXTURES_SESSION_ID = get_random_id(SESSION_ID_LEN)
 DEFAULT_SERVER_FIXTURES_DISABLE_HTTP_PROXY = True
 DEFAULT_SERVER_FIXTURES_SERVER_CLASS = 'thread'
 DEFAULT_SERVER_FIXTURES_K8S_NAMESPACE = None
 DEFAULT_SERVER_FIXTURES_K8S_LOCAL_TEST = False
+DEFAULT_SERVER_FIXTURES_K8S_POOL_SIZE = None
+DEFAULT_SERVER_FIXTURES_POOL_SIZE = 0
+DEFAULT_SERVER_FIXTURES_PORT_RANGE = '1024-32767'
+DEFAULT_SERVER_FIXTURES_XDIST_PARTITION = False
+DEFAULT_SERVER_FIXTURES_TRACE = None
+DEFAULT_SERVER_FIXTURES_LOG_DIR = None
+DEFAULT_SERVER_FIXTURES_LOG_LINES = 100
+DEFAULT_SERVER_FIXTURES_DOCKER_REUSE = None
+DEFAULT_SERVER_FIXTURES_DOCKER_REUSE_TTL = 600
+DEFAULT_SERVER_FIXTURES_REAP_ORPHANS = True
+DEFAULT_SERVER_FIXTURES_STORAGE = None
+DEFAULT_SERVER_FIXTURES_SNAPSHOTS = True
+DEFAULT_SERVER_FIXTURES_SNAPSHOT_DIR = None
 DEFAULT_SERVER_FIXTURES_JAVA = 'java'
 DEFAULT_SERVER_FIXTURES_JENKINS_URL = 'http://acmejenkins.example.com'
 DEFAULT_SERVER_FIXTURES_JENKINS_WAR = '/usr/share/jenkins/jenkins.war'
@@ -50,9 +85,12 @@ DEFAULT_SERVER_FIXTURES_MINIO = 'minio'
 DEFAULT_SERVER_FIXTURES_MINIO_IMAGE = 'minio/minio:latest'
 DEFAULT_SERVER_FIXTURES_MONGO_BIN = 'mongod'
 DEFAULT_SERVER_FIXTURES_MONGO_IMAGE = 'mongo:3.6'
+DEFAULT_SERVER_FIXTURES_MONGO_PROFILE = 'default'
+DEFAULT_SERVER_FIXTURES_MONGO_MAX_POOL_SIZE = None
 DEFAULT_SERVER_FIXTURES_PG_CONFIG = 'pg_config'
 DEFAULT_SERVER_FIXTURES_REDIS = 'redis-server'
 DEFAULT_SERVER_FIXTURES_REDIS_IMAGE = 'redis:5.0.2-alpine'
+DEFAULT_SERVER_FIXTURES_REDIS_DATABASES = 16
 DEFAULT_SERVER_FIXTURES_HTTPD = 'apache2'
 DEFAULT_SERVER_FIXTURES_HTTPD_IMAGE = 'httpd:2.4.37'
 DEFAULT_SERVER_FIXTURES_HTTPD_MODULES = '/usr/lib/apache2/modules'
@@ -67,7 +105,23 @@ CONFIG = FixtureConfig(
     server_class=os.getenv('SERVER_FIXTURES_SERVER_CLASS', DEFAULT_SERVER_FIXTURES_SERVER_CLASS),
     k8s_namespace=os.getenv('SERVER_FIXTURES_K8S_NAMESPACE', DEFAULT_SERVER_FIXTURES_K8S_NAMESPACE),
     k8s_local_test=os.getenv('SERVER_FIXTURES_K8S_LOCAL_TEST', DEFAULT_SERVER_FIXTURES_K8S_LOCAL_TEST),
+    k8s_pool_size=os.getenv('SERVER_FIXTURES_K8S_POOL_SIZE', DEFAULT_SERVER_FIXTURES_K8S_POOL_SIZE),
     session_id=os.getenv('SERVER_FIXTURES_SESSION_ID', DEFAULT_SERVER_FIXTURES_SESSION_ID),
+    server_pool_size=int(os.getenv('SERVER_FIXTURES_POOL_SIZE', DEFAULT_SERVER_FIXTURES_POOL_SIZE)),
+    port_range=os.getenv('SERVER_FIXTURES_PORT_RANGE', DEFAULT_SERVER_FIXTURES_PORT_RANGE),
+    xdist_partition=os.getenv('SERVER_FIXTURES_XDIST_PARTITION',
+                              DEFAULT_SERVER_FIXTURES_XDIST_PARTITION) in (True, '1', 'True', 'true'),
+    trace_file=os.getenv('SERVER_FIXTURES_TRACE', DEFAULT_SERVER_FIXTURES_TRACE),
+    log_dir=os.getenv('SERVER_FIXTURES_LOG_DIR', DEFAULT_SERVER_FIXTURES_LOG_DIR),
+    log_lines=int(os.getenv('SERVER_FIXTURES_LOG_LINES', DEFAULT_SERVER_FIXTURES_LOG_LINES)),
+    docker_reuse=os.getenv('SERVER_FIXTURES_DOCKER_REUSE', DEFAULT_SERVER_FIXTURES_DOCKER_REUSE),
+    docker_reuse_ttl=int(os.getenv('SERVER_FIXTURES_DOCKER_REUSE_TTL', DEFAULT_SERVER_FIXTURES_DOCKER_REUSE_TTL)),
+    reap_orphans=os.getenv('SERVER_FIXTURES_REAP_ORPHANS',
+                           DEFAULT_SERVER_FIXTURES_REAP_ORPHANS) in (True, '1', 'True', 'true'),
+    storage=os.getenv('SERVER_FIXTURES_STORAGE', DEFAULT_SERVER_FIXTURES_STORAGE),
+    snapshots=os.getenv('SERVER_FIXTURES_SNAPSHOTS',
+                        DEFAULT_SERVER_FIXTURES_SNAPSHOTS) in (True, '1', 'True', 'true'),
+    snapshot_dir=os.getenv('SERVER_FIXTURES_SNAPSHOT_DIR', DEFAULT_SERVER_FIXTURES_SNAPSHOT_DIR),
     java_executable=os.getenv('SERVER_FIXTURES_JAVA', DEFAULT_SERVER_FIXTURES_JAVA),
     jenkins_war=os.getenv('SERVER_FIXTURES_JENKINS_WAR', DEFAULT_SERVER_FIXTURES_JENKINS_WAR),
     jenkins_image=os.getenv('SERVER_FIXTURES_JENKINS_IMAGE', DEFAULT_SERVER_FIXTURES_JENKINS_IMAGE),
@@ -75,9 +129,12 @@ CONFIG = FixtureConfig(
     minio_image=os.getenv('SERVER_FIXTURES_MINIO_IMAGE', DEFAULT_SERVER_FIXTURES_MINIO_IMAGE),
     mongo_bin=os.getenv('SERVER_FIXTURES_MONGO_BIN', DEFAULT_SERVER_FIXTURES_MONGO_BIN),
     mongo_image=os.getenv('SERVER_FIXTURES_MONGO_IMAGE', DEFAULT_SERVER_FIXTURES_MONGO_IMAGE),
+    mongo_profile=os.getenv('SERVER_FIXTURES_MONGO_PROFILE', DEFAULT_SERVER_FIXTURES_MONGO_PROFILE),
+    mongo_max_pool_size=os.getenv('SERVER_FIXTURES_MONGO_MAX_POOL_SIZE', DEFAULT_SERVER_FIXTURES_MONGO_MAX_POOL_SIZE),
     pg_config_executable=os.getenv('SERVER_FIXTURES_PG_CONFIG', DEFAULT_SERVER_FIXTURES_PG_CONFIG),
     redis_executable=os.getenv('SERVER_FIXTURES_REDIS', DEFAULT_SERVER_FIXTURES_REDIS),
     redis_image=os.getenv('SERVER_FIXTURES_REDIS_IMAGE', DEFAULT_SERVER_FIXTURES_REDIS_IMAGE),
+    redis_databases=int(os.getenv('SERVER_FIXTURES_REDIS_DATABASES', DEFAULT_SERVER_FIXTURES_REDIS_DATABASES)),
     httpd_executable=os.getenv('SERVER_FIXTURES_HTTPD', DEFAULT_SERVER_FIXTURES_HTTPD),
     httpd_modules=os.getenv('SERVER_FIXTURES_HTTPD_MODULES', DEFAULT_SERVER_FIXTURES_HTTPD_MODULES),
     httpd_image=os.getenv('SERVER_FIXTURES_HTTPD_IMAGE', DEFAULT_SERVER_FIXTURES_HTTPD_IMAGE),
@@ -0,0 +1,60 @@
+""" Runs clean-up work, such as server teardown, off the critical path of the tests.
+"""
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+log = logging.getLogger(__name__)
+
+MAX_WORKERS = 8
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _log_errors(future):
+    with _lock:
+        _pending.discard(future)
+    if future.exception() is not None:
+        log.warning("Error in background task: %s" % future.exception())
+
+
+def run_in_background(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) in a shared pool of worker threads.
+    Errors are logged rather than raised. Use `join_background` to wait for completion.
+
+    Returns
+    -------
+    `concurrent.futures.Future` for the task
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='server-fixtures-background')
+        future = _executor.submit(fn, *args, **kwargs)
+        _pending.add(future)
+    future.add_done_callback(_log_errors)
+    return future
+
+
+def join_background(timeout=None):
+    """
+    Wait for all background tasks submitted so far to finish.
+
+    Returns
+    -------
+    True if they all finished within `timeout` seconds.
+    """
+    with _lock:
+        pending = list(_pending)
+    if not pending:
+        return True
+    log.debug("Waiting for %d background tasks" % len(pending))
+    _, not_done = wait(pending, timeout=timeout)
+    return not not_done
+
+
+atexit.register(join_background)
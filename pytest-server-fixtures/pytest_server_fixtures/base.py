@@ -1,6 +1,7 @@
 """ Base classes for all server fixtures.
 """
 import hashlib
+import inspect
 import os
 import signal
 import socket
@@ -9,13 +10,19 @@ import sys
 import threading
 import time
 import traceback
-from datetime import datetime
 import logging
 import random
-import errno
+import warnings
 
 from pytest_server_fixtures import CONFIG
 from pytest_shutil.workspace import Workspace
+from . import readiness
+from .logmux import MUX, ServerLog, create_server_log
+from .ports import allocate_port, get_xdist_worker, release_port, reserve_port
+from .process import ListeningPidFinder, signal_process_group, wait_for_exit
+from .readiness import LogLineWatcher, ReadinessMonitor
+from .reaper import server_env
+from .trace import span
 
 log = logging.getLogger(__name__)
 
@@ -33,6 +40,7 @@ class CannotFindServer(Exception):
 def get_ephemeral_host(cached=True, regen_cache=False):
     """
     Returns a random IP in the 127.0.0.0/24. This decreases the likelihood of races for ports by 255^3.
+    If CONFIG.xdist_partition is set, each pytest-xdist worker gets its own 127.N.0.0/16 subnet.
 
     Parameters
     ----------
@@ -53,7 +61,12 @@ def get_ephemeral_host(cached=True, regen_cache=False):
     if OSX:
         res = '127.0.0.1'
     else:
-        res = '127.{}.{}.{}'.format(random.randrange(1, 255),
+        worker = get_xdist_worker()
+        if CONFIG.xdist_partition and worker:
+            subnet = worker[0] % 254 + 1
+        else:
+            subnet = random.randrange(1, 255)
+        res = '127.{}.{}.{}'.format(subnet,
                                     random.randrange(1, 255),
                                     random.randrange(2, 255),)
     if regen_cache or not _SESSION_HOST:
@@ -63,7 +76,8 @@ def get_ephemeral_host(cached=True, regen_cache=False):
 
 def get_ephemeral_port(port=0, host=None, cache_host=True):
     """
-    Get an ephemeral socket at random from the kernel.
+    Get a free port, that isn't reserved by another test process. The port isn't reserved
+    for the caller, see `pytest_server_fixtures.ports.allocate_port` for that.
 
     Parameters
     ----------
@@ -81,26 +95,27 @@ def get_ephemeral_port(port=0, host=None, cache_host=True):
     if host is None:
         host = get_ephemeral_host(cached=cache_host)
 
-    # Dynamic port-range:
-    # * cat /proc/sys/net/ipv4/ip_local_port_range
-    # 32768   61000
-    if port == 0:
-        port = random.randrange(1024, 32768)
+    reservation = reserve_port(host, port)
+    reservation.release()
+    return reservation.port
 
-    while True:
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind((host, port))
-            port = s.getsockname()[1]
-            s.close()
-            return port
-        except socket.error:
-            port = random.randrange(1024, 32768)
+
+def _accepts_server_log(serverclass):
+    # Custom serverclasses written before server logs existed don't take one
+    try:
+        params = inspect.signature(serverclass).parameters
+    except (TypeError, ValueError):
+        return False
+    return 'server_log' in params or any(p.kind == p.VAR_KEYWORD for p in params.values())
 
 
 class ProcessReader(threading.Thread):
+    """ Deprecated: server output is now read by `pytest_server_fixtures.logmux`.
+    """
+
     def __init__(self, process, stream, stderr):
+        warnings.warn("ProcessReader is deprecated, server output is read by pytest_server_fixtures.logmux",
+                      DeprecationWarning, stacklevel=2)
         self.stderr = stderr
         self.process = process
         self.stream = stream
@@ -123,7 +138,7 @@ class ProcessReader(threading.Thread):
 class ServerThread(threading.Thread):
     """ Class for running the server in a thread """
 
-    def __init__(self, hostname, port, run_cmd, run_stdin=None, env=None, cwd=None):
+    def __init__(self, hostname, port, run_cmd, run_stdin=None, env=None, cwd=None, server_log=None):
         threading.Thread.__init__(self)
         self.hostname = hostname
         self.port = port
@@ -131,19 +146,24 @@ class ServerThread(threading.Thread):
         self.run_stdin = run_stdin
         self.daemon = True
         self.exit = False
-        self.env = env or dict(os.environ)
+        # Tagged with our session id, so the server can be cleaned up if this session is killed
+        self.env = server_env(env or os.environ)
         self.cwd = cwd or os.getcwd()
 
+        # Run in a new session, so the server and its children form a process group we can kill together
         if 'DEBUG' in os.environ:
             self.p = subprocess.Popen(self.run_cmd, env=self.env, cwd=self.cwd,
-                                      stdin=subprocess.PIPE if run_stdin else None)
+                                      stdin=subprocess.PIPE if run_stdin else None,
+                                      start_new_session=True)
         else:
             self.p = subprocess.Popen(self.run_cmd, env=self.env, cwd=self.cwd,
                                       stdin=subprocess.PIPE if run_stdin else None,
                                       stdout=subprocess.PIPE,
-                                      stderr=subprocess.PIPE)
-            ProcessReader(self.p, self.p.stdout, False).start()
-            ProcessReader(self.p, self.p.stderr, True).start()
+                                      stderr=subprocess.PIPE,
+                                      start_new_session=True)
+            if server_log is None:
+                server_log = ServerLog('%s:%s' % (hostname, port))
+            MUX.add(server_log, self.p.stdout, self.p.stderr)
 
     def run(self):
         log.debug("Running server: %s" % ' '.join(str(c) for c in self.run_cmd))
@@ -171,6 +191,9 @@ class TestServer(Workspace):
         installed during tests_require
     cache_host: `bool`
         Use cached ephemeral hostnames
+    storage: `str`
+        Storage backend for the workspace, eg. ``memory``. Defaults to ``CONFIG.storage``,
+        see `pytest_shutil.workspace.get_storage_dir`
     """
     server = None
     serverclass = ServerThread  # Child classes can set this to a different serverthread class
@@ -179,11 +202,19 @@ class TestServer(Workspace):
     port_seed = 65535  # Used to seed port numbers if not random_port
     kill_signal = signal.SIGTERM
 
-    # Number of seconds to wait between kill retries. Increase if the service takes a while to die
+    # Maximum number of seconds to wait for the server to die before retrying the kill.
+    # Increase if the service takes a while to die
     kill_retry_delay = 1
 
-    def __init__(self, workspace=None, delete=None, preserve_sys_path=False, cache_host=True, **kwargs):
-        super(TestServer, self).__init__(workspace=workspace, delete=delete)
+    # Regex matching the line the server prints once it is ready, used to wake up wait_for_go
+    ready_log_pattern = None
+    _log_watcher = None
+    _server_log = None
+    _pid_finder = None
+    _torn_down = False
+
+    def __init__(self, workspace=None, delete=None, preserve_sys_path=False, cache_host=True, storage=None, **kwargs):
+        super(TestServer, self).__init__(workspace=workspace, delete=delete, storage=storage or CONFIG.storage)
         self.hostname = kwargs.get('hostname') or get_ephemeral_host(cached=cache_host)
         self.port = kwargs.get('port') or self.get_port()
         # We don't know if the server is alive or dead at this point, assume alive
@@ -203,9 +234,11 @@ class TestServer(Workspace):
     def start(self):
         self.kill()
         try:
-            self.pre_setup()
+            with span('pre_setup', server=self.__class__.__name__):
+                self.pre_setup()
             self.start_server(env=self.env)
-            self.post_setup()
+            with span('post_setup', server=self.__class__.__name__):
+                self.post_setup()
             self.save()
         except:
             self.teardown()
@@ -218,7 +251,7 @@ class TestServer(Workspace):
         if not self.random_port:
             return self.port_seed - int(hashlib.sha1((os.environ['USER']
                                                       + self.__class__.__name__).encode('utf-8')).hexdigest()[:3], 16)
-        return get_ephemeral_port(host=self.hostname)
+        return allocate_port(self.hostname)
 
     def pre_setup(self):
         """ This should execute any setup required before starting the server
@@ -253,9 +286,8 @@ class TestServer(Workspace):
         This is called to wait until the server has started running.
 
         Uses a binary exponential backoff algorithm to set wait interval
-        between retries. This finds the happy medium between quick starting
-        servers (e.g. in-memory DBs) while remaining useful for the slower
-        starting servers (e.g. web servers).
+        between retries, cut short whenever the server's port opens, it prints
+        `ready_log_pattern` or its process dies (see `pytest_server_fixtures.readiness`).
 
         Parameters
         ----------
@@ -269,59 +301,57 @@ class TestServer(Workspace):
             backoff multiplier
 
         """
-        if start_interval <= 0.0:
-            raise ValueError('start interval must be positive!')
-
-        interval = start_interval
-
-        retry_count = retry_limit
-        start_time = datetime.now()
-        while retry_count > 0:
-            for _ in range(retries_per_interval):
-                log.debug('sleeping for %s before retrying (%d of %d)'
-                      % (interval, ((retry_limit + 1) - retry_count), retry_limit))
-                if self.check_server_up():
-                    log.debug('waited %s for server to start successfully'
-                          % str(datetime.now() - start_time))
-                    return
-
-                time.sleep(interval)
-                retry_count -= 1
-            interval *= base
-
-        raise ValueError("Server failed to start up after waiting %s. Giving up!"
-                         % str(datetime.now() - start_time))
+        monitor = ReadinessMonitor(hostname=self.hostname,
+                                   port=self.port,
+                                   process=getattr(self.server, 'p', None),
+                                   log_watcher=self._log_watcher)
+        try:
+            with span('wait_for_go', server=self.__class__.__name__):
+                readiness.wait_for_go(self.check_server_up, monitor, start_interval=start_interval,
+                                      retries_per_interval=retries_per_interval, retry_limit=retry_limit,
+                                      base=base)
+        finally:
+            monitor.close()
+            if self._log_watcher:
+                self._log_watcher.close()
+                self._log_watcher = None
 
     def start_server(self, env=None):
         """ Start the server instance.
         """
         log.debug("Starting Server on host %s port %s" % (self.hostname, self.port))
-        self.server = self.serverclass(self.hostname, self.port, self.run_cmd, self.run_stdin,
-                                       env=getattr(self, "env", env), cwd=self.cwd)
-        self.server.start()
-        self.wait_for_go()
+        if self.ready_log_pattern:
+            self._log_watcher = LogLineWatcher(self.ready_log_pattern)
+        if self._server_log:
+            self._server_log.close()
+        self._server_log = create_server_log('%s-%s-%s' % (self.__class__.__name__, self.hostname, self.port),
+                                             workspace=self.workspace,
+                                             listeners=[self._log_watcher] if self._log_watcher else None)
+        with span('launch', server=self.__class__.__name__):
+            kwargs = dict(env=getattr(self, "env", env), cwd=self.cwd)
+            if _accepts_server_log(self.serverclass):
+                kwargs['server_log'] = self._server_log
+            self.server = self.serverclass(self.hostname, self.port, self.run_cmd, self.run_stdin, **kwargs)
+            self.server.start()
+        try:
+            self.wait_for_go()
+        finally:
+            # The server has bound to its port by now, or failed to
+            release_port(self.port)
         log.debug("Server now awake")
         self.dead = False
 
 
     def _signal(self, pid, signal):
-        try:
-            log.debug(f'Signalling pid {pid} with signal {signal}')
-            os.kill(pid, signal)
-        except OSError as oe:
-            if oe.errno == errno.ESRCH:  # Process doesn't appear to exist.
-                log.error("For some reason couldn't find PID {} to kill.".format(pid))
-            else:
-                raise
+        # Servers run in their own process group, signal that to catch any children too
+        if not signal_process_group(pid, signal):
+            log.error("For some reason couldn't find PID {} to kill.".format(pid))
 
     def _kill_with(self, pid, sig, retries=5):
         for _ in range(retries):
             self._signal(pid, sig)
-            try:
-                os.kill(pid, 0)
-            except OSError:
+            if wait_for_exit(pid, self.kill_retry_delay):
                 return True
-            time.sleep(self.kill_retry_delay)
         return False
 
     def kill_by_pid(self, pid, retries=5):
@@ -331,16 +361,19 @@ class TestServer(Workspace):
             return
         if not self._kill_with(pid, self.kill_signal, retries):
             log.error(f"Server not dead after {retries} retries, trying with SIGKILL")
-            if not self._kill_with(signal.SIGKILL, retries):
+            if not self._kill_with(pid, signal.SIGKILL, retries):
                 raise ServerNotDead(f"Server not dead after {retries} retries")
+        self.dead = True
 
     def _find_pids_by_port(self):
         if OSX:
             netstat_cmd = "lsof -n -i:{} | grep LISTEN | awk '{{ print $2 }}'".format(self.port)
+            pids = [p.strip() for p in self.run(netstat_cmd, capture=True, cd='/').split('\n') if p.strip()]
         else:
-            netstat_cmd = ("netstat -anp 2>/dev/null | grep %s:%s | grep LISTEN | "
-                           "awk '{ print $7 }' | cut -d'/' -f1" % (socket.gethostbyname(self.hostname), self.port))
-        pids = [p.strip() for p in self.run(netstat_cmd, capture=True, cd='/').split('\n') if p.strip()]
+            # The finder is reset for each kill cycle, so it can cache what it learns between retries
+            if self._pid_finder is None:
+                self._pid_finder = ListeningPidFinder(socket.gethostbyname(self.hostname), self.port)
+            pids = self._pid_finder.find()
         if pids:
             log.debug(f"Found pids: {pids}")
         else:
@@ -349,12 +382,14 @@ class TestServer(Workspace):
 
     def _find_and_kill_by_port(self, retries, signal):
         log.debug("Killing server running at {}:{} using signal {}".format(self.hostname, self.port, signal))
+        self._pid_finder = None
         pids = self._find_pids_by_port()
         if not pids:
             raise CannotFindServer()
         for _ in range(retries):
             if not pids:
                 return
+            signalled = []
             for pid in pids:
                 try:
                     pid = int(pid)
@@ -362,7 +397,10 @@ class TestServer(Workspace):
                     log.error("Can't determine port, process shutting down or owned by someone else")
                 else:
                     self._signal(pid, signal)
-            time.sleep(self.kill_retry_delay)
+                    signalled.append(pid)
+            deadline = time.monotonic() + self.kill_retry_delay
+            for pid in signalled:
+                wait_for_exit(pid, deadline - time.monotonic())
             pids = self._find_pids_by_port()
         else:
             raise ServerNotDead("Server not dead after %d retries" % retries)
@@ -384,19 +422,29 @@ class TestServer(Workspace):
             self._find_and_kill_by_port(retries, self.kill_signal)
         except CannotFindServer:
             log.debug(f"Server can't be found listening on port {self.port}")
-            return
         except ServerNotDead:
             log.error("Server not dead after %d retries, trying with SIGKILL" % retries)
             try:
                 self._find_and_kill_by_port(retries, signal.SIGKILL)
             except ServerNotDead:
                 log.error("Server still not dead, giving up")
+                return
+        self.dead = True
 
     def teardown(self):
         """ Called when tearing down this instance, eg in a context manager
         """
-        self.kill()
-        super(TestServer, self).teardown()
+        # Nothing left to do, eg. when __del__ runs after __exit__, maybe at interpreter exit
+        if self.dead and self._torn_down:
+            return
+        with span('kill', server=self.__class__.__name__):
+            self.kill()
+        release_port(self.port)
+        if self._server_log:
+            self._server_log.close()
+        with span('workspace_rmtree', server=self.__class__.__name__):
+            super(TestServer, self).teardown()
+        self._torn_down = True
 
     def save(self):
         """ Called to save any state that can be then restored using self.restore
@@ -1,13 +1,16 @@
 import os
 import hashlib
 import logging
-import time
-from datetime import datetime
 
 from pytest_server_fixtures import CONFIG
 from pytest_shutil.workspace import Workspace
-from .base import get_ephemeral_host, get_ephemeral_port
+from . import readiness
+from .base import get_ephemeral_host
+from .logmux import create_server_log
+from .ports import allocate_port, release_port
+from .readiness import LogLineWatcher, ReadinessMonitor
 from .serverclass import create_server
+from .trace import span
 
 log = logging.getLogger(__name__)
 
@@ -22,8 +25,18 @@ class TestServerV2(Workspace):
     random_port = True
     random_hostname = True
     port_seed = 65535
-
-    def __init__(self, cwd=None, workspace=None, delete=None, server_class=CONFIG.server_class):
+    # Regex matching the line the server prints once it is ready, used to wake up _wait_for_go.
+    # Only used when SERVER_FIXTURES_SERVER_CLASS is 'thread'.
+    ready_log_pattern = None
+    # Pod shared with other servers when using the kubernetes server class, see `serverclass.kubernetes.share_pod`
+    kubernetes_pod = None
+    # So teardown works on a server whose constructor failed, eg. from Workspace.__del__
+    _server = None
+    _killed = False
+    _server_log = None
+    _reserved_port = None
+
+    def __init__(self, cwd=None, workspace=None, delete=None, server_class=CONFIG.server_class, storage=None):
         """
         Initialise a test server.
 
@@ -31,12 +44,17 @@ class TestServerV2(Workspace):
         @param workspace: where all files will be stored
         @param delete: whether to delete the workspace after teardown or not
         @param server_class: specify server class name (default from CONFIG.server_class)
+        @param storage: storage backend for the workspace, eg. 'memory' (default from CONFIG.storage),
+                        see `pytest_shutil.workspace.get_storage_dir`
         """
-        super(TestServerV2, self).__init__(workspace=workspace, delete=delete)
+        super(TestServerV2, self).__init__(workspace=workspace, delete=delete, storage=storage or CONFIG.storage)
         self._cwd = cwd or os.getcwd()
         self._server_class = server_class
         self._server = None
         self._killed = False
+        self._log_watcher = None
+        self._server_log = None
+        self._reserved_port = None
         self._listen_hostname = self._get_hostname()
 
     def start(self):
@@ -47,28 +65,52 @@ class TestServerV2(Workspace):
             raise TestServerAlreadyKilledException()
 
         try:
-            self._server = create_server(
-                server_class=CONFIG.server_class,
-                server_type=self.__class__.__name__,
-                cmd=self.cmd,
-                cmd_local=self.cmd_local,
-                get_args=self.get_args,
-                env=self.env,
-                image=self.image,
-                labels=self.labels,
-                workspace=self.workspace,
-                cwd=self._cwd,
-                listen_hostname=self._listen_hostname,
-            )
-
+            name = self.__class__.__name__
             if self._server_class == 'thread':
-                self.pre_setup()
+                if self.ready_log_pattern:
+                    self._log_watcher = LogLineWatcher(self.ready_log_pattern)
+                self._server_log = create_server_log(
+                    '%s-%s-%s' % (name, self._listen_hostname, self.port),
+                    workspace=self.workspace,
+                    listeners=[self._log_watcher] if self._log_watcher else None)
+
+            with span('create_server', server=name, server_class=self._server_class):
+                self._server = create_server(
+                    server_class=self._server_class,
+                    server_type=name,
+                    cmd=self.cmd,
+                    cmd_local=self.cmd_local,
+                    get_args=self.get_args,
+                    env=self.env,
+                    image=self.image,
+                    labels=self.labels,
+                    workspace=self.workspace,
+                    cwd=self._cwd,
+                    listen_hostname=self._listen_hostname,
+                    server_log=self._server_log,
+                    kubernetes_pod=self.kubernetes_pod,
+                )
 
-            self._server.launch()
-            self._wait_for_go()
+            if self._server_class == 'thread':
+                with span('pre_setup', server=name):
+                    self.pre_setup()
+
+            with span('launch', server=name, server_class=self._server_class):
+                self._server.launch()
+            try:
+                with span('wait_for_go', server=name):
+                    self._wait_for_go()
+            finally:
+                # The server has bound to its port by now, or failed to
+                self._release_port()
             log.debug("Server now awake")
 
-            self.post_setup()
+            if self._server.reused:
+                with span('reset', server=name):
+                    self.reset()
+
+            with span('post_setup', server=name):
+                self.post_setup()
         except OSError as err:
             log.warning("Error when starting the test server.")
             log.debug(err)
@@ -89,7 +131,8 @@ class TestServerV2(Workspace):
         # Prevent traceback printed when the server goes away as we kill it
         self._server.exit = True
 
-        self._server.teardown()
+        with span('kill', server=self.__class__.__name__, server_class=self._server_class):
+            self._server.teardown()
         self._server = None
         self._killed = True
 
@@ -97,7 +140,11 @@ class TestServerV2(Workspace):
         """ Called when tearing down this instance, eg in a context manager
         """
         self.kill()
-        super(TestServerV2, self).teardown()
+        self._release_port()
+        if self._server_log:
+            self._server_log.close()
+        with span('workspace_rmtree', server=self.__class__.__name__):
+            super(TestServerV2, self).teardown()
 
 
     def check_server_up(self):
@@ -192,14 +239,20 @@ class TestServerV2(Workspace):
         """
         pass
 
+    def reset(self):
+        """
+        Return a reused server to a clean state, eg. by deleting all its data.
+        Called instead of starting a new server when SERVER_FIXTURES_DOCKER_REUSE is set.
+        """
+        pass
+
     def _wait_for_go(self, start_interval=0.1, retries_per_interval=3, retry_limit=28, base=2.0):
         """
         This is called to wait until the server has started running.
 
         Uses a binary exponential backoff algorithm to set wait interval
-        between retries. This finds the happy medium between quick starting
-        servers (e.g. in-memory DBs) while remaining useful for the slower
-        starting servers (e.g. web servers).
+        between retries, cut short whenever the server's port opens, it prints
+        `ready_log_pattern` or its process dies (see `pytest_server_fixtures.readiness`).
 
         Parameters
         ----------
@@ -213,28 +266,18 @@ class TestServerV2(Workspace):
             backoff multiplier
 
         """
-        if start_interval <= 0.0:
-            raise ValueError('start interval must be positive!')
-
-        interval = start_interval
-
-        retry_count = retry_limit
-        start_time = datetime.now()
-        while retry_count > 0:
-            for _ in range(retries_per_interval):
-                log.debug('sleeping for %s before retrying (%d of %d)'
-                      % (interval, ((retry_limit + 1) - retry_count), retry_limit))
-                if self.check_server_up():
-                    log.debug('waited %s for server to start successfully'
-                          % str(datetime.now() - start_time))
-                    return
-
-                time.sleep(interval)
-                retry_count -= 1
-            interval *= base
-
-        raise ValueError("Server failed to start up after waiting %s. Giving up!"
-                         % str(datetime.now() - start_time))
+        monitor = ReadinessMonitor(hostname=self.hostname,
+                                   port=self.port,
+                                   process=self._server.process,
+                                   log_watcher=self._log_watcher)
+        try:
+            readiness.wait_for_go(self.check_server_up, monitor, start_interval=start_interval,
+                                  retries_per_interval=retries_per_interval, retry_limit=retry_limit, base=base)
+        finally:
+            monitor.close()
+            if self._log_watcher:
+                self._log_watcher.close()
+                self._log_watcher = None
 
     def _get_hostname(self):
         """
@@ -253,12 +296,21 @@ class TestServerV2(Workspace):
         Get a random or pseudo-random port based on config.
         """
         if self._server_class == 'thread':
-            return get_ephemeral_port(host=self._listen_hostname) \
-                    if self.random_port \
-                    else self._get_pseudo_random_port()
+            if not self.random_port:
+                return self._get_pseudo_random_port()
+            self._reserved_port = allocate_port(self._listen_hostname)
+            return self._reserved_port
 
         return default_port
 
+    def _release_port(self):
+        """
+        Release the reservation on our random port, once the server has bound to it.
+        """
+        if self._reserved_port:
+            release_port(self._reserved_port)
+            self._reserved_port = None
+
     def _get_pseudo_random_port(self):
         """
         Get a pseudo random port based on port_seed,
@@ -0,0 +1,182 @@
+""" Start and stop several servers concurrently.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+
+class ServerGroupError(Exception):
+    """Thrown when members of a server group fail to start or tear down.
+
+    The `failures` attribute maps the names of the failed members to their exceptions.
+    """
+
+    def __init__(self, action, failures):
+        self.failures = failures
+        super(ServerGroupError, self).__init__("Failed to %s %s" % (action, ", ".join(
+            "%s (%s: %s)" % (name, type(e).__name__, e) for name, e in failures.items())))
+
+
+class ServerTopologyError(Exception):
+    """Thrown when the servers of a `ServerTopology` fail to connect together."""
+    pass
+
+
+class ServerGroup(object):
+    """
+    A group of servers that are started and torn down concurrently, so the total start-up
+    time is that of the slowest server rather than the sum of all of them.
+
+    Works with any server with `start` and `teardown` methods, ie. `TestServer` and `TestServerV2`.
+    If any member fails to start, the whole group is torn down again and `ServerGroupError`
+    is raised, naming the members that failed.
+
+    Parameters
+    ----------
+    servers:
+        Servers, named by their class name and position
+    named_servers:
+        Servers named by keyword
+
+    Example
+    -------
+        with ServerGroup(redis=RedisTestServer(), mongo=MongoTestServer()) as group:
+            group.start()
+            group['redis'].api.ping()
+
+    Or from a coroutine, using `astart` and `ateardown`:
+
+        async with ServerGroup(redis=RedisTestServer(), mongo=MongoTestServer()) as group:
+            await group.astart()
+            ...
+    """
+
+    def __init__(self, *servers, **named_servers):
+        self.servers = dict(("%s-%d" % (type(s).__name__, i), s) for i, s in enumerate(servers))
+        self.servers.update(named_servers)
+
+    def __getitem__(self, name):
+        return self.servers[name]
+
+    def __iter__(self):
+        return iter(self.servers.values())
+
+    def __len__(self):
+        return len(self.servers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, errtype, value, traceback):
+        self.teardown()
+
+    async def __aenter__(self):
+        # Like __enter__, this doesn't start the servers
+        return self
+
+    async def __aexit__(self, errtype, value, traceback):
+        await self.ateardown()
+
+    def _run_all(self, action):
+        """ Call `action` on all the servers in parallel, returning a dict of failures.
+        """
+        if not self.servers:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(self.servers), thread_name_prefix='server-group') as executor:
+            futures = dict((name, executor.submit(getattr(server, action))) for name, server in self.servers.items())
+        return dict((name, f.exception()) for name, f in futures.items() if f.exception() is not None)
+
+    async def _arun_all(self, action):
+        loop = asyncio.get_event_loop()
+        names = list(self.servers)
+        results = await asyncio.gather(*[loop.run_in_executor(None, getattr(self.servers[name], action))
+                                         for name in names],
+                                       return_exceptions=True)
+        return dict((name, e) for name, e in zip(names, results) if isinstance(e, BaseException))
+
+    def start(self):
+        """
+        Start all the servers, and wait for them to be ready.
+        """
+        log.debug("Starting servers: %s" % ", ".join(self.servers))
+        failures = self._run_all('start')
+        if failures:
+            # Members that failed might have left processes or workspaces behind, so tear them all down
+            try:
+                self.teardown()
+            except ServerGroupError as e:
+                log.warning(str(e))
+            raise ServerGroupError('start', failures)
+
+    async def astart(self):
+        """
+        As `start`, but runs the blocking calls in the event loop's executor.
+        """
+        log.debug("Starting servers: %s" % ", ".join(self.servers))
+        failures = await self._arun_all('start')
+        if failures:
+            try:
+                await self.ateardown()
+            except ServerGroupError as e:
+                log.warning(str(e))
+            raise ServerGroupError('start', failures)
+
+    def teardown(self):
+        """
+        Tear down all the servers.
+        """
+        failures = self._run_all('teardown')
+        if failures:
+            raise ServerGroupError('tear down', failures)
+
+    async def ateardown(self):
+        """
+        As `teardown`, but runs the blocking calls in the event loop's executor.
+        """
+        failures = await self._arun_all('teardown')
+        if failures:
+            raise ServerGroupError('tear down', failures)
+
+
+class ServerTopology(ServerGroup):
+    """
+    A group of servers that are started concurrently, then connected together by `connect`,
+    eg. into a cluster. If they fail to connect, the whole group is torn down again.
+    """
+    # Seconds to wait for the servers to connect, once they have started
+    topology_timeout = 60
+
+    def start(self):
+        super(ServerTopology, self).start()
+        try:
+            self.connect()
+        except Exception:
+            self.teardown()
+            raise
+
+    async def astart(self):
+        await super(ServerTopology, self).astart()
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self.connect)
+        except Exception:
+            await self.ateardown()
+            raise
+
+    def connect(self):
+        """
+        Connect the running servers together, and wait for them to be ready.
+        """
+        raise NotImplementedError("Concrete class should implement this")
+
+    def wait_until(self, predicate, description, interval=0.05):
+        """
+        Wait for `predicate` to return True, raising `ServerTopologyError` after `topology_timeout` seconds.
+        """
+        deadline = time.monotonic() + self.topology_timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                raise ServerTopologyError("Timed out waiting for %s" % description)
+            time.sleep(interval)
@@ -6,7 +6,6 @@ import time
 import sys
 
 import pytest
-import requests
 from contextlib import contextmanager
 
 from pytest_shutil.env import unset_env
@@ -51,6 +50,7 @@ class HTTPTestServer(TestServer):
     def check_server_up(self):
         """ Check the server is up by polling self.uri
         """
+        import requests
         try:
             log.debug('accessing URL: {0}'.format(self.uri))
             with self.handle_proxy():
@@ -75,6 +75,7 @@ class HTTPTestServer(TestServer):
             This function will retry up to `attempts` times on connection errors, to handle 
             the server still waking up. Defaults to 25.
         """
+        import requests
         e = None
         for i in range(attempts):
             try:
@@ -101,6 +102,7 @@ class HTTPTestServer(TestServer):
         headers: `dict`
             Optional HTTP headers.
         """
+        import requests
         e = None
         for i in range(attempts):
             try:
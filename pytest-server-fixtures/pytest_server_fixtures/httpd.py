@@ -6,10 +6,11 @@ import logging
 import pytest
 from pathlib import Path
 
-from pytest_fixture_config import yield_requires_config
+from pytest_fixture_config import requires_config, yield_requires_config
 from pytest_server_fixtures import CONFIG
 
 from .http import HTTPTestServer
+from .pool import server_pool
 
 log = logging.getLogger(__name__)
 
@@ -18,9 +19,18 @@ def is_rhel():
     """"Check if OS is RHEL/Centos"""
     return 'el' in platform.uname()[2]
 
+@pytest.fixture(scope='session')
+@requires_config(CONFIG, ['httpd_executable', 'httpd_modules'])
+def httpd_server_pool(request):
+    """ Session-scoped pool of pre-started httpd servers for the httpd_server fixture.
+        This is None unless SERVER_FIXTURES_POOL_SIZE is set.
+    """
+    return server_pool(request, HTTPDServer)
+
+
 @pytest.yield_fixture(scope='function')
 @yield_requires_config(CONFIG, ['httpd_executable', 'httpd_modules'])
-def httpd_server():
+def httpd_server(httpd_server_pool):
     """ Function-scoped httpd server in a local thread.
 
         Methods
@@ -30,6 +40,14 @@ def httpd_server():
         post()  : Post payload to url relative to the server root.
         ..        Parse as json and retry failures by default.
     """
+    if httpd_server_pool is not None:
+        test_server = httpd_server_pool.acquire()
+        try:
+            yield test_server
+        finally:
+            httpd_server_pool.release(test_server)
+        return
+
     test_server = HTTPDServer()
     test_server.start()
     yield test_server
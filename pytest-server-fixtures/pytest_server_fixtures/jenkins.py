@@ -11,6 +11,8 @@ import pytest
 from pytest_server_fixtures import CONFIG
 from pytest_fixture_config import yield_requires_config
 
+from . import snapshot
+from .background import run_in_background
 from .http import HTTPTestServer
 
 
@@ -47,6 +49,8 @@ def jenkins_server_module():
 class JenkinsTestServer(HTTPTestServer):
     port_seed = 65533
     kill_retry_delay = 2
+    ready_log_pattern = r'Jenkins is fully up and running'
+    _webroot_restored = False
 
     def __init__(self, **kwargs):
         global jenkins
@@ -74,9 +78,25 @@ class JenkinsTestServer(HTTPTestServer):
                 '--httpPort=%s' % self.port,
                 '--httpListenAddress=%s' % self.hostname,
                 '--ajp13Port=-1',
-                '--webroot={0}'.format(self.workspace / 'run' / 'war'),
+                '--webroot={0}'.format(self.webroot),
                 ]
 
+    @property
+    def webroot(self):
+        return self.workspace / 'run' / 'war'
+
+    def _webroot_key(self):
+        return snapshot.get_key(snapshot.file_version(CONFIG.jenkins_war))
+
+    def pre_setup(self):
+        # Jenkins unpacks its war into the webroot on start-up, unless it is already unpacked
+        self._webroot_restored = snapshot.restore('jenkins-webroot', self._webroot_key(), self.webroot)
+
+    def post_setup(self):
+        if not self._webroot_restored:
+            # The webroot doesn't change once Jenkins is up, save it without holding up the tests
+            run_in_background(snapshot.save, 'jenkins-webroot', self._webroot_key(), self.webroot)
+
     def load_plugins(self, plugins_repo, plugins=None):
         """plugins_repo is the place from which the plugins can be copied to this jenskins instance
            is plugins is None, all plugins will be copied, else is should be a list of the plugin names
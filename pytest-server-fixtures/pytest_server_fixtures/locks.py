@@ -0,0 +1,112 @@
+""" Locks shared by all the test processes of a user on this host.
+
+A lock is held by taking an flock on a lock file. The kernel drops the lock
+if the process dies, so crashed sessions never leak locks.
+"""
+import errno
+import getpass
+import logging
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, locks always succeed
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+
+def get_lock_dir(kind):
+    """ Directory holding the lock files of one kind, eg. 'ports'.
+    """
+    # Windows has no uids
+    user = os.getuid() if hasattr(os, 'getuid') else getpass.getuser()
+    return os.path.join(tempfile.gettempdir(), 'pytest-server-fixtures-%s-%s' % (kind, user))
+
+
+class LockUnavailable(Exception):
+    """ Thrown by `try_lock` with `strict` set when the lock file can't be created,
+        eg. because the temp dir is read-only or full.
+    """
+    pass
+
+
+class FileLock(object):
+    """ A lock, held until released or this process exits.
+    """
+
+    def __init__(self, path, fd=None):
+        self.path = path
+        self._fd = fd
+
+    def touch(self):
+        """ Update the lock file's modification time, eg. to record when a resource was last used.
+        """
+        if self._fd is not None:
+            os.utime(self._fd)
+
+    def release(self, unlink=False):
+        """ Release the lock. With `unlink`, the lock file is removed too, eg. once the resource
+            is no longer of interest. It is removed while still locked, and `try_lock` checks it
+            locked the file that is still at the path, so nobody can lock a file that's going away.
+        """
+        if self._fd is not None:
+            if unlink:
+                try:
+                    os.unlink(self.path)
+                except OSError:
+                    pass
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def try_lock(kind, key, shared=False, strict=False):
+    """
+    Try to take the lock on `key` without blocking.
+
+    Parameters
+    ----------
+    kind: `str`
+        Kind of resource being locked, eg. 'ports'
+    key: `str`
+        Name of the resource, used as the lock file name
+    shared: `bool`
+        Take a shared lock, which other shared lockers can hold at the same time
+    strict: `bool`
+        Raise `LockUnavailable` if the lock file can't be created, rather than returning None
+
+    Returns
+    -------
+    `FileLock`, or None if another process holds a conflicting lock
+    """
+    lock_dir = get_lock_dir(kind)
+    path = os.path.join(lock_dir, '%s.lock' % key)
+    if fcntl is None:
+        return FileLock(path)
+    while True:
+        try:
+            os.makedirs(lock_dir, exist_ok=True)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError as e:
+            if strict:
+                raise LockUnavailable("Can't open lock file %s: %s" % (path, e))
+            log.debug("Can't open lock file %s: %s" % (path, e))
+            return None
+        try:
+            fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        except OSError as e:
+            os.close(fd)
+            if e.errno not in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                raise
+            return None
+        try:
+            if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                return FileLock(path, fd)
+        except OSError:
+            pass
+        # The holder unlinked the file as we locked it, try again with a new one
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
@@ -0,0 +1,246 @@
+""" Reads the output of every server started in this session from a single thread.
+
+Each server's stdout and stderr pipes are registered with one selector, so the cost of
+reading server output doesn't grow with the number of servers. Lines go to a per-server
+log file, a bounded ring buffer of recent lines (attached to failing test reports by
+`pytest_server_fixtures.plugin`), and any listeners such as `readiness.LogLineWatcher`.
+"""
+import collections
+import logging
+import os
+import re
+import selectors
+import sys
+import threading
+
+from pytest_server_fixtures import CONFIG
+
+log = logging.getLogger(__name__)
+
+READ_SIZE = 65536
+
+
+class ServerLog(object):
+    """
+    Output of one server.
+
+    Parameters
+    ----------
+    name: `str`
+        Name shown in reports, eg. the server class and address
+    path: `str`
+        Log file to write the output to, or None to only keep the ring buffer
+    max_lines: `int`
+        Number of recent lines to keep in memory, defaults to CONFIG.log_lines
+    listeners: `list`
+        Callables called with each line of output
+    """
+
+    def __init__(self, name, path=None, max_lines=None, listeners=None):
+        self.name = name
+        self.path = path
+        self.listeners = list(listeners or [])
+        self.lines = collections.deque(maxlen=CONFIG.log_lines if max_lines is None else max_lines)
+        self.closed = False
+        self._file = None
+        self._lock = threading.Lock()
+        if path:
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def append(self, line, stderr=False):
+        """
+        Record a line of output, without its line ending.
+        """
+        if not line.strip():
+            return
+        for listener in self.listeners:
+            listener(line + '\n')
+        with self._lock:
+            if self.closed:
+                return
+            self.lines.append(line)
+            if self._file:
+                self._file.write(line + '\n')
+                self._file.flush()
+        log.debug(line)
+        if stderr and 'DEBUG' in os.environ:
+            sys.stderr.write(line + '\n')
+
+    def tail(self, n=None):
+        """
+        Returns
+        -------
+        The last `n` lines of output kept in memory, or all of them
+        """
+        with self._lock:
+            lines = list(self.lines)
+        return lines if n is None else lines[-n:]
+
+    def close(self):
+        """
+        Stop recording output and close the log file. The ring buffer stays readable.
+        """
+        MUX.remove(self)
+        with self._lock:
+            self.closed = True
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class _Stream(object):
+    def __init__(self, server_log, pipe, stderr):
+        self.server_log = server_log
+        self.pipe = pipe
+        self.stderr = stderr
+        self.partial = b''
+        # Set once recording its output has failed, after which it is read and thrown away
+        self.discarding = False
+
+    def feed(self, data):
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.server_log.append(line.decode('utf-8', 'replace').rstrip('\r'), self.stderr)
+
+    def flush(self):
+        if self.partial:
+            self.feed(b'\n')
+
+
+class LogMultiplexer(object):
+    """
+    Reads server output pipes on a single daemon thread, started when the first pipe is added.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._logs = []
+        self._pending = []
+        self._selector = None
+        self._wake_r = self._wake_w = None
+
+    def add(self, server_log, stdout=None, stderr=None):
+        """
+        Start reading a server's output pipes into `server_log`.
+        """
+        if stdout is None and stderr is None:
+            return
+        with self._lock:
+            if server_log not in self._logs:
+                self._logs.append(server_log)
+            self._pending.extend(_Stream(server_log, pipe, is_stderr)
+                                 for pipe, is_stderr in ((stdout, False), (stderr, True)) if pipe is not None)
+            if self._selector is None:
+                self._start()
+        os.write(self._wake_w, b'x')
+
+    def remove(self, server_log):
+        with self._lock:
+            if server_log in self._logs:
+                self._logs.remove(server_log)
+
+    def get_logs(self):
+        """
+        Returns
+        -------
+        List of the `ServerLog` of every server that is still running
+        """
+        with self._lock:
+            return list(self._logs)
+
+    def _start(self):
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        thread = threading.Thread(target=self._run, name='server-fixtures-logmux')
+        thread.daemon = True
+        thread.start()
+
+    def _register_pending(self):
+        try:
+            os.read(self._wake_r, READ_SIZE)
+        except BlockingIOError:
+            pass
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for stream in pending:
+            try:
+                self._selector.register(stream.pipe, selectors.EVENT_READ, stream)
+            except (OSError, ValueError) as e:
+                # eg. the pipe was closed before we got to it
+                log.warning("Can't read output of %s: %s" % (stream.server_log.name, e))
+
+    def _read(self, stream):
+        try:
+            data = os.read(stream.pipe.fileno(), READ_SIZE)
+        except OSError as e:
+            log.debug("Error reading output of %s: %s" % (stream.server_log.name, e))
+            data = b''
+        if data:
+            if not stream.discarding:
+                stream.feed(data)
+            return
+        # End of file, the server and any children holding the pipe have gone away
+        self._selector.unregister(stream.pipe)
+        stream.pipe.close()
+        if not stream.discarding:
+            stream.flush()
+
+    def _drop(self, stream):
+        # Keep draining the pipe, or the server blocks once it fills up
+        stream.discarding = True
+
+    def _run(self):
+        while True:
+            for key, _ in self._selector.select():
+                # One bad stream mustn't stop the output of every other server being read
+                try:
+                    if key.data is None:
+                        self._register_pending()
+                    else:
+                        self._read(key.data)
+                except Exception:
+                    if key.data is None:
+                        log.exception("Error registering server output pipes")
+                    else:
+                        log.exception("Error reading output of %s" % key.data.server_log.name)
+                        self._drop(key.data)
+
+
+MUX = LogMultiplexer()
+
+
+def create_server_log(name, workspace=None, listeners=None):
+    """
+    Create the `ServerLog` for a server. Its log file goes in CONFIG.log_dir if that is set,
+    otherwise in the server's workspace.
+
+    Parameters
+    ----------
+    name: `str`
+        Name of the server
+    workspace: `str`
+        Server workspace directory
+    listeners: `list`
+        Callables called with each line of output
+    """
+    if CONFIG.log_dir:
+        if not os.path.isdir(CONFIG.log_dir):
+            os.makedirs(CONFIG.log_dir, exist_ok=True)
+        path = os.path.join(CONFIG.log_dir, re.sub(r'[^\w.-]', '_', name) + '.log')
+    elif workspace:
+        path = os.path.join(str(workspace), 'server.log')
+    else:
+        path = None
+    return ServerLog(name, path, listeners=listeners)
+
+
+def get_server_logs():
+    """
+    Returns
+    -------
+    List of the `ServerLog` of every server that is still running
+    """
+    return MUX.get_logs()
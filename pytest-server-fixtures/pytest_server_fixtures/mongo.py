@@ -1,19 +1,80 @@
+import functools
+import hashlib
+import itertools
 import logging
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import wait
 
 import pytest
 from pytest_server_fixtures import CONFIG
-from pytest_fixture_config import yield_requires_config
+from pytest_fixture_config import requires_config, yield_requires_config
 
+from . import snapshot
+from .background import run_in_background
 from .base2 import TestServerV2
+from .group import ServerGroup, ServerTopology
+from .pool import server_pool
+from .util import get_random_id
 
 log = logging.getLogger(__name__)
 
+SYSTEM_DATABASES = ('admin', 'config', 'local')
+# How long teardown waits for databases still being dropped in the background
+DROP_TIMEOUT = 30
+# Seconds each readiness probe waits for the server
+PROBE_TIMEOUT = 0.2
+# Number of documents `load` inserts in each round trip
+LOAD_BATCH_SIZE = 1000
+# Bytes of encoded documents `load` keeps in memory, to load files again without reading them
+LOAD_CACHE_BYTES = 256 * 1024 * 1024
 
-def _mongo_server():
+# Performance profiles for mongod, selected with SERVER_FIXTURES_MONGO_PROFILE or the `profile` argument.
+# `args` are added to the mongod command line, and `storage` is the default workspace storage
+# (see pytest_shutil.workspace.Workspace). Add entries here to define your own profiles.
+MONGO_PROFILES = {
+    # Cap the WiredTiger cache, which is otherwise half of the host's memory for every mongod
+    'default': {
+        'args': ['--wiredTigerCacheSizeGB=1',
+                 '--setParameter', 'diagnosticDataCollectionEnabled=false'],
+    },
+    # Small datasets: the smallest cache, no compression or background TTL deletes, and the
+    # data directory in memory
+    'tiny': {
+        'args': ['--wiredTigerCacheSizeGB=0.25',
+                 '--wiredTigerCollectionBlockCompressor=none',
+                 '--wiredTigerJournalCompressor=none',
+                 '--setParameter', 'diagnosticDataCollectionEnabled=false',
+                 '--setParameter', 'ttlMonitorEnabled=false'],
+        'storage': 'memory',
+    },
+    # Load tests: a large cache, no compression and more concurrent storage engine transactions
+    'throughput': {
+        'args': ['--wiredTigerCacheSizeGB=4',
+                 '--wiredTigerCollectionBlockCompressor=none',
+                 '--setParameter', 'diagnosticDataCollectionEnabled=false',
+                 '--setParameter', 'wiredTigerConcurrentReadTransactions=256',
+                 '--setParameter', 'wiredTigerConcurrentWriteTransactions=256'],
+    },
+}
+
+
+def _mongo_server(profile, pool=None):
     """ This does the actual work - there are several versions of this used
         with different scopes.
     """
-    test_server = MongoTestServer()
+    if pool is not None:
+        test_server = pool.acquire()
+        try:
+            yield test_server
+        finally:
+            pool.release(test_server)
+        return
+
+    test_server = MongoTestServer(profile=profile)
     try:
         test_server.start()
         yield test_server
@@ -21,9 +82,27 @@ def _mongo_server():
         test_server.teardown()
 
 
+@pytest.fixture(scope='session')
+def mongo_profile(request):
+    """ Name of the `MONGO_PROFILES` entry the MongoDB fixtures start their servers with.
+        This is SERVER_FIXTURES_MONGO_PROFILE, unless the fixture is overridden or
+        parametrized indirectly.
+    """
+    return getattr(request, 'param', CONFIG.mongo_profile)
+
+
+@pytest.fixture(scope='session')
+@requires_config(CONFIG, ['mongo_bin'])
+def mongo_server_pool(request, mongo_profile):
+    """ Session-scoped pool of pre-started MongoDB servers for the mongo_server fixture.
+        This is None unless SERVER_FIXTURES_POOL_SIZE is set.
+    """
+    return server_pool(request, functools.partial(MongoTestServer, profile=mongo_profile))
+
+
 @pytest.yield_fixture(scope='function')
 @yield_requires_config(CONFIG, ['mongo_bin'])
-def mongo_server():
+def mongo_server(mongo_server_pool, mongo_profile):
     """ Function-scoped MongoDB server started in a local thread.
         This also provides a temp workspace.
         We tear down, and cleanup mongos at the end of the test.
@@ -36,44 +115,344 @@ def mongo_server():
         api (`pymongo.MongoClient`)  : PyMongo Client API connected to this server
         .. also inherits all attributes from the `workspace` fixture
     """
-    for server in _mongo_server():
+    for server in _mongo_server(mongo_profile, mongo_server_pool):
         yield server
 
 
 @pytest.yield_fixture(scope='session')
 @yield_requires_config(CONFIG, ['mongo_bin'])
-def mongo_server_sess():
+def mongo_server_sess(mongo_profile):
     """ Same as mongo_server fixture, scoped as session instead.
     """
-    for server in _mongo_server():
+    for server in _mongo_server(mongo_profile):
         yield server
 
 
 @pytest.yield_fixture(scope='class')
 @yield_requires_config(CONFIG, ['mongo_bin'])
-def mongo_server_cls(request):
+def mongo_server_cls(request, mongo_profile):
     """ Same as mongo_server fixture, scoped for test classes.
     """
-    for server in _mongo_server():
+    for server in _mongo_server(mongo_profile):
         request.cls.mongo_server = server
         yield server
 
 
 @pytest.yield_fixture(scope='module')
 @yield_requires_config(CONFIG, ['mongo_bin'])
-def mongo_server_module():
+def mongo_server_module(mongo_profile):
     """ Same as mongo_server fixture, scoped for test modules.
     """
-    for server in _mongo_server():
+    for server in _mongo_server(mongo_profile):
         yield server
 
 
+@pytest.fixture(scope='session')
+@requires_config(CONFIG, ['mongo_bin'])
+def mongo_replica_set_sess(request, mongo_profile):
+    """ Session-scoped MongoDB replica set of three members, eg. for testing transactions
+        and change streams.
+
+        Attributes
+        ----------
+        api: (``pymongo.MongoClient``)   Client connected to the replica set
+        members: (``list``)   The member `MongoTestServer`s
+    """
+    replica_set = MongoReplicaSetTestServer(members=3, profile=mongo_profile)
+    request.addfinalizer(replica_set.teardown)
+    replica_set.start()
+    return replica_set
+
+
+@pytest.fixture(scope='session')
+@requires_config(CONFIG, ['mongo_bin'])
+def mongo_sharded_sess(request, mongo_profile):
+    """ Session-scoped sharded MongoDB cluster of two single-member shards, a config server and a mongos.
+
+        Attributes
+        ----------
+        api: (``pymongo.MongoClient``)   Client connected to the mongos
+        shards: (``list``)   The shards' `MongoReplicaSetTestServer`s
+        config_servers: (``MongoReplicaSetTestServer``)   The config servers
+        routers: (``list``)   The `MongosTestServer`s
+    """
+    cluster = MongoShardedTestServer(shards=2, profile=mongo_profile)
+    request.addfinalizer(cluster.teardown)
+    cluster.start()
+    return cluster
+
+
+@pytest.fixture(scope='function')
+def mongo_db_collections():
+    """ Collections to create in each mongo_db database, as a dict of collection names to lists
+        of `pymongo.IndexModel` for their indexes. Override this fixture to set them, eg.:
+
+            @pytest.fixture
+            def mongo_db_collections():
+                return {'users': [IndexModel('email', unique=True)], 'events': []}
+    """
+    return {}
+
+
+@pytest.fixture(scope='function')
+def mongo_db_data():
+    """ Files to load into each mongo_db database, as a dict of collection names to the paths of
+        BSON, JSON or JSON lines files (see `load`). Override this fixture to set them, eg.:
+
+            @pytest.fixture
+            def mongo_db_data():
+                return {'users': os.path.join(os.path.dirname(__file__), 'users.jsonl')}
+    """
+    return {}
+
+
+@pytest.fixture(scope='function')
+@requires_config(CONFIG, ['mongo_bin'])
+def mongo_db(request, mongo_server_sess, mongo_db_collections, mongo_db_data):
+    """ Function-scoped MongoDB database of its own on the session-scoped MongoDB server.
+        Much quicker than starting a server for each test with mongo_server.
+        The database is dropped in the background after the test.
+
+        Returns
+        -------
+        `pymongo.database.Database`, with the collections from the mongo_db_collections fixture
+        and the data from the mongo_db_data fixture
+    """
+    db = mongo_server_sess.create_database(request.node.name, mongo_db_collections, mongo_db_data)
+    request.addfinalizer(lambda: mongo_server_sess.drop_database(db.name))
+    return db
+
+
+def _bson_documents(f):
+    from bson.raw_bson import RawBSONDocument
+    while True:
+        header = f.read(4)
+        if not header:
+            return
+        if len(header) < 4:
+            raise ValueError("Truncated BSON data")
+        length = struct.unpack('<i', header)[0]
+        data = header + f.read(length - 4)
+        if len(data) < length:
+            raise ValueError("Truncated BSON data")
+        yield RawBSONDocument(data)
+
+
+def _encode(doc):
+    from bson import BSON
+    from bson.raw_bson import RawBSONDocument
+    return RawBSONDocument(BSON.encode(doc))
+
+
+def _json_documents(f):
+    from bson import json_util
+    docs = json_util.loads(f.read().decode('utf-8'))
+    if isinstance(docs, dict):
+        docs = [docs]
+    for doc in docs:
+        yield _encode(doc)
+
+
+def _jsonl_documents(f):
+    from bson import json_util
+    for line in f:
+        if line.strip():
+            yield _encode(json_util.loads(line.decode('utf-8')))
+
+
+LOAD_READERS = {
+    'bson': _bson_documents,
+    'json': _json_documents,
+    'jsonl': _jsonl_documents,
+}
+
+
+def read_documents(path, format=None):
+    """
+    Read the documents to load into MongoDB from a file. Formats are:
+
+        bson:  BSON documents one after the other, as written by mongodump
+        json:  an array of documents, or a single document, in MongoDB extended JSON
+        jsonl: a document in MongoDB extended JSON on each line. Unlike json, this is streamed.
+
+    Parameters
+    ----------
+    path: `str`
+        Path of the file
+    format: `str`
+        One of the formats above, by default the file's extension
+
+    Returns
+    -------
+    Generator of `bson.raw_bson.RawBSONDocument`
+    """
+    format = format or os.path.splitext(str(path))[1].lstrip('.').lower()
+    if format not in LOAD_READERS:
+        raise ValueError("Unknown data file format %r, use one of %s" % (format, ', '.join(sorted(LOAD_READERS))))
+    with open(str(path), 'rb') as f:
+        for doc in LOAD_READERS[format](f):
+            yield doc
+
+
+def _batched(docs, batch_size):
+    docs = iter(docs)
+    while True:
+        batch = list(itertools.islice(docs, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class _BatchCache(object):
+    """ Batches of encoded documents read from files, by the hash of the file's contents.
+        Least recently used files are dropped to stay within LOAD_CACHE_BYTES.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._batches = OrderedDict()
+        self._hashes = {}
+        self.size = 0
+
+    def file_hash(self, path):
+        # Hashing is quicker than parsing, but still only done once for each version of the file
+        version = snapshot.file_version(path)
+        if version not in self._hashes:
+            sha1 = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha1.update(chunk)
+            self._hashes[version] = sha1.hexdigest()
+        return self._hashes[version]
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._batches:
+                return None
+            self._batches.move_to_end(key)
+            return self._batches[key][0]
+
+    def put(self, key, batches, size):
+        with self._lock:
+            if key in self._batches:
+                return
+            self._batches[key] = (batches, size)
+            self.size += size
+            while self.size > LOAD_CACHE_BYTES:
+                _, (_, evicted_size) = self._batches.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._batches.clear()
+            self._hashes.clear()
+            self.size = 0
+
+
+_batch_cache = _BatchCache()
+
+
+def read_batches(path, format=None, batch_size=LOAD_BATCH_SIZE):
+    """
+    Read the documents in a file (see `read_documents`) in batches. The batches are kept for the
+    rest of the session, so loading the same file again doesn't read, parse or encode it.
+
+    Returns
+    -------
+    Generator of lists of `bson.raw_bson.RawBSONDocument`
+    """
+    path = str(path)
+    key = (_batch_cache.file_hash(path), format or os.path.splitext(path)[1].lstrip('.').lower(), batch_size)
+    batches = _batch_cache.get(key)
+    if batches is not None:
+        for batch in batches:
+            yield batch
+        return
+
+    batches, size = [], 0
+    for batch in _batched(read_documents(path, format), batch_size):
+        if batches is not None:
+            size += sum(len(doc.raw) for doc in batch)
+            if size > LOAD_CACHE_BYTES:
+                # Too big to keep
+                batches = None
+            else:
+                batches.append(batch)
+        yield batch
+    if batches is not None:
+        _batch_cache.put(key, batches, size)
+
+
+def load(collection, source, format=None, indexes=None, batch_size=LOAD_BATCH_SIZE):
+    """
+    Load documents into a collection with unordered `insert_many` batches, rather than making a
+    round trip for each of them. Indexes are built after the documents are loaded, which is
+    quicker than updating them for every insert.
+
+    Parameters
+    ----------
+    collection: `pymongo.collection.Collection`
+        Collection to load the documents into
+    source: `str` or iterable
+        Path of a data file (see `read_documents`), or an iterable of documents
+    format: `str`
+        Format of the data file, by default its extension
+    indexes: `list`
+        `pymongo.IndexModel`s to create once the documents are loaded
+    batch_size: `int`
+        Number of documents to send in each round trip
+
+    Returns
+    -------
+    The number of documents loaded
+    """
+    if isinstance(source, (str, os.PathLike)):
+        batches = read_batches(source, format, batch_size)
+    else:
+        batches = _batched(source, batch_size)
+    count = 0
+    for batch in batches:
+        collection.insert_many(batch, ordered=False)
+        count += len(batch)
+    if indexes:
+        collection.create_indexes(indexes)
+    return count
+
+
 class MongoTestServer(TestServerV2):
+    """
+    A mongod server.
+
+    Parameters
+    ----------
+    replica_set: `str`
+        Name of the replica set this server is a member of, see `MongoReplicaSetTestServer`
+    cluster_role: `str`
+        'shardsvr' or 'configsvr' for the members of a sharded cluster, see `MongoShardedTestServer`
+    profile: `str`
+        Name of the `MONGO_PROFILES` entry to run with, defaults to CONFIG.mongo_profile
+    max_pool_size: `int`
+        Maximum number of connections in the pool of the `api` client, defaults to
+        CONFIG.mongo_max_pool_size or pymongo's default
+    """
+    ready_log_pattern = r'[Ww]aiting for connections'
+    api = None
+    _drops = ()
 
-    def __init__(self, delete=True, **kwargs):
-        super(MongoTestServer, self).__init__(delete=delete, **kwargs)
+    def __init__(self, delete=True, replica_set=None, cluster_role=None, profile=None, storage=None,
+                 max_pool_size=None, **kwargs):
+        self.profile = profile or CONFIG.mongo_profile
+        if self.profile not in MONGO_PROFILES:
+            raise ValueError("Unknown mongo profile %r, expected one of: %s"
+                             % (self.profile, ", ".join(sorted(MONGO_PROFILES))))
+        storage = storage or CONFIG.storage or MONGO_PROFILES[self.profile].get('storage')
+        super(MongoTestServer, self).__init__(delete=delete, storage=storage, **kwargs)
+        self.replica_set = replica_set
+        self.cluster_role = cluster_role
+        self.max_pool_size = max_pool_size
         self._port = self._get_port(27017)
         self.api = None
+        self._drops = []
 
     @property
     def cmd(self):
@@ -89,13 +468,22 @@ class MongoTestServer(TestServerV2):
             '--port=%s' % self.port,
             '--nounixsocket',
             '--syncdelay=0',
-            '--nojournal',
             '--quiet',
         ]
+        if self.replica_set:
+            # Replica set members need the journal
+            cmd.append('--replSet=%s' % self.replica_set)
+        else:
+            cmd.append('--nojournal')
+        if self.cluster_role:
+            cmd.append('--%s' % self.cluster_role)
 
         if 'workspace' in kwargs:
             cmd.append('--dbpath=%s' % str(kwargs['workspace']))
 
+        # These are also passed to the docker and kubernetes containers' mongod
+        cmd.extend(MONGO_PROFILES[self.profile]['args'])
+
         return cmd
 
     @property
@@ -108,8 +496,7 @@ class MongoTestServer(TestServerV2):
 
     def check_server_up(self):
         """Test connection to the server."""
-        import pymongo
-        from pymongo.errors import AutoReconnect, ConnectionFailure
+        from pymongo.errors import AutoReconnect, ConnectionFailure, ExecutionTimeout
 
         # Hostname must exist before continuing
         # Some server class (e.g. Docker) will only allocate an IP after the
@@ -118,19 +505,293 @@ class MongoTestServer(TestServerV2):
             return False
 
         log.info("Connecting to Mongo at %s:%s" % (self.hostname, self.port))
+        if self.api is None:
+            # One client is created, and monitored until the server is up, then used as the api.
+            # It has the default timeouts in case the server goes slow.
+            self.api = self._client()
         try:
-            with pymongo.MongoClient(self.hostname, self.port, serverselectiontimeoutms=200) as initial_api:
-                initial_api.list_database_names()
-
-            # Configure the client with default timeouts in case the server goes slow
-            self.api = pymongo.MongoClient(self.hostname, self.port)
+            self._ping()
             return True
-        except (AutoReconnect, ConnectionFailure) as e:
+        except (AutoReconnect, ConnectionFailure, ExecutionTimeout):
             pass
         return False
 
+    def _ping(self):
+        import pymongo
+        # Replica set members can't list databases until the set is initiated, so ping
+        if hasattr(pymongo, 'timeout'):
+            with pymongo.timeout(PROBE_TIMEOUT):
+                self.api.admin.command('ping')
+        else:
+            # Before pymongo 4.2, server selection can only be cut short for the whole client
+            with self._client(serverselectiontimeoutms=int(PROBE_TIMEOUT * 1000)) as probe:
+                probe.admin.command('ping')
+
+    def _client(self, **kwargs):
+        import pymongo
+        if self.replica_set:
+            # Talk to this member, rather than the primary of its replica set
+            kwargs['directConnection'] = True
+        kwargs.update(_pool_options(self.max_pool_size))
+        return pymongo.MongoClient(self.hostname, self.port, **kwargs)
+
+    def create_database(self, prefix, collections=None, data=None):
+        """
+        Create a database with a unique name, eg. for one test.
+
+        Parameters
+        ----------
+        prefix: `str`
+            Start of the database name, eg. the test name
+        collections: `dict`
+            Collection names to lists of `pymongo.IndexModel`, to create in the database
+        data: `dict`
+            Collection names to the paths of data files to load into them, see `load`.
+            The indexes are created after the data is loaded.
+
+        Returns
+        -------
+        The `pymongo.database.Database`
+        """
+        # Database names are limited to 63 bytes and can't contain some punctuation
+        name = '%s_%s' % (re.sub(r'[^A-Za-z0-9_-]', '_', prefix)[:50], get_random_id(8))
+        db = self.api[name]
+        collections = collections or {}
+        data = data or {}
+        for collection in collections:
+            if collection not in data:
+                db.create_collection(collection)
+        for collection, path in data.items():
+            load(db[collection], path)
+        for collection, indexes in collections.items():
+            if indexes:
+                db[collection].create_indexes(indexes)
+        return db
+
+    def load(self, database, collection, source, format=None, indexes=None):
+        """ Load documents into a collection, see `load`.
+        """
+        return load(self.api[database][collection], source, format, indexes)
+
+    def drop_database(self, name):
+        """
+        Drop a database in the background. Teardown waits for this to finish.
+        """
+        self._drops = [f for f in self._drops if not f.done()]
+        self._drops.append(run_in_background(self.api.drop_database, name))
+
+    def reset(self):
+        """Drop the databases left by the last user of a reused server."""
+        for db in self.api.list_database_names():
+            if db not in SYSTEM_DATABASES:
+                self.api.drop_database(db)
+
     def teardown(self):
+        if self._drops:
+            wait(self._drops, timeout=DROP_TIMEOUT)
+            self._drops = []
         if self.api:
             self.api.close()
             self.api = None
         super(MongoTestServer, self).teardown()
+
+
+def _pool_options(max_pool_size=None):
+    # Connection pool settings for the servers' clients
+    if max_pool_size is None:
+        max_pool_size = CONFIG.mongo_max_pool_size
+    if max_pool_size is None:
+        return {}
+    return {'maxPoolSize': int(max_pool_size)}
+
+
+def _mongos_executable():
+    # mongos is installed alongside mongod
+    if CONFIG.mongo_bin and os.path.dirname(CONFIG.mongo_bin):
+        return os.path.join(os.path.dirname(CONFIG.mongo_bin), 'mongos')
+    return 'mongos'
+
+
+class MongosTestServer(MongoTestServer):
+    """
+    A mongos router for a sharded cluster, see `MongoShardedTestServer`.
+
+    Parameters
+    ----------
+    config_servers: `MongoReplicaSetTestServer`
+        The running config server replica set
+    """
+
+    def __init__(self, config_servers, **kwargs):
+        super(MongosTestServer, self).__init__(**kwargs)
+        self.config_servers = config_servers
+
+    @property
+    def cmd(self):
+        return 'mongos'
+
+    @property
+    def cmd_local(self):
+        return _mongos_executable()
+
+    def get_args(self, **kwargs):
+        return [
+            '--bind_ip=%s' % self._listen_hostname,
+            '--port=%s' % self.port,
+            '--nounixsocket',
+            '--quiet',
+            '--configdb=%s' % self.config_servers.connection_string,
+        ]
+
+
+class MongoReplicaSetTestServer(ServerTopology):
+    """
+    A MongoDB replica set. All the members start at the same time, then the replica set
+    is initiated, and `start` waits for a primary to be elected and the other members to
+    become secondaries.
+
+    Parameters
+    ----------
+    members: `int`
+        Number of members
+    name: `str`
+        Name of the replica set
+    kwargs:
+        Arguments for each `MongoTestServer`
+    """
+
+    def __init__(self, members=3, name='rs0', **kwargs):
+        self.name = name
+        self.members = [MongoTestServer(replica_set=name, **kwargs) for _ in range(members)]
+        self._configsvr = kwargs.get('cluster_role') == 'configsvr'
+        self._max_pool_size = kwargs.get('max_pool_size')
+        self._api = None
+        super(MongoReplicaSetTestServer, self).__init__(**dict(('%s-%d' % (name, i), member)
+                                                               for i, member in enumerate(self.members)))
+
+    @property
+    def hosts(self):
+        return ['%s:%s' % (m.hostname, m.port) for m in self.members]
+
+    @property
+    def connection_string(self):
+        """ The replica set, as given to mongos or addShard, eg. rs0/host1:port1,host2:port2
+        """
+        return '%s/%s' % (self.name, ','.join(self.hosts))
+
+    @property
+    def api(self):
+        if not self._api:
+            import pymongo
+            self._api = pymongo.MongoClient(self.hosts, replicaset=self.name, **_pool_options(self._max_pool_size))
+        return self._api
+
+    def initiate(self):
+        """ Initiate the replica set, without waiting for it to be ready.
+        """
+        config = {'_id': self.name,
+                  'members': [{'_id': i, 'host': host} for i, host in enumerate(self.hosts)]}
+        if self._configsvr:
+            config['configsvr'] = True
+        self.members[0].api.admin.command('replSetInitiate', config)
+
+    def wait_until_ready(self):
+        """ Wait for a primary to be elected, and the other members to become secondaries.
+        """
+        def ready():
+            states = [m['stateStr'] for m in self.members[0].api.admin.command('replSetGetStatus')['members']]
+            return states.count('PRIMARY') == 1 and states.count('SECONDARY') == len(states) - 1
+
+        from pymongo.errors import OperationFailure
+
+        def ready_or_initialising():
+            try:
+                return ready()
+            except OperationFailure:
+                # Not initialised yet
+                return False
+        self.wait_until(ready_or_initialising, "replica set %s to elect a primary" % self.name)
+
+    def connect(self):
+        self.initiate()
+        self.wait_until_ready()
+
+    def close(self):
+        """ Close the replica set client, leaving the members running.
+        """
+        if self._api is not None:
+            self._api.close()
+            self._api = None
+
+    def teardown(self):
+        self.close()
+        super(MongoReplicaSetTestServer, self).teardown()
+
+    async def ateardown(self):
+        self.close()
+        await super(MongoReplicaSetTestServer, self).ateardown()
+
+
+class MongoShardedTestServer(ServerTopology):
+    """
+    A sharded MongoDB cluster. All the shard and config server members start at the same time,
+    then their replica sets are initiated, the mongos routers are started, and the shards are
+    added to the cluster.
+
+    Parameters
+    ----------
+    shards: `int`
+        Number of shards
+    shard_members: `int`
+        Number of members in each shard's replica set
+    config_members: `int`
+        Number of members in the config server replica set
+    routers: `int`
+        Number of mongos routers
+    kwargs:
+        Arguments for each `MongoTestServer` and `MongosTestServer`
+    """
+
+    def __init__(self, shards=2, shard_members=1, config_members=1, routers=1, **kwargs):
+        self.shards = [MongoReplicaSetTestServer(members=shard_members, name='shard%d' % i,
+                                                 cluster_role='shardsvr', **kwargs)
+                       for i in range(shards)]
+        self.config_servers = MongoReplicaSetTestServer(members=config_members, name='config',
+                                                        cluster_role='configsvr', **kwargs)
+        self.routers = [MongosTestServer(self.config_servers, **kwargs) for _ in range(routers)]
+        self._router_group = ServerGroup(*self.routers)
+        servers = {}
+        for replica_set in self.shards + [self.config_servers]:
+            servers.update(replica_set.servers)
+        super(MongoShardedTestServer, self).__init__(**servers)
+
+    @property
+    def api(self):
+        return self.routers[0].api
+
+    def connect(self):
+        for replica_set in self.shards + [self.config_servers]:
+            replica_set.initiate()
+        for replica_set in self.shards + [self.config_servers]:
+            replica_set.topology_timeout = self.topology_timeout
+            replica_set.wait_until_ready()
+        # The routers can only start once the config servers are up
+        self._router_group.start()
+        for shard in self.shards:
+            self.api.admin.command('addShard', shard.connection_string)
+
+    def teardown(self):
+        try:
+            self._router_group.teardown()
+        finally:
+            for replica_set in self.shards + [self.config_servers]:
+                replica_set.close()
+            super(MongoShardedTestServer, self).teardown()
+
+    async def ateardown(self):
+        try:
+            await self._router_group.ateardown()
+        finally:
+            for replica_set in self.shards + [self.config_servers]:
+                replica_set.close()
+            await super(MongoShardedTestServer, self).ateardown()
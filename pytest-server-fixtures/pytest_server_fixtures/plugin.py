@@ -0,0 +1,126 @@
+""" Session-wide py.test hooks for the server fixtures.
+"""
+import logging
+import os
+
+import pytest
+
+from pytest_server_fixtures import CONFIG
+from . import reaper
+from .background import join_background
+from .group import ServerGroup
+from .logmux import ServerLog
+from .trace import TRACER, span
+
+log = logging.getLogger(__name__)
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('server-fixtures', 'server fixtures')
+    group.addoption('--server-fixtures-trace', metavar='PATH', default=None,
+                    help="Write a Chrome trace of server fixture lifecycle phases to PATH "
+                         "(default: SERVER_FIXTURES_TRACE)")
+
+
+def _trace_path(config):
+    return config.getoption('server_fixtures_trace', None) or CONFIG.trace_file
+
+
+def pytest_configure(config):
+    if _trace_path(config):
+        TRACER.enabled = True
+
+
+def pytest_sessionstart(session):
+    if CONFIG.reap_orphans:
+        # Runs in the background, so doesn't hold up the first test
+        reaper.start()
+    else:
+        reaper.hold_session_lock()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_setup(item):
+    with span('setup', cat='pytest', test=item.nodeid):
+        yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    with span('call', cat='pytest', test=item.nodeid):
+        yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_teardown(item):
+    with span('teardown', cat='pytest', test=item.nodeid):
+        yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    if report.failed:
+        # Show what the test's servers were saying when it failed
+        for server_log in _fixture_server_logs(item):
+            lines = server_log.tail()
+            if lines:
+                report.sections.append(('Captured server log %s' % server_log.name, '\n'.join(lines)))
+
+
+def _server_logs(value):
+    if isinstance(value, ServerGroup):
+        return [server_log for server in value for server_log in _server_logs(server)]
+    try:
+        server_log = getattr(value, '_server_log', None)
+    except Exception:
+        return []
+    return [server_log] if isinstance(server_log, ServerLog) else []
+
+
+def _fixture_server_logs(item):
+    """
+    Returns
+    -------
+    List of the `ServerLog` of each server among the values of the fixtures used by `item`,
+    including those only used by other fixtures, eg. the session server behind ``mongo_db``
+    """
+    server_logs = []
+    for value in getattr(item, 'funcargs', {}).values():
+        for server_log in _server_logs(value):
+            if server_log not in server_logs:
+                server_logs.append(server_log)
+    return server_logs
+
+
+def _remove_session_containers():
+    import docker
+    from .serverclass.docker import reap_idle_containers
+    try:
+        reap_idle_containers(docker.from_env(), ttl=0, session_id=CONFIG.session_id)
+    except Exception as e:
+        # eg. the daemon has gone away. Don't stop the rest of the session finishing.
+        log.warning("Failed to remove this session's docker containers: %s" % e)
+
+
+def _write_trace(session):
+    path = _trace_path(session.config)
+    if not path:
+        return
+    worker = os.getenv('PYTEST_XDIST_WORKER')
+    if worker:
+        # The xdist controller merges these in when it finishes
+        TRACER.write('%s.%s' % (path, worker), process_name=worker)
+    else:
+        TRACER.write(path, process_name='pytest', merge_pattern='%s.gw*' % path)
+
+
+# Run after the session-scoped fixtures have been torn down
+@pytest.hookimpl(trylast=True)
+def pytest_sessionfinish(session):
+    # Wait for servers still being torn down in the background
+    join_background()
+    if CONFIG.server_class == 'docker' and CONFIG.docker_reuse == 'session':
+        _remove_session_containers()
+    _write_trace(session)
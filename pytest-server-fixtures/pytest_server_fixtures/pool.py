@@ -0,0 +1,149 @@
+""" Pools of pre-started servers, so function-scoped fixtures don't wait for server start-up.
+"""
+import logging
+import queue
+import threading
+from concurrent.futures import wait
+
+from pytest_server_fixtures import CONFIG
+from .background import run_in_background
+
+log = logging.getLogger(__name__)
+
+
+class ServerPoolClosedException(Exception):
+    """Thrown when acquiring a server from a pool that has been closed."""
+    pass
+
+
+def server_pool(request, factory, size=None):
+    """
+    Create a `ServerPool` that is closed at the end of the fixture scope of `request`.
+
+    Parameters
+    ----------
+    request:
+        py.test fixture request
+    factory: ``callable``
+        Returns a new, unstarted server, eg. a `TestServerV2` subclass
+    size: `int`
+        Number of spare servers, defaults to CONFIG.server_pool_size, or CONFIG.k8s_pool_size
+        if that is set and we're using the kubernetes server class
+
+    Returns
+    -------
+    The pool, or None if pooling is disabled (`size` is 0)
+    """
+    if size is None:
+        size = CONFIG.server_pool_size
+        if CONFIG.server_class == 'kubernetes' and CONFIG.k8s_pool_size is not None:
+            # Pods are slow to schedule, so these usually need a deeper pool
+            size = int(CONFIG.k8s_pool_size)
+    if not size:
+        return None
+    pool = ServerPool(factory, size)
+    request.addfinalizer(pool.close)
+    return pool
+
+
+class ServerPool(object):
+    """
+    Keeps a number of spare servers started in background threads.
+
+    Each call to `acquire` hands out a running server and starts another one to replace it.
+    Servers are not re-used, `release` tears them down in the background.
+
+    Parameters
+    ----------
+    factory: ``callable``
+        Returns a new, unstarted server with `start` and `teardown` methods
+    size: `int`
+        Number of spare servers to keep
+    """
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.size = size
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._starting = []
+        self._teardowns = set()
+        self._closed = False
+        for _ in range(size):
+            self._refill()
+
+    def _refill(self):
+        with self._lock:
+            if self._closed:
+                return
+            thread = threading.Thread(target=self._start_server, name='server-fixtures-pool')
+            thread.daemon = True
+            self._starting.append(thread)
+        thread.start()
+
+    def _start_server(self):
+        try:
+            server = self.factory()
+            try:
+                server.start()
+            except Exception:
+                server.teardown()
+                raise
+        except Exception as e:
+            log.warning("Failed to start pooled server: %s" % e)
+            self._ready.put(e)
+        else:
+            self._ready.put(server)
+        finally:
+            with self._lock:
+                self._starting.remove(threading.current_thread())
+
+    def acquire(self):
+        """
+        Take a running server from the pool, waiting for one if none are ready yet.
+        """
+        if self._closed:
+            raise ServerPoolClosedException()
+        self._refill()
+        server = self._ready.get()
+        if isinstance(server, Exception):
+            raise server
+        return server
+
+    def release(self, server):
+        """
+        Tear down a server taken from the pool, in the background.
+        """
+        self._teardown(server)
+
+    def _teardown(self, server):
+        future = run_in_background(server.teardown)
+        with self._lock:
+            self._teardowns.add(future)
+        future.add_done_callback(self._teardown_done)
+
+    def _teardown_done(self, future):
+        with self._lock:
+            self._teardowns.discard(future)
+
+    def close(self):
+        """
+        Stop refilling the pool and tear down all the spare servers, waiting for them
+        and any released servers still being torn down.
+        """
+        with self._lock:
+            self._closed = True
+            starting = list(self._starting)
+        for thread in starting:
+            thread.join()
+        while True:
+            try:
+                server = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            if not isinstance(server, Exception):
+                self._teardown(server)
+        with self._lock:
+            teardowns = list(self._teardowns)
+        # Only our own servers, other work in the background is none of our business
+        wait(teardowns)
@@ -0,0 +1,157 @@
+""" Cross-process allocation of ports for server fixtures.
+
+A port is reserved by holding an exclusive lock on a per-port lock file, so other test
+processes on the host (eg. pytest-xdist workers) won't hand out the same port while
+the server is still starting up. The kernel drops the lock if the process dies, so
+crashed sessions never leak reservations.
+"""
+import errno
+import itertools
+import logging
+import os
+import random
+import socket
+import threading
+
+from pytest_server_fixtures import CONFIG
+from .locks import LockUnavailable, try_lock
+
+log = logging.getLogger(__name__)
+
+_reservations = {}
+_lock = threading.Lock()
+# Set once port lock files turn out not to be usable, eg. on a read-only temp dir
+_locking_unavailable = False
+
+
+def get_xdist_worker():
+    """
+    Returns
+    -------
+    Tuple of (index, count) of the pytest-xdist worker we're running in, or None if we aren't one.
+    """
+    worker = os.getenv('PYTEST_XDIST_WORKER')
+    if not worker or not worker.startswith('gw'):
+        return None
+    try:
+        return int(worker[2:]), int(os.getenv('PYTEST_XDIST_WORKER_COUNT', 0)) or None
+    except ValueError:
+        return None
+
+
+def get_port_range():
+    """
+    Returns
+    -------
+    (first, last) port numbers to allocate from. If CONFIG.xdist_partition is set, each
+    pytest-xdist worker gets its own slice of CONFIG.port_range.
+    """
+    first, last = [int(i) for i in str(CONFIG.port_range).split('-')]
+    worker = get_xdist_worker()
+    if CONFIG.xdist_partition and worker and worker[1]:
+        index, count = worker
+        size = (last - first + 1) // count
+        first = first + index * size
+        last = first + size - 1
+    return first, last
+
+
+class PortReservation(object):
+    """ An exclusive reservation of a port number, held until released or this process exits.
+    """
+
+    def __init__(self, port, lock):
+        self.port = port
+        self._lock = lock
+
+    def release(self):
+        if self._lock is not None:
+            # Ports are picked at random, so don't leave a lock file behind for each of them
+            self._lock.release(unlink=True)
+
+
+def _try_reserve(port):
+    """ Try to take the lock for this port, returning a `PortReservation` or None.
+        If ports can't be locked at all, the reservation only covers this process.
+    """
+    global _locking_unavailable
+    if not _locking_unavailable:
+        try:
+            lock = try_lock('ports', port, strict=True)
+        except LockUnavailable as e:
+            log.warning("Not reserving ports against other test processes: %s" % e)
+            _locking_unavailable = True
+        else:
+            if lock is None:
+                return None
+            return PortReservation(port, lock)
+    with _lock:
+        if port in _reservations:
+            return None
+    return PortReservation(port, None)
+
+
+def _is_free(host, port):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((host, port))
+        return True
+    except socket.error:
+        return False
+    finally:
+        s.close()
+
+
+def _candidates(port, first, last):
+    if not port:
+        port = random.randint(first, last)
+    if first <= port <= last:
+        return itertools.chain(range(port, last + 1), range(first, port))
+    return itertools.chain([port], range(first, last + 1))
+
+
+def reserve_port(host, port=0):
+    """
+    Reserve a free port.
+
+    Parameters
+    ----------
+    host: `str`
+        Host the port needs to be free on
+    port: `int`
+        If specified, use this port as a base and the next free port after that base will be reserved.
+
+    Returns
+    -------
+    `PortReservation` for the port
+    """
+    first, last = get_port_range()
+    for candidate in _candidates(port, first, last):
+        reservation = _try_reserve(candidate)
+        if reservation is None:
+            continue
+        if _is_free(host, candidate):
+            return reservation
+        reservation.release()
+    raise socket.error(errno.EADDRINUSE, "No free ports in range %d-%d" % (first, last))
+
+
+def allocate_port(host, port=0):
+    """
+    Reserve a free port and return its number. The reservation is held until `release_port`
+    is called, typically once the server has bound to it.
+    """
+    reservation = reserve_port(host, port)
+    with _lock:
+        _reservations[reservation.port] = reservation
+    return reservation.port
+
+
+def release_port(port):
+    """ Release a port allocated by `allocate_port`. Does nothing if the port isn't reserved.
+    """
+    with _lock:
+        reservation = _reservations.pop(port, None)
+    if reservation is not None:
+        reservation.release()
@@ -1,8 +1,11 @@
 # coding: utf-8
 
 import os
+import getpass
 import logging
+import re
 import subprocess
+from concurrent.futures import wait
 
 import errno
 import pytest
@@ -10,10 +13,18 @@ import pytest
 from pytest_server_fixtures import CONFIG
 from pytest_fixture_config import requires_config
 
+from . import snapshot
+from .background import run_in_background
 from .base import TestServer
+from .util import get_random_id
 
 log = logging.getLogger(__name__)
 
+# Environment variables that change what initdb produces
+INITDB_ENV = ('LANG', 'LC_ALL', 'LC_COLLATE', 'LC_CTYPE', 'LC_MESSAGES', 'TZ', 'PGTZ')
+# How long teardown waits for databases still being dropped in the background
+DROP_TIMEOUT = 30
+
 
 @pytest.fixture(scope='session')
 @requires_config(CONFIG, ['pg_config_executable'])
@@ -22,6 +33,54 @@ def postgres_server_sess(request):
     return _postgres_server(request)
 
 
+@pytest.fixture(scope='session')
+def postgres_template_setup():
+    """ Prepares the template database that each postgres_db database is copied from, eg. by
+        running schema migrations and loading seed data. This is None, for an empty template.
+        Override this fixture to return a function taking a psycopg2 connection to the
+        template database, eg.:
+
+            @pytest.fixture(scope='session')
+            def postgres_template_setup():
+                def setup(conn):
+                    with conn.cursor() as cursor:
+                        cursor.execute(open('schema.sql').read())
+                return setup
+    """
+    return None
+
+
+@pytest.fixture(scope='session')
+@requires_config(CONFIG, ['pg_config_executable'])
+def postgres_template_sess(postgres_server_sess, postgres_template_setup):
+    """ Name of the template database on the session-scoped Postgres server, prepared
+        once a session by the postgres_template_setup fixture.
+    """
+    return postgres_server_sess.create_template(postgres_server_sess.database_name + '_template',
+                                                postgres_template_setup)
+
+
+@pytest.fixture(scope='function')
+@requires_config(CONFIG, ['pg_config_executable'])
+def postgres_db(request, postgres_server_sess, postgres_template_sess):
+    """ Function-scoped Postgres database of its own on the session-scoped Postgres server,
+        copied from the template database with CREATE DATABASE ... TEMPLATE. This is much
+        quicker than running the migrations for every test.
+        The database is dropped in the background after the test.
+
+        Returns
+        -------
+        `PostgresDatabase`
+    """
+    db = postgres_server_sess.clone_database(postgres_template_sess, request.node.name)
+
+    def drop():
+        db.close()
+        postgres_server_sess.drop_database(db.name)
+    request.addfinalizer(drop)
+    return db
+
+
 def _postgres_server(request):
     server = PostgresServer()
     server.start()
@@ -29,17 +88,52 @@ def _postgres_server(request):
     return server
 
 
+class PostgresDatabase(object):
+    """
+    A database on a `PostgresServer`, see the postgres_db fixture.
+    """
+
+    def __init__(self, server, name):
+        self.server = server
+        self.name = name
+        self._connection = None
+
+    @property
+    def connection_config(self):
+        cfg = self.server.connection_config
+        cfg[u'database'] = self.name
+        return cfg
+
+    @property
+    def connection(self):
+        """ psycopg2 connection to the database, closed after the test
+        """
+        if self._connection is None:
+            self._connection = self.connect()
+        return self._connection
+
+    def connect(self):
+        return self.server.connect(self.name)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
 class PostgresServer(TestServer):
     """
     Exposes a server.connect() method returning a raw psycopg2 connection.
     Also exposes a server.connection_config property returning a dict with connection parameters
     """
     random_port = True
+    _drops = ()
 
     def __init__(self, database_name="integration", skip_on_missing_postgres=False, **kwargs):
         self.database_name = database_name
         # TODO make skip configurable with a pytest flag
         self._fail = pytest.skip if skip_on_missing_postgres else pytest.exit
+        self._drops = []
         super(PostgresServer, self).__init__(workspace=None, delete=True, preserve_sys_path=False, **kwargs)
 
     def kill(self, retries=5):
@@ -56,9 +150,8 @@ class PostgresServer(TestServer):
         """
         Find postgres server binary
         Set up connection parameters
+        Initialise the database directory, from a snapshot of a previous initdb if there is one
         """
-        (self.workspace / 'db').mkdir()  # pylint: disable=no-value-for-parameter
-
         try:
             self.pg_bin = subprocess.check_output([CONFIG.pg_config_executable, "--bindir"]).decode('utf-8').rstrip()
         except OSError as e:
@@ -70,8 +163,11 @@ class PostgresServer(TestServer):
             msg = "Unable to find pg binary specified by pg_config: {} is not a file".format(initdb_path)
             print(msg)
             self._fail(msg)
+        key = snapshot.get_key(snapshot.file_version(initdb_path), getpass.getuser(),
+                               [(k, os.environ.get(k)) for k in INITDB_ENV])
         try:
-            subprocess.check_call([initdb_path, str(self.workspace / 'db')])
+            snapshot.cached('postgres-initdb', key, self.workspace / 'db',
+                            lambda path: subprocess.check_call([initdb_path, str(path)]))
         except OSError as e:
             msg = "Failed to launch postgres: " + str(e)
             print(msg)
@@ -124,3 +220,87 @@ class PostgresServer(TestServer):
         if database is not None:
             cfg[u'database'] = database
         return psycopg2.connect(**cfg)
+
+    def _execute(self, *queries):
+        # Runs statements that can't be in a transaction, eg. CREATE DATABASE
+        conn = self.connect('postgres')
+        try:
+            conn.set_session(autocommit=True)
+            with conn.cursor() as cursor:
+                for query in queries:
+                    cursor.execute(query(conn) if callable(query) else query)
+        finally:
+            conn.close()
+
+    def create_template(self, name, setup=None):
+        """
+        Create a template database, eg. with the schema and seed data for the tests.
+
+        Parameters
+        ----------
+        name: `str`
+            Name of the template database
+        setup: ``callable``
+            Called with a psycopg2 connection to the template database to set it up.
+            It is committed afterwards.
+
+        Returns
+        -------
+        The name of the template database
+        """
+        from psycopg2 import sql
+        self._execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(name)))
+        if setup is not None:
+            conn = self.connect(name)
+            try:
+                setup(conn)
+                conn.commit()
+            finally:
+                conn.close()
+        # Databases can't be copied while anything is connected to them
+        self._execute(sql.SQL("ALTER DATABASE {} WITH IS_TEMPLATE true ALLOW_CONNECTIONS false")
+                      .format(sql.Identifier(name)))
+        return name
+
+    def clone_database(self, template, prefix):
+        """
+        Copy a template database to a new database with a unique name, eg. for one test.
+
+        Parameters
+        ----------
+        template: `str`
+            Name of the template database, see `create_template`
+        prefix: `str`
+            Start of the database name, eg. the test name
+
+        Returns
+        -------
+        The `PostgresDatabase`
+        """
+        from psycopg2 import sql
+        # Database names are limited to 63 bytes
+        name = '%s_%s' % (re.sub(r'[^a-z0-9_]', '_', prefix.lower())[:50], get_random_id(8))
+        self._execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(sql.Identifier(name),
+                                                                        sql.Identifier(template)))
+        return PostgresDatabase(self, name)
+
+    def drop_database(self, name):
+        """
+        Drop a database in the background. Teardown waits for this to finish.
+        """
+        from psycopg2 import sql
+
+        def drop_query(conn):
+            query = sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(name))
+            if conn.server_version >= 130000:
+                # Disconnect anything the test left connected
+                query = query + sql.SQL(" WITH (FORCE)")
+            return query
+        self._drops = [f for f in self._drops if not f.done()]
+        self._drops.append(run_in_background(self._execute, drop_query))
+
+    def teardown(self):
+        if self._drops:
+            wait(self._drops, timeout=DROP_TIMEOUT)
+            self._drops = []
+        super(PostgresServer, self).teardown()
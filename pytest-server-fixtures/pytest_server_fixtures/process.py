@@ -0,0 +1,239 @@
+""" Process helpers for server fixtures.
+
+Servers are started in their own session, so they and any children they spawn can be
+signalled together as a process group. We wait for them to exit using pidfds where the
+platform has them, so we find out the moment they die rather than sleeping.
+"""
+import errno
+import logging
+import os
+import select
+import signal
+import socket
+import struct
+import time
+
+import psutil
+
+log = logging.getLogger(__name__)
+
+TCP_LISTEN = '0A'
+
+# Longest sleep between checks when waiting for a process without a pidfd
+MAX_POLL_INTERVAL = 0.05
+
+
+def _decode_address(hex_addr):
+    """ Decode an address from /proc/net/tcp{,6}, stored as 32-bit words in host byte order.
+    """
+    packed = b''.join(struct.pack('=I', int(hex_addr[i:i + 8], 16)) for i in range(0, len(hex_addr), 8))
+    if len(packed) == 4:
+        return socket.inet_ntop(socket.AF_INET, packed)
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+
+def _address_matches(address, ip):
+    return address == ip or address == '::ffff:' + ip
+
+
+def get_listening_inodes(ip, port):
+    """
+    Returns
+    -------
+    Set of socket inode numbers of TCP sockets listening on ip:port
+    """
+    inodes = set()
+    for table in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(table) as f:
+                lines = f.readlines()[1:]
+        except IOError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if fields[3] != TCP_LISTEN:
+                continue
+            hex_addr, hex_port = fields[1].split(':')
+            if int(hex_port, 16) == port and _address_matches(_decode_address(hex_addr), ip):
+                inodes.add(int(fields[9]))
+    return inodes
+
+
+def get_socket_owners(inodes):
+    """
+    Map socket inodes to the pids that have them open, by scanning /proc/<pid>/fd.
+    Processes we don't have permission to inspect are skipped.
+
+    Returns
+    -------
+    Dict of { inode: set of pids }
+    """
+    owners = {}
+    targets = set('socket:[%d]' % i for i in inodes)
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        fd_dir = '/proc/%s/fd' % pid
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                link = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if link in targets:
+                owners.setdefault(int(link[8:-1]), set()).add(int(pid))
+    return owners
+
+
+def find_listening_pids(ip, port):
+    """
+    Returns
+    -------
+    Sorted list of pids with a TCP socket listening on ip:port
+    """
+    return ListeningPidFinder(ip, port).find()
+
+
+class ListeningPidFinder(object):
+    """
+    Finds the pids listening on a port, for the duration of one kill cycle.
+
+    The expensive part is scanning every process' file descriptors, so that is only
+    redone when a new listening socket shows up. Repeat checks while we wait for the
+    server to die just re-read /proc/net/tcp.
+    """
+
+    def __init__(self, ip, port):
+        self.ip = ip
+        self.port = port
+        self._owners = {}
+
+    def find(self):
+        inodes = get_listening_inodes(self.ip, self.port)
+        unknown = inodes - set(self._owners)
+        if unknown:
+            owners = get_socket_owners(unknown)
+            # Remember sockets whose owners we can't see too, so we don't rescan for them
+            self._owners.update((inode, owners.get(inode, set())) for inode in unknown)
+        pids = set()
+        for inode in inodes:
+            pids.update(pid for pid in self._owners.get(inode, ()) if os.path.exists('/proc/%d' % pid))
+        return sorted(pids)
+
+
+def _is_dead(pid):
+    try:
+        return psutil.Process(pid).status() == psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return True
+
+
+def wait_for_exit(pid, timeout):
+    """
+    Wait up to `timeout` seconds for a process to exit. Zombies count as exited.
+
+    Returns
+    -------
+    True if the process has exited.
+    """
+    if hasattr(os, 'pidfd_open'):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            # No pidfd support in this kernel
+            pass
+        else:
+            try:
+                return bool(select.select([pidfd], [], [], max(timeout, 0))[0])
+            finally:
+                os.close(pidfd)
+
+    deadline = time.monotonic() + timeout
+    interval = 0.001
+    while not _is_dead(pid):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, MAX_POLL_INTERVAL)
+    return True
+
+
+def signal_process_group(pid, sig):
+    """
+    Send a signal to the process group led by `pid`, or just to `pid` if it isn't a group leader.
+
+    Returns
+    -------
+    False if the process doesn't exist
+    """
+    try:
+        pgid = os.getpgid(pid)
+        if pgid == pid and pgid != os.getpgrp():
+            log.debug("Signalling process group %s with signal %s" % (pgid, sig))
+            os.killpg(pgid, sig)
+        else:
+            log.debug("Signalling pid %s with signal %s" % (pid, sig))
+            os.kill(pid, sig)
+    except OSError as e:
+        if e.errno == errno.ESRCH:
+            return False
+        raise
+    return True
+
+
+def _send_signal(procs, sig):
+    for p in procs:
+        try:
+            p.send_signal(sig)
+        except psutil.NoSuchProcess:
+            pass
+
+
+def _wait_for_tree(leader, children, timeout):
+    """ Wait for the leader and its children to exit, returning those still alive.
+    """
+    deadline = time.monotonic() + timeout
+    wait_for_exit(leader.pid, timeout)
+    # The leader is left out of wait_procs, so psutil doesn't reap it from under its parent
+    _, alive = psutil.wait_procs(children, timeout=max(deadline - time.monotonic(), 0))
+    if not _is_dead(leader.pid):
+        alive.append(leader)
+    return alive
+
+
+def stop_process_tree(pid, sig=signal.SIGTERM, timeout=5, kill_timeout=5):
+    """
+    Stop a process, its process group and any other descendants.
+
+    Sends `sig` and waits for everything to exit, escalating to SIGKILL for anything
+    still running after `timeout` seconds.
+
+    Returns
+    -------
+    List of `psutil.Process` still alive after waiting `kill_timeout` seconds for the SIGKILL
+    """
+    try:
+        leader = psutil.Process(pid)
+        # Snapshot descendants first, some might have left the process group
+        children = leader.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return []
+    log.debug("Stopping process tree for %d (total_procs_to_kill=%d)" % (pid, len(children) + 1))
+
+    signal_process_group(pid, sig)
+    _send_signal(children, sig)
+    alive = _wait_for_tree(leader, children, timeout)
+
+    if alive and sig != signal.SIGKILL:
+        log.warning("%d processes still running after %s seconds, trying with SIGKILL" % (len(alive), timeout))
+        signal_process_group(pid, signal.SIGKILL)
+        children = [p for p in alive if p.pid != pid]
+        _send_signal(children, signal.SIGKILL)
+        alive = _wait_for_tree(leader, children, kill_timeout)
+    return alive
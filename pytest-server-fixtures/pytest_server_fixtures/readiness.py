@@ -0,0 +1,277 @@
+""" Event-driven readiness detection for server fixtures.
+
+Rather than only sleeping between calls to ``check_server_up``, we watch for signals
+that the server might have just come up and check it again straight away:
+
+ * a non-blocking TCP connect to the server port succeeding
+ * a line matching the server's 'ready' message appearing on its stdout/stderr
+ * the server process exiting, which fails the start-up immediately
+
+The exponential backoff polling remains as the fallback for servers that give none of these.
+"""
+import errno
+import logging
+import os
+import re
+import selectors
+import socket
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+from .trace import span
+
+log = logging.getLogger(__name__)
+
+# Delay between TCP connect attempts while the server port is still closed
+CONNECT_PROBE_INTERVAL = 0.01
+# How often to poll the server process when we can't get a pidfd for it
+PROCESS_POLL_INTERVAL = 0.05
+
+
+class ServerExitedError(ValueError):
+    """Thrown when the server process exits before it was ready."""
+    pass
+
+
+class LogLineWatcher(object):
+    """
+    Output listener that fires when a server prints a line matching ``pattern``.
+
+    It is selectable, so a `ReadinessMonitor` wakes up as soon as the line is seen.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = re.compile(pattern)
+        self.matched = False
+        self._lock = threading.Lock()
+        self._rfd, self._wfd = os.pipe()
+        os.set_blocking(self._rfd, False)
+
+    def __call__(self, line):
+        if self.matched or not self.pattern.search(line):
+            return
+        with self._lock:
+            if self.matched or self._wfd is None:
+                return
+            log.debug("Server ready line seen: %s" % line.strip())
+            self.matched = True
+            os.write(self._wfd, b'\0')
+
+    def fileno(self):
+        return self._rfd
+
+    def close(self):
+        with self._lock:
+            if self._wfd is None:
+                return
+            os.close(self._rfd)
+            os.close(self._wfd)
+            self._rfd = self._wfd = None
+
+
+class ReadinessMonitor(object):
+    """
+    Waits for readiness signals from a server that is starting up.
+
+    Parameters
+    ----------
+    hostname: `str`
+        Host to probe with non-blocking TCP connects. Probing is disabled if this or `port` is not set.
+    port: `int`
+        Port to probe
+    process: `subprocess.Popen`
+        Local server process. If it exits with a non-zero return code `ServerExitedError` is raised.
+        A zero return code is taken to mean the server has daemonised, and the process is no longer watched.
+    log_watcher: `LogLineWatcher`
+        Watcher attached to the server's output
+    """
+
+    def __init__(self, hostname=None, port=None, process=None, log_watcher=None):
+        self._selector = selectors.DefaultSelector()
+        self._addr_info = self._resolve(hostname, port)
+        self._sock = None
+        self._next_connect = 0
+        self._process = process
+        self._pidfd = None
+
+        if process is not None and hasattr(os, 'pidfd_open'):
+            try:
+                self._pidfd = os.pidfd_open(process.pid)
+                self._selector.register(self._pidfd, selectors.EVENT_READ, 'exit')
+            except OSError:
+                # Already gone, or the kernel doesn't support pidfds; we'll poll it instead
+                self._pidfd = None
+
+        if log_watcher is not None and not log_watcher.matched:
+            self._selector.register(log_watcher, selectors.EVENT_READ, 'log')
+
+    @staticmethod
+    def _resolve(hostname, port):
+        if not hostname or not port:
+            return None
+        try:
+            family, socktype, proto, _, sockaddr = socket.getaddrinfo(hostname, port, type=socket.SOCK_STREAM)[0]
+        except (socket.gaierror, TypeError, ValueError) as e:
+            log.debug("Not probing %s:%s, can't resolve it (%s)" % (hostname, port, e))
+            return None
+        return family, socktype, proto, sockaddr
+
+    def wait(self, timeout):
+        """
+        Wait up to `timeout` seconds for a readiness signal.
+
+        Each signal fires at most once, so callers can go straight back to checking the server
+        without risk of spinning.
+
+        Returns
+        -------
+        True if woken up by a signal, False if the timeout expired.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self._check_process()
+            now = time.monotonic()
+            if self._addr_info and self._sock is None and now >= self._next_connect:
+                if self._start_connect():
+                    return True
+            remaining = deadline - now
+            if remaining <= 0:
+                return False
+
+            select_timeout = remaining
+            if self._addr_info and self._sock is None:
+                select_timeout = min(select_timeout, max(self._next_connect - now, 0))
+            if self._process is not None and self._pidfd is None:
+                select_timeout = min(select_timeout, PROCESS_POLL_INTERVAL)
+            if not self._selector.get_map() and select_timeout > 0:
+                # Nothing to select on, selectors don't all accept an empty set
+                time.sleep(select_timeout)
+                continue
+
+            for key, _ in self._selector.select(select_timeout):
+                if key.data == 'log':
+                    self._selector.unregister(key.fileobj)
+                    return True
+                if key.data == 'connect' and self._finish_connect():
+                    return True
+                if key.data == 'exit':
+                    self._check_process(exited=True)
+
+    def _start_connect(self):
+        family, socktype, proto, sockaddr = self._addr_info
+        sock = socket.socket(family, socktype, proto)
+        sock.setblocking(False)
+        err = sock.connect_ex(sockaddr)
+        if err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+            self._sock = sock
+            self._selector.register(sock, selectors.EVENT_WRITE, 'connect')
+            return False
+        sock.close()
+        return self._connect_result(err)
+
+    def _finish_connect(self):
+        self._selector.unregister(self._sock)
+        err = self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        self._sock.close()
+        self._sock = None
+        return self._connect_result(err)
+
+    def _connect_result(self, err):
+        if err == 0:
+            log.debug("Server port is accepting connections")
+            # Once the port is open we leave the rest to check_server_up
+            self._addr_info = None
+            return True
+        self._next_connect = time.monotonic() + CONNECT_PROBE_INTERVAL
+        return False
+
+    def _check_process(self, exited=False):
+        if self._process is None:
+            return
+        if exited:
+            # The pidfd fires before whichever thread is waiting on the process has reaped it
+            try:
+                self._process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                pass
+        returncode = self._process.poll()
+        if returncode is None:
+            return
+        if returncode != 0:
+            raise ServerExitedError("Server process exited with return code %s before it was ready"
+                                    % returncode)
+        log.debug("Server process exited cleanly, assuming it has daemonised")
+        self._stop_watching_process()
+
+    def _stop_watching_process(self):
+        self._process = None
+        if self._pidfd is not None:
+            self._selector.unregister(self._pidfd)
+            os.close(self._pidfd)
+            self._pidfd = None
+
+    def close(self):
+        self._stop_watching_process()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        self._selector.close()
+
+
+def wait_for_go(check_server_up, monitor=None, start_interval=0.1, retries_per_interval=3, retry_limit=28,
+                base=2.0):
+    """
+    Wait until `check_server_up` returns True.
+
+    Uses a binary exponential backoff algorithm to set wait interval
+    between retries. This finds the happy medium between quick starting
+    servers (e.g. in-memory DBs) while remaining useful for the slower
+    starting servers (e.g. web servers). If a `ReadinessMonitor` is given the
+    wait is cut short as soon as it sees a readiness signal.
+
+    Parameters
+    ----------
+    check_server_up: ``callable``
+        returns True once the server is up
+    monitor: `ReadinessMonitor`
+        optional source of readiness signals
+    start_interval: ``float``
+        initial wait interval in seconds
+    retries_per_interval: ``int``
+        number of retries before increasing waiting time
+    retry_limit: ``int``
+        total number of retries to attempt before giving up
+    base: ``float``
+        backoff multiplier
+
+    """
+    if start_interval <= 0.0:
+        raise ValueError('start interval must be positive!')
+
+    interval = start_interval
+
+    retry_count = retry_limit
+    start_time = datetime.now()
+    while retry_count > 0:
+        with span('check_server_up', attempt=retry_limit - retry_count + 1):
+            up = check_server_up()
+        if up:
+            log.debug('waited %s for server to start successfully'
+                      % str(datetime.now() - start_time))
+            return
+
+        log.debug('waiting up to %s before retrying (%d of %d)'
+                  % (interval, ((retry_limit + 1) - retry_count), retry_limit))
+        if monitor is None:
+            time.sleep(interval)
+        elif monitor.wait(interval):
+            # Woken up by a readiness signal - check again, this doesn't count as a retry
+            continue
+        retry_count -= 1
+        if (retry_limit - retry_count) % retries_per_interval == 0:
+            interval *= base
+
+    raise ValueError("Server failed to start up after waiting %s. Giving up!"
+                     % str(datetime.now() - start_time))
@@ -0,0 +1,168 @@
+""" Clean up servers left behind by test sessions that were killed before they could tear down.
+
+Each test session holds a shared lock on a lock file named after its session id for as long
+as it runs. The kernel drops the lock when the session's processes die, so a session whose
+lock file can be locked exclusively is dead. Anything tagged with a dead session's id is
+removed: local server processes (tagged through their environment), docker containers and
+kubernetes pods (tagged with the session-id label).
+
+`start` runs this in a background thread at the start of the session, see
+`pytest_server_fixtures.plugin`.
+"""
+import logging
+import os
+import signal
+import threading
+
+import psutil
+
+from pytest_server_fixtures import CONFIG
+from . import locks
+from .locks import get_lock_dir, try_lock
+from .process import stop_process_tree
+
+log = logging.getLogger(__name__)
+
+LOCK_KIND = 'sessions'
+
+# Environment variable set on local server processes, holding the id of the session that started them
+SESSION_ENV = 'SERVER_FIXTURES_OWNER_SESSION'
+
+_session_lock = None
+_lock = threading.Lock()
+
+
+def server_env(env):
+    """
+    Returns
+    -------
+    Copy of the environment `env` for a server process, tagged with our session id
+    """
+    env = dict(env)
+    env[SESSION_ENV] = CONFIG.session_id
+    return env
+
+
+def hold_session_lock():
+    """
+    Mark this session as alive, until this process exits.
+    """
+    global _session_lock
+    with _lock:
+        if _session_lock is None:
+            # Shared, as pytest-xdist workers can share a session id
+            _session_lock = try_lock(LOCK_KIND, CONFIG.session_id, shared=True)
+
+
+def find_dead_sessions():
+    """
+    Returns
+    -------
+    Dict of { session id: `locks.FileLock` } for dead sessions. The locks stop other
+    processes reaping the same sessions, release them when done.
+    """
+    if locks.fcntl is None:
+        # Without real locks every session would look dead
+        return {}
+    try:
+        names = os.listdir(get_lock_dir(LOCK_KIND))
+    except OSError:
+        return {}
+    dead = {}
+    for name in names:
+        session_id, ext = os.path.splitext(name)
+        if ext != '.lock' or session_id == CONFIG.session_id:
+            continue
+        lock = try_lock(LOCK_KIND, session_id)
+        if lock is not None:
+            dead[session_id] = lock
+    return dead
+
+
+def reap_processes(session_ids):
+    """
+    Kill local server processes started by the given sessions.
+    """
+    for proc in psutil.process_iter():
+        try:
+            owner = proc.environ().get(SESSION_ENV)
+        except (psutil.AccessDenied, psutil.NoSuchProcess, psutil.ZombieProcess):
+            continue
+        if owner in session_ids:
+            log.info("Killing server process %d left by session %s" % (proc.pid, owner))
+            stop_process_tree(proc.pid, sig=signal.SIGKILL)
+
+
+def reap_containers(session_ids):
+    """
+    Remove docker containers started by the given sessions. Reusable containers are left
+    for `serverclass.docker.reap_idle_containers` to remove.
+    """
+    try:
+        import docker
+    except ImportError:
+        return
+    try:
+        client = docker.from_env()
+        containers = client.containers.list(all=True, filters={'label': 'server-fixtures=docker-server-fixtures'})
+    except docker.errors.DockerException as e:
+        log.debug("Not reaping docker containers: %s" % e)
+        return
+    for container in containers:
+        labels = container.labels
+        if labels.get('server-fixtures/session-id') in session_ids and 'server-fixtures/reuse-key' not in labels:
+            log.info("Removing container %s left by a dead session" % container.name)
+            try:
+                container.remove(force=True)
+            except docker.errors.APIError as e:
+                log.warning("Failed to remove container %s: %s" % (container.name, e))
+
+
+def reap_pods(session_ids):
+    """
+    Delete kubernetes pods started by the given sessions.
+    """
+    from .serverclass.kubernetes import delete_session_pods
+    delete_session_pods(session_ids)
+
+
+def reap():
+    """
+    Remove everything left behind by dead sessions.
+    """
+    dead = find_dead_sessions()
+    if not dead:
+        return
+    session_ids = set(dead)
+    log.info("Cleaning up after dead sessions: %s" % ", ".join(sorted(session_ids)))
+    try:
+        reap_processes(session_ids)
+        reap_containers(session_ids)
+        if CONFIG.server_class == 'kubernetes':
+            reap_pods(session_ids)
+    finally:
+        for lock in dead.values():
+            os.unlink(lock.path)
+            lock.release()
+
+
+def _reap_in_background():
+    try:
+        reap()
+    except Exception as e:
+        log.warning("Failed to clean up after dead sessions: %s" % e)
+
+
+def start():
+    """
+    Mark this session as alive, and clean up after dead sessions in a background thread.
+
+    Returns
+    -------
+    The reaper thread
+    """
+    hold_session_lock()
+    thread = threading.Thread(target=_reap_in_background, name='server-fixtures-reaper')
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -4,29 +4,58 @@ Created on 25 Apr 2012
 @author: eeaston
 
 '''
+import csv
+import io
+import json
+import os
 import socket
+import threading
 
 import pytest
 
 from pytest_server_fixtures import CONFIG
 from pytest_fixture_config import requires_config
 
+from . import snapshot
+from .background import run_in_background
 from .base2 import TestServerV2
+from .group import ServerTopology
+from .pool import server_pool
 
+# Number of commands sent to the server in each round trip when seeding
+SEED_BATCH_SIZE = 10000
 
-def _redis_server(request):
+# Number of hash slots in a Redis cluster
+CLUSTER_SLOTS = 16384
+
+
+def _redis_server(request, pool=None):
     """ Does the redis server work, this is used within different scoped
         fixtures.
     """
+    if pool is not None:
+        test_server = pool.acquire()
+        request.addfinalizer(lambda p=test_server: pool.release(p))
+        return test_server
+
     test_server = RedisTestServer()
     request.addfinalizer(lambda p=test_server: p.teardown())
     test_server.start()
     return test_server
 
 
+@pytest.fixture(scope='session')
+@requires_config(CONFIG, ['redis_executable'])
+def redis_server_pool(request):
+    """ Session-scoped pool of pre-started Redis servers for the redis_server fixture.
+        This is None unless SERVER_FIXTURES_POOL_SIZE is set.
+    """
+    return server_pool(request, RedisTestServer)
+
+
 @pytest.fixture(scope='function')
 @requires_config(CONFIG, ['redis_executable'])
-def redis_server(request):
+def redis_server(request, redis_server_pool):
     """ Function-scoped Redis server in a local thread.
 
         Attributes
@@ -34,7 +63,7 @@ def redis_server(request):
         api: (``redis.Redis``)   Redis client API connected to this server
         .. also inherits all attributes from the `workspace` fixture
     """
-    return _redis_server(request)
+    return _redis_server(request, redis_server_pool)
 
 
 @pytest.fixture(scope='session')
@@ -45,17 +74,290 @@ def redis_server_sess(request):
     return _redis_server(request)
 
 
+@pytest.fixture(scope='session')
+@requires_config(CONFIG, ['redis_executable'])
+def redis_db_pool(request, redis_server_sess):
+    """ Session-scoped pool of the logical databases of the redis_server_sess server, used by redis_db.
+    """
+    return RedisDatabasePool(redis_server_sess)
+
+
+@pytest.fixture(scope='function')
+@requires_config(CONFIG, ['redis_executable'])
+def redis_db(request, redis_db_pool):
+    """ Function-scoped Redis database of its own on the session-scoped Redis server.
+        Much quicker than starting a server for each test with redis_server.
+
+        Attributes
+        ----------
+        api: (``redis.Redis``)   Redis client API connected to this database
+        db: (``int``)            Database index
+        server: (``RedisTestServer``)   The shared server
+    """
+    database = redis_db_pool.acquire()
+    request.addfinalizer(lambda d=database: redis_db_pool.release(d))
+    return database
+
+
+@pytest.fixture(scope='session')
+@requires_config(CONFIG, ['redis_executable'])
+def redis_cluster_sess(request):
+    """ Session-scoped Redis cluster of three primaries, each with a replica.
+
+        Attributes
+        ----------
+        api: (``redis.cluster.RedisCluster``)   Cluster client API
+        nodes: (``list``)   The `RedisTestServer` nodes
+    """
+    cluster = RedisClusterTestServer(primaries=3, replicas_per_primary=1)
+    request.addfinalizer(cluster.teardown)
+    cluster.start()
+    return cluster
+
+
+@pytest.fixture(scope='session')
+@requires_config(CONFIG, ['redis_executable'])
+def redis_replicated_sess(request):
+    """ Session-scoped Redis primary with two replicas.
+
+        Attributes
+        ----------
+        api: (``redis.Redis``)   Redis client API connected to the primary
+        primary: (``RedisTestServer``)   The primary
+        replicas: (``list``)   The replica `RedisTestServer`s
+    """
+    servers = RedisReplicatedTestServer(replicas=2)
+    request.addfinalizer(servers.teardown)
+    servers.start()
+    return servers
+
+
+def _json_commands(f):
+    for key, value in json.load(f).items():
+        if isinstance(value, dict):
+            if value:
+                yield ('HSET', key) + tuple(i for item in value.items() for i in item)
+        elif isinstance(value, list):
+            if value:
+                yield ('RPUSH', key) + tuple(value)
+        else:
+            yield ('SET', key, value)
+
+
+def _csv_commands(f):
+    for row in csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline='')):
+        if row:
+            yield tuple(row)
+
+
+def _resp_line(f):
+    line = f.readline()
+    if not line.endswith(b'\r\n'):
+        raise ValueError("Truncated RESP data")
+    return line[:-2]
+
+
+def _resp_commands(f):
+    while True:
+        line = f.readline()
+        if not line.strip():
+            if not line:
+                return
+            continue
+        if not line.startswith(b'*'):
+            raise ValueError("Expected a RESP array, got %r" % line)
+        args = []
+        for _ in range(int(line[1:])):
+            header = _resp_line(f)
+            if not header.startswith(b'$'):
+                raise ValueError("Expected a RESP bulk string, got %r" % header)
+            args.append(f.read(int(header[1:])))
+            _resp_line(f)
+        yield tuple(args)
+
+
+SEED_READERS = {
+    'json': _json_commands,
+    'csv': _csv_commands,
+    'resp': _resp_commands,
+}
+
+
+def read_seed_commands(path, format=None):
+    """
+    Read the Redis commands to seed a server with from a file. Formats are:
+
+        json: an object of keys to values. Strings and numbers are SET, lists are RPUSHed and
+              objects are HSET.
+        csv:  a command and its arguments on each row, eg. SET,foo,bar
+        resp: commands in the Redis protocol, as used by the mass insertion of `redis-cli --pipe`
+
+    Parameters
+    ----------
+    path: `str`
+        Path of the file
+    format: `str`
+        One of the formats above, by default the file's extension
+
+    Returns
+    -------
+    Generator of commands, as tuples of the command name and its arguments
+    """
+    format = format or os.path.splitext(str(path))[1].lstrip('.').lower()
+    if format not in SEED_READERS:
+        raise ValueError("Unknown seed file format %r, use one of %s" % (format, ', '.join(sorted(SEED_READERS))))
+    with open(str(path), 'rb') as f:
+        for command in SEED_READERS[format](f):
+            yield command
+
+
+def seed(client, source, format=None, batch_size=SEED_BATCH_SIZE):
+    """
+    Load data into Redis, sending the commands in pipelined batches rather than
+    making a round trip for each of them.
+
+    Parameters
+    ----------
+    client: `redis.Redis`
+        Client for the server and database to seed
+    source: `str` or iterable
+        Path of a seed file (see `read_seed_commands`), or an iterable of commands
+    format: `str`
+        Format of the seed file, by default its extension
+    batch_size: `int`
+        Number of commands to send in each round trip
+
+    Returns
+    -------
+    The number of commands run
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = read_seed_commands(source, format)
+    pipe = client.pipeline(transaction=False)
+    count = 0
+    for command in source:
+        pipe.execute_command(*command)
+        count += 1
+        if count % batch_size == 0:
+            pipe.execute()
+    pipe.execute()
+    return count
+
+
+class RedisDatabasePoolExhausted(Exception):
+    """Thrown when all the databases of a Redis server are in use."""
+    pass
+
+
+class RedisDatabase(object):
+    """ One logical database of a shared Redis server.
+    """
+
+    def __init__(self, server, db):
+        self.server = server
+        self.db = db
+        self._api = None
+
+    @property
+    def hostname(self):
+        return self.server.hostname
+
+    @property
+    def port(self):
+        return self.server.port
+
+    @property
+    def api(self):
+        if not self._api:
+            self._api = redis.Redis(host=self.hostname, port=self.port, db=self.db)
+        return self._api
+
+    def seed(self, source, format=None):
+        """ Load data into this database, see `seed`.
+        """
+        return seed(self.api, source, format)
+
+
+class RedisDatabasePool(object):
+    """
+    Hands out the logical databases of one Redis server, so tests can share the server without
+    seeing each other's keys. Released databases are flushed in the background. The server's
+    own `db` is never handed out, as its `api` client and `redis_server` users write to it.
+
+    Parameters
+    ----------
+    server: `RedisTestServer`
+        The running server
+    timeout: `float`
+        Seconds to wait for a database to be released when they are all in use
+    """
+
+    def __init__(self, server, timeout=30):
+        self.server = server
+        self.timeout = timeout
+        self._free = [db for db in range(server.databases) if db != server.db]
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        Returns
+        -------
+        A `RedisDatabase` of our own, waiting for one to be released if they are all in use.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._free, self.timeout):
+                raise RedisDatabasePoolExhausted("All %d databases of %s:%s are in use, set "
+                                                 "SERVER_FIXTURES_REDIS_DATABASES to have more"
+                                                 % (self.server.databases, self.server.hostname, self.server.port))
+            return RedisDatabase(self.server, self._free.pop(0))
+
+    def release(self, database):
+        """
+        Flush the database's keys and return it to the pool, without holding up the caller.
+        """
+        run_in_background(self._flush, database)
+
+    def _flush(self, database):
+        try:
+            # Unlinks the keys straight away, and frees them in a server thread
+            database.api.flushdb(asynchronous=True)
+        finally:
+            database.api.connection_pool.disconnect()
+        # Not returned to the pool if the flush failed, as it might still hold keys
+        with self._cond:
+            self._free.append(database.db)
+            self._cond.notify()
+
+
 class RedisTestServer(TestServerV2):
     """This will look for 'redis_executable' in configuration and use as the
     redis-server to run.
+
+    Parameters
+    ----------
+    db: `int`
+        Database the `api` client uses
+    databases: `int`
+        Number of databases, by default CONFIG.redis_databases
+    rdb: `str`
+        Path of a dump.rdb file for the server to load on start-up, which is much quicker
+        than seeding large datasets. Only supported by the 'thread' server class.
+    extra_args: `list`
+        More arguments for redis-server
     """
+    ready_log_pattern = r'[Rr]eady to accept connections'
 
-    def __init__(self, db=0, delete=True, **kwargs):
+    def __init__(self, db=0, delete=True, databases=None, rdb=None, extra_args=None, **kwargs):
         global redis
         import redis
 
         super(RedisTestServer, self).__init__(delete=delete, **kwargs)
         self.db = db
+        self.databases = databases or CONFIG.redis_databases
+        self.rdb = rdb
+        self.extra_args = list(extra_args or [])
+        if rdb and self._server_class != 'thread':
+            raise ValueError("Loading an rdb file is only supported by the 'thread' server class")
         self._api = None
         self._port = self._get_port(6379)
 
@@ -81,13 +383,19 @@ class RedisTestServer(TestServerV2):
             "--port", str(self.port),
             "--timeout", "0",
             "--loglevel", "notice",
-            "--databases", "1",
+            "--databases", str(self.databases),
             "--maxmemory", "2gb",
             "--maxmemory-policy", "noeviction",
             "--appendonly", "no",
             "--slowlog-log-slower-than", "-1",
             "--slowlog-max-len", "1024",
         ]
+        if self._server_class == 'thread':
+            # Otherwise dump.rdb and nodes.conf files end up in the current directory
+            cmd += ["--dir", str(self.workspace)]
+        if self.rdb:
+            cmd += ["--dbfilename", "dump.rdb"]
+        cmd += self.extra_args
 
         return cmd
 
@@ -99,6 +407,21 @@ class RedisTestServer(TestServerV2):
     def port(self):
         return self._port
 
+    def pre_setup(self):
+        if self.rdb:
+            # The server may write to it, so it gets its own copy
+            snapshot.clone_file(str(self.rdb), str(self.workspace / 'dump.rdb'))
+
+    def seed(self, source, format=None):
+        """ Load data into the `db` database, see `seed`.
+        """
+        return seed(self.api, source, format)
+
+    def reset(self):
+        """ Delete all the keys left by the last user of a reused server
+        """
+        self.api.flushall()
+
     def check_server_up(self):
         """ Ping the server
         """
@@ -114,3 +437,125 @@ class RedisTestServer(TestServerV2):
         except redis.ConnectionError as e:
             print("server not up yet (%s)" % e)
             return False
+
+
+def _replication_link_up(server):
+    return server.api.info('replication').get('master_link_status') == 'up'
+
+
+def _cluster_info(server):
+    info = server.api.execute_command('CLUSTER INFO')
+    if isinstance(info, dict):
+        return info
+    if isinstance(info, bytes):
+        info = info.decode('utf-8')
+    return dict(line.split(':', 1) for line in info.splitlines() if ':' in line)
+
+
+class RedisReplicatedTestServer(ServerTopology):
+    """
+    A Redis primary and its replicas. All the servers start at the same time, then the
+    replicas are pointed at the primary, and `start` waits for their replication links to come up.
+
+    Parameters
+    ----------
+    replicas: `int`
+        Number of replicas
+    kwargs:
+        Arguments for each `RedisTestServer`
+    """
+
+    def __init__(self, replicas=1, **kwargs):
+        servers = {'primary': RedisTestServer(**kwargs)}
+        servers.update(('replica-%d' % i, RedisTestServer(**kwargs)) for i in range(replicas))
+        super(RedisReplicatedTestServer, self).__init__(**servers)
+
+    @property
+    def primary(self):
+        return self['primary']
+
+    @property
+    def replicas(self):
+        return [server for name, server in sorted(self.servers.items()) if name != 'primary']
+
+    @property
+    def api(self):
+        return self.primary.api
+
+    def connect(self):
+        for replica in self.replicas:
+            replica.api.execute_command('REPLICAOF', self.primary.hostname, self.primary.port)
+        for replica in self.replicas:
+            self.wait_until(lambda: _replication_link_up(replica),
+                            "%s:%s to replicate %s:%s" % (replica.hostname, replica.port,
+                                                          self.primary.hostname, self.primary.port))
+
+
+class RedisClusterTestServer(ServerTopology):
+    """
+    A Redis cluster. All the nodes start at the same time, then the hash slots are split evenly
+    between the primaries, the nodes are introduced to each other and replicas are assigned to
+    the primaries. `start` waits for the cluster state to be ok on every node.
+
+    Parameters
+    ----------
+    primaries: `int`
+        Number of primary nodes, holding the hash slots
+    replicas_per_primary: `int`
+        Number of replica nodes for each primary
+    node_timeout: `int`
+        Milliseconds before an unreachable node is failed over
+    kwargs:
+        Arguments for each `RedisTestServer`
+    """
+
+    def __init__(self, primaries=3, replicas_per_primary=0, node_timeout=5000, **kwargs):
+        self.primaries = primaries
+        self.replicas_per_primary = replicas_per_primary
+        args = ['--cluster-enabled', 'yes',
+                '--cluster-config-file', 'nodes.conf',
+                '--cluster-node-timeout', str(node_timeout)]
+        nodes = [RedisTestServer(databases=1, extra_args=args, **kwargs)
+                 for _ in range(primaries * (1 + replicas_per_primary))]
+        super(RedisClusterTestServer, self).__init__(**dict(('node-%d' % i, node) for i, node in enumerate(nodes)))
+        self.nodes = nodes
+        self._api = None
+
+    @property
+    def api(self):
+        if not self._api:
+            from redis.cluster import RedisCluster, ClusterNode
+            self._api = RedisCluster(startup_nodes=[ClusterNode(n.hostname, n.port) for n in self.nodes])
+        return self._api
+
+    def connect(self):
+        primaries = self.nodes[:self.primaries]
+        for i, node in enumerate(primaries):
+            slots = range(i * CLUSTER_SLOTS // self.primaries, (i + 1) * CLUSTER_SLOTS // self.primaries)
+            node.api.execute_command('CLUSTER ADDSLOTS', *slots)
+
+        first = self.nodes[0]
+        for node in self.nodes[1:]:
+            node.api.execute_command('CLUSTER MEET', first.hostname, first.port)
+        self.wait_until(lambda: all(int(_cluster_info(n)['cluster_known_nodes']) == len(self.nodes)
+                                    for n in self.nodes),
+                        "the cluster nodes to meet")
+
+        for i, node in enumerate(self.nodes[self.primaries:]):
+            primary = primaries[i % self.primaries]
+            primary_id = primary.api.execute_command('CLUSTER MYID')
+            if isinstance(primary_id, bytes):
+                primary_id = primary_id.decode('utf-8')
+            node.api.execute_command('CLUSTER REPLICATE', primary_id)
+
+        self.wait_until(lambda: all(_cluster_info(n)['cluster_state'] == 'ok' for n in self.nodes),
+                        "the cluster state to be ok")
+        for node in self.nodes[self.primaries:]:
+            self.wait_until(lambda: _replication_link_up(node),
+                            "%s:%s to replicate its primary" % (node.hostname, node.port))
+
+    def teardown(self):
+        if self._api is not None:
+            self._api.close()
+            self._api = None
+        super(RedisClusterTestServer, self).teardown()
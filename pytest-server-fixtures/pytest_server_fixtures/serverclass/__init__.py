@@ -13,6 +13,7 @@ def create_server(server_class, **kwargs):
             workspace=kwargs["workspace"],
             cwd=kwargs["cwd"],
             listen_hostname=kwargs["listen_hostname"],
+            server_log=kwargs.get("server_log"),
         )
 
     if server_class == 'docker':
@@ -35,4 +36,5 @@ def create_server(server_class, **kwargs):
             env=kwargs["env"],
             image=kwargs["image"],
             labels=kwargs["labels"],
+            pod=kwargs.get("kubernetes_pod"),
         )
@@ -32,6 +32,8 @@ class ServerFixtureNotTerminatedException(Exception):
 
 class ServerClass(threading.Thread):
     """Example interface for ServerClass."""
+    # Set by launch() when it reused an already running server rather than starting a new one
+    reused = False
 
     def __init__(self,
                  cmd,
@@ -73,6 +75,11 @@ class ServerClass(threading.Thread):
         """Get server's hostname."""
         raise NotImplementedError("Concrete class should implement this")
 
+    @property
+    def process(self):
+        """Local process running the server, if there is one."""
+        return None
+
     @property
     def name(self):
         return "server-fixtures-%s-%s" % (CONFIG.session_id, self._id)
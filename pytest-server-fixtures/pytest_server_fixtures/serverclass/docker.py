@@ -1,18 +1,88 @@
 """
 Docker server class implementation.
+
+With SERVER_FIXTURES_DOCKER_REUSE set, containers are left running after teardown and
+handed to the next fixture that needs a container with the same image, command and
+environment. A container in use is claimed with a lock file named after the container,
+whose modification time records when it was last released. Containers left idle for
+longer than SERVER_FIXTURES_DOCKER_REUSE_TTL seconds are removed.
 """
+import hashlib
+import json
 import logging
+import os
+import time
+
 import docker
 
-from retry import retry
 from pytest_server_fixtures import CONFIG
+from pytest_server_fixtures.locks import try_lock
 from .common import (ServerClass,
                      merge_dicts,
                      ServerFixtureNotRunningException,
                      ServerFixtureNotTerminatedException)
+from .docker_events import CONTAINER_EVENTS
 
 log = logging.getLogger(__name__)
 
+REUSE_SESSION = 'session'  # Reuse containers within this test session
+REUSE_GLOBAL = 'global'  # Reuse containers across test sessions
+
+REUSE_KEY_LABEL = 'server-fixtures/reuse-key'
+SESSION_ID_LABEL = 'server-fixtures/session-id'
+LOCK_KIND = 'docker'
+
+# How long to wait for a container to start or go away
+CONTAINER_TIMEOUT = 240
+# How often to double-check the container status while waiting for its events, in case we missed them
+EVENT_CHECK_INTERVAL = 1.0
+
+
+def get_reuse_key(image, command, env):
+    """
+    Returns
+    -------
+    Hash identifying containers that can stand in for each other
+    """
+    spec = [image, command, sorted((env or {}).items())]
+    return hashlib.sha1(json.dumps(spec, default=str).encode('utf-8')).hexdigest()
+
+
+def reap_idle_containers(client, ttl=None, session_id=None):
+    """
+    Remove reusable containers that nobody has claimed for `ttl` seconds, or that have stopped.
+
+    Parameters
+    ----------
+    client: `docker.DockerClient`
+        Docker client
+    ttl: `int`
+        Idle time in seconds, defaults to CONFIG.docker_reuse_ttl
+    session_id: `str`
+        Only remove containers started by this test session
+    """
+    if ttl is None:
+        ttl = CONFIG.docker_reuse_ttl
+    labels = [REUSE_KEY_LABEL]
+    if session_id:
+        labels.append('%s=%s' % (SESSION_ID_LABEL, session_id))
+    for container in client.containers.list(all=True, filters={'label': labels}):
+        claim = try_lock(LOCK_KIND, container.name)
+        if claim is None:
+            # In use
+            continue
+        try:
+            idle = time.time() - os.path.getmtime(claim.path)
+            if container.status == 'running' and idle < ttl:
+                continue
+            log.debug("Removing idle container %s", container.name)
+            container.remove(force=True)
+            os.unlink(claim.path)
+        except (OSError, docker.errors.APIError) as e:
+            log.warning("Failed to remove idle container %s: %s", container.name, e)
+        finally:
+            claim.release()
+
 
 class DockerServer(ServerClass):
     """Docker server class."""
@@ -30,23 +100,47 @@ class DockerServer(ServerClass):
         self._labels = merge_dicts(labels, {
             'server-fixtures': 'docker-server-fixtures',
             'server-fixtures/server-type': server_type,
-            'server-fixtures/session-id': CONFIG.session_id,
+            SESSION_ID_LABEL: CONFIG.session_id,
         })
 
         self._client = docker.from_env()
         self._container = None
+        self._reuse = CONFIG.docker_reuse
+        self._claim = None
 
     def launch(self):
+        command = [self._cmd] + self._get_args()
+        labels = self._labels
+        if self._reuse:
+            key = get_reuse_key(self._image, command, self._env)
+            reap_idle_containers(self._client)
+            self._container = self._claim_container(key)
+            if self._container:
+                log.debug('Reusing container %s', self._container.name)
+                self.reused = True
+                return
+            # Claim the new container's name before it exists, so nobody else can grab it
+            self._claim = try_lock(LOCK_KIND, self.name)
+            if self._claim:
+                labels = merge_dicts(labels, {REUSE_KEY_LABEL: key})
+            else:
+                # Nobody else could tell it's in use, so it can't be shared: treat it as a normal container
+                log.debug("Can't claim container %s, it won't be reused", self.name)
+        reusable = self._claim is not None
+
+        # Listen for events before the container exists, so we don't miss any
+        CONTAINER_EVENTS.start()
         try:
             log.debug('Launching container')
             self._container = self._client.containers.run(
                 image=self._image,
                 name=self.name,
-                command=[self._cmd] + self._get_args(),
+                command=command,
                 environment=self._env,
-                labels=self._labels,
+                labels=labels,
                 detach=True,
-                auto_remove=True,
+                # Reusable containers need to survive being stopped
+                auto_remove=not reusable,
             )
             self._wait_until_running()
             log.debug('Container is running at %s', self.hostname)
@@ -58,7 +152,32 @@ class DockerServer(ServerClass):
             log.warning("Failed to start container: %s", e)
             raise
 
-        self.start()
+        if not reusable:
+            # Reusable containers outlive this fixture, so there's no point waiting for them
+            self.start()
+
+    def _claim_container(self, key):
+        """ Claim a running container with this reuse key that isn't in use, if there is one.
+        """
+        labels = ['%s=%s' % (REUSE_KEY_LABEL, key)]
+        if self._reuse == REUSE_SESSION:
+            labels.append('%s=%s' % (SESSION_ID_LABEL, CONFIG.session_id))
+        for container in self._client.containers.list(filters={'label': labels, 'status': 'running'}):
+            claim = try_lock(LOCK_KIND, container.name)
+            if claim is None:
+                continue
+            try:
+                # It might have been reaped since we listed it
+                container.reload()
+            except docker.errors.NotFound:
+                claim.release()
+                continue
+            if container.status != 'running':
+                claim.release()
+                continue
+            self._claim = claim
+            return container
+        return None
 
     def run(self):
         try:
@@ -71,12 +190,23 @@ class DockerServer(ServerClass):
         if not self._container:
             return
 
+        if self._claim:
+            # Leave the container running for the next fixture, and record when it was last used
+            log.debug('Releasing container %s for reuse', self._container.name)
+            self._claim.touch()
+            self._claim.release()
+            self._claim = None
+            self._container = None
+            return
+
         try:
             # stopping container will also remove it as 'auto_remove' is set
             self._container.stop()
             self._wait_until_terminated()
         except docker.errors.APIError as e:
             log.warning("Error when stopping the container: %s", e)
+        finally:
+            CONTAINER_EVENTS.forget(self._container.id)
 
     @property
     def is_running(self):
@@ -99,24 +229,24 @@ class DockerServer(ServerClass):
             log.warning("Failed to get container status: %s", e)
             raise
 
-    @retry(ServerFixtureNotRunningException,
-           tries=28,
-           delay=1,
-           backoff=2,
-           max_delay=10)
     def _wait_until_running(self):
-        if not self.is_running:
-            raise ServerFixtureNotRunningException()
+        deadline = time.monotonic() + CONTAINER_TIMEOUT
+        while not self.is_running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or 'die' in CONTAINER_EVENTS.seen(self._container.id):
+                raise ServerFixtureNotRunningException()
+            CONTAINER_EVENTS.wait(self._container.id, ('start', 'die'), min(remaining, EVENT_CHECK_INTERVAL))
 
-    @retry(ServerFixtureNotTerminatedException,
-           tries=28,
-           delay=1,
-           backoff=2,
-           max_delay=10)
     def _wait_until_terminated(self):
-        try:
-            self._get_status()
-        except docker.errors.APIError as e:
-            if e.response.status_code == 404:
-                return
-            raise
+        deadline = time.monotonic() + CONTAINER_TIMEOUT
+        while not CONTAINER_EVENTS.wait(self._container.id, ('destroy',), 0):
+            try:
+                self._get_status()
+            except docker.errors.APIError as e:
+                if e.response.status_code == 404:
+                    return
+                raise
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ServerFixtureNotTerminatedException()
+            CONTAINER_EVENTS.wait(self._container.id, ('destroy',), min(remaining, EVENT_CHECK_INTERVAL))
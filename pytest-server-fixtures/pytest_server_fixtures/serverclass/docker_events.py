@@ -0,0 +1,96 @@
+"""
+Docker events for server fixture containers, read by a single thread for the whole session.
+
+`DockerServer` waits on these to find out as soon as its container has started, died or been
+removed, rather than polling the container status.
+"""
+import logging
+import threading
+import time
+
+import docker
+
+log = logging.getLogger(__name__)
+
+# Label set on all server fixture containers
+FIXTURE_LABEL = 'server-fixtures=docker-server-fixtures'
+EVENTS = ('start', 'die', 'destroy')
+
+
+class ContainerEvents(object):
+    """
+    Records the events seen for each server fixture container. The listener thread is started
+    on first use, and restarted if the event stream breaks.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seen = {}
+        self._thread = None
+
+    def start(self):
+        """
+        Make sure the listener is running. Call this before creating a container, so none of
+        its events are missed.
+        """
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='server-fixtures-docker-events')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        try:
+            # The listener gets its own client, as the event stream holds on to its connection
+            client = docker.from_env()
+            for event in client.events(decode=True, filters={'type': 'container',
+                                                             'label': FIXTURE_LABEL,
+                                                             'event': list(EVENTS)}):
+                container_id = event.get('id') or event.get('Actor', {}).get('ID')
+                action = event.get('Action') or event.get('status')
+                with self._cond:
+                    self._seen.setdefault(container_id, set()).add(action)
+                    self._cond.notify_all()
+        except Exception as e:
+            log.warning("Docker event stream failed: %s", e)
+        finally:
+            with self._cond:
+                self._thread = None
+
+    def seen(self, container_id):
+        """
+        Returns
+        -------
+        Set of the events seen so far for a container
+        """
+        with self._cond:
+            return set(self._seen.get(container_id, ()))
+
+    def wait(self, container_id, events, timeout):
+        """
+        Wait up to `timeout` seconds for any of `events` to happen to a container.
+
+        Returns
+        -------
+        Set of those events seen for the container, empty if none were seen in time.
+        """
+        events = set(events)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                found = self._seen.get(container_id, set()) & events
+                remaining = deadline - time.monotonic()
+                if found or remaining <= 0:
+                    return found
+                self._cond.wait(remaining)
+
+    def forget(self, container_id):
+        """
+        Drop the events recorded for a container that has gone away.
+        """
+        with self._cond:
+            self._seen.pop(container_id, None)
+
+
+CONTAINER_EVENTS = ContainerEvents()
@@ -4,34 +4,65 @@ Kubernetes server class implementation.
 
 import os
 import logging
+import threading
+import time
 import uuid
 
 from kubernetes import config
 from kubernetes import client as k8sclient
 from kubernetes.client.rest import ApiException
-from retry import retry
 from pytest_server_fixtures import CONFIG
+from pytest_server_fixtures.background import run_in_background
+from pytest_server_fixtures.util import get_random_id
 from .common import (ServerClass,
+                     SERVER_ID_LEN,
                      merge_dicts,
                      ServerFixtureNotRunningException,
                      ServerFixtureNotTerminatedException)
+from .kubernetes_watch import PodWatcher
 
 log = logging.getLogger(__name__)
 
+# How long to wait for a pod to start or be deleted
+POD_TIMEOUT = 240
+# How often to double-check the pod status while waiting on the watch, in case it has failed
+STATUS_CHECK_INTERVAL = 1.0
+
 IN_CLUSTER = os.path.exists('/var/run/secrets/kubernetes.io/namespace')
 fixture_namespace = CONFIG.k8s_namespace
 
-if IN_CLUSTER:
-    config.load_incluster_config()
-    if not fixture_namespace:
-        with open('/var/run/secrets/kubernetes.io/namespace', 'r') as f:
-            fixture_namespace = f.read().strp()
-        log.info("SERVER_FIXTURES_K8S_NAMESPACE is not set, using current namespace '%s'", fixture_namespace)
+_config_loaded = False
+_config_lock = threading.Lock()
+
+
+def load_config():
+    """
+    Load the kubernetes client configuration and find the namespace to run fixtures in.
+    This is done on first use rather than on import, as it can read files and talk to the cluster.
+
+    Returns
+    -------
+    The fixture namespace
+    """
+    global fixture_namespace, _config_loaded
+    with _config_lock:
+        if _config_loaded:
+            return fixture_namespace
+
+        if IN_CLUSTER:
+            config.load_incluster_config()
+            if not fixture_namespace:
+                with open('/var/run/secrets/kubernetes.io/namespace', 'r') as f:
+                    fixture_namespace = f.read().strip()
+                log.info("SERVER_FIXTURES_K8S_NAMESPACE is not set, using current namespace '%s'", fixture_namespace)
 
-if CONFIG.k8s_local_test:
-    log.info("====== Running K8S Server Class in Test Mode =====")
-    config.load_kube_config()
-    fixture_namespace = 'default'
+        if CONFIG.k8s_local_test:
+            log.info("====== Running K8S Server Class in Test Mode =====")
+            config.load_kube_config()
+            fixture_namespace = 'default'
+
+        _config_loaded = True
+        return fixture_namespace
 
 
 class NotRunningInKubernetesException(Exception):
@@ -39,6 +70,121 @@ class NotRunningInKubernetesException(Exception):
     pass
 
 
+_pod_watcher = None
+_pod_watcher_lock = threading.Lock()
+
+
+def get_pod_watcher():
+    """
+    Returns
+    -------
+    The `PodWatcher` following the pods of this test session, started on first use.
+    """
+    global _pod_watcher
+    with _pod_watcher_lock:
+        if _pod_watcher is None:
+            _pod_watcher = PodWatcher(fixture_namespace, 'server-fixtures/session-id=%s' % CONFIG.session_id)
+    _pod_watcher.start()
+    return _pod_watcher
+
+
+class SharedPod(object):
+    """
+    A pod running several server fixtures as separate containers, so it is only scheduled once
+    and the fixtures share its IP address. Create these with `share_pod`.
+
+    The pod is created once all `size` servers have added their containers, so the servers
+    must be started concurrently, eg. with `group.ServerGroup`. It is deleted once they
+    have all been torn down.
+    """
+
+    def __init__(self, size):
+        self.name = "server-fixtures-%s-%s" % (CONFIG.session_id, get_random_id(SERVER_ID_LEN))
+        self.size = size
+        self._containers = []
+        self._labels = {}
+        self._users = 0
+        self._created = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def join(self, container, labels, create_pod):
+        """
+        Add a server's container to the pod, and wait for the pod to be created.
+
+        Parameters
+        ----------
+        container: `V1Container`
+            The server's container, renamed to be unique within the pod
+        labels: `dict`
+            Labels for the pod
+        create_pod: ``callable``
+            Called with the containers and labels by the last server to join, to create the pod
+        """
+        with self._cond:
+            container.name = 'fixture-%d' % len(self._containers)
+            self._containers.append(container)
+            self._labels.update(labels)
+            self._users += 1
+            if len(self._containers) == self.size:
+                # Members of one pod can be of different types
+                self._labels['server-fixtures/server-type'] = 'shared'
+                try:
+                    create_pod(self._containers, self._labels)
+                    self._created = True
+                except Exception as e:
+                    self._error = e
+                self._cond.notify_all()
+            elif not self._cond.wait_for(lambda: self._created or self._error, POD_TIMEOUT):
+                raise ServerFixtureNotRunningException("Only %d of %d servers sharing pod %s were started"
+                                                       % (len(self._containers), self.size, self.name))
+            if self._error is not None:
+                raise self._error
+
+    def leave(self):
+        """
+        Returns
+        -------
+        True if the last server using the pod has left, and the pod should be deleted.
+        """
+        with self._cond:
+            self._users -= 1
+            return self._users == 0 and self._created
+
+
+def delete_session_pods(session_ids):
+    """
+    Delete all the pods started by the given test sessions.
+    """
+    if not load_config():
+        return
+    selector = 'server-fixtures/session-id in (%s)' % ','.join(sorted(session_ids))
+    log.info("Deleting pods matching %s", selector)
+    k8sclient.CoreV1Api().delete_collection_namespaced_pod(namespace=fixture_namespace,
+                                                           label_selector=selector,
+                                                           grace_period_seconds=1)
+
+
+def share_pod(servers):
+    """
+    Run `TestServerV2` servers in the same pod when using the kubernetes server class.
+    The servers must listen on different ports, and be started together, eg. with `group.ServerGroup`:
+
+        group = ServerGroup(redis=RedisTestServer(), mongo=MongoTestServer())
+        share_pod(group)
+        group.start()
+
+    Returns
+    -------
+    The `SharedPod`
+    """
+    servers = list(servers)
+    pod = SharedPod(len(servers))
+    for server in servers:
+        server.kubernetes_pod = pod
+    return pod
+
+
 class KubernetesServer(ServerClass):
     """Kubernetes server class."""
 
@@ -48,10 +194,11 @@ class KubernetesServer(ServerClass):
                 get_args,
                 env,
                 image,
-                labels={}):
+                labels={},
+                pod=None):
         super(KubernetesServer, self).__init__(cmd, get_args, env)
 
-        if not fixture_namespace:
+        if not load_config():
             raise NotRunningInKubernetesException()
 
         self._image = image
@@ -62,10 +209,13 @@ class KubernetesServer(ServerClass):
         })
 
         self._v1api = k8sclient.CoreV1Api()
+        self._watcher = None
+        self._pod = pod
 
     def launch(self):
         try:
             log.debug('%s Launching pod' % self._log_prefix)
+            self._watcher = get_pod_watcher()
             self._create_pod()
             self._wait_until_running()
             log.debug('%s Pod is running' % self._log_prefix)
@@ -77,9 +227,16 @@ class KubernetesServer(ServerClass):
         pass
 
     def teardown(self):
+        if self._pod is not None and not self._pod.leave():
+            # Other servers are still using the pod
+            return
         self._delete_pod()
-        # TODO: provide an flag to skip the wait to speed up the tests?
-        self._wait_until_teardown()
+        if self._watcher is None:
+            # Never launched
+            return
+        # Nothing needs to wait for the pod to go away, so confirm that off the critical path.
+        # Background tasks are joined at the end of the session.
+        run_in_background(self._wait_until_teardown)
 
     @property
     def is_running(self):
@@ -105,23 +262,30 @@ class KubernetesServer(ServerClass):
     def labels(self):
         return self._labels
 
-    def _get_pod_spec(self):
-        container = k8sclient.V1Container(
+    @property
+    def pod_name(self):
+        """Name of the pod running this server."""
+        return self._pod.name if self._pod is not None else self.name
+
+    def _get_container(self):
+        return k8sclient.V1Container(
             name='fixture',
             image=self._image,
-            command=self._get_cmd(),
-            env=[k8sclient.V1EnvVar(name=k, value=v) for k, v in self._env.iteritems()],
-        )
-
-        return k8sclient.V1PodSpec(
-            containers=[container]
+            command=[self._cmd] + self._get_args(),
+            env=[k8sclient.V1EnvVar(name=k, value=v) for k, v in self._env.items()],
         )
 
     def _create_pod(self):
+        if self._pod is not None:
+            self._pod.join(self._get_container(), self._labels, self._create_pod_with)
+        else:
+            self._create_pod_with([self._get_container()], self._labels)
+
+    def _create_pod_with(self, containers, labels):
         try:
             pod = k8sclient.V1Pod()
-            pod.metadata = k8sclient.V1ObjectMeta(name=self.name, labels=self._labels)
-            pod.spec = self._get_pod_spec()
+            pod.metadata = k8sclient.V1ObjectMeta(name=self.pod_name, labels=labels)
+            pod.spec = k8sclient.V1PodSpec(containers=containers)
             self._v1api.create_namespaced_pod(namespace=self.namespace, body=pod)
         except ApiException as e:
             log.error("%s Failed to create pod: %s", self._log_prefix, e.reason)
@@ -132,35 +296,54 @@ class KubernetesServer(ServerClass):
             body = k8sclient.V1DeleteOptions()
             # delete the pod without waiting
             body.grace_period_seconds = 1
-            self._v1api.delete_namespaced_pod(namespace=self.namespace, name=self.name, body=body)
+            self._v1api.delete_namespaced_pod(namespace=self.namespace, name=self.pod_name, body=body)
         except ApiException as e:
             log.error("%s Failed to delete pod: %s", self._log_prefix, e.reason)
 
     def _get_pod_status(self):
+        if self._watcher is not None and self._watcher.running:
+            status = self._watcher.get_status(self.pod_name)
+            if status is not None:
+                return status
         try:
-            resp = self._v1api.read_namespaced_pod_status(namespace=self.namespace, name=self.name)
+            resp = self._v1api.read_namespaced_pod_status(namespace=self.namespace, name=self.pod_name)
             return resp.status
         except ApiException as e:
             log.error("%s Failed to read pod status: %s", self._log_prefix, e.reason)
             raise
 
-    @retry(ServerFixtureNotRunningException, tries=28, delay=1, backoff=2, max_delay=10)
     def _wait_until_running(self):
         log.debug("%s Waiting for pod status to become running", self._log_prefix)
-        if not self.is_running:
-            raise ServerFixtureNotRunningException()
+        deadline = time.monotonic() + POD_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            status = self._watcher.wait_for_phase(self.pod_name, ('Running', 'Succeeded', 'Failed'),
+                                                  max(min(remaining, STATUS_CHECK_INTERVAL), 0))
+            if status is not None:
+                if status.phase != 'Running':
+                    raise ServerFixtureNotRunningException()
+                return
+            # Double check, in case the watch has failed
+            if self.is_running:
+                return
+            if remaining <= 0:
+                raise ServerFixtureNotRunningException()
 
-    @retry(ServerFixtureNotTerminatedException, tries=28, delay=1, backoff=2, max_delay=10)
     def _wait_until_teardown(self):
+        deadline = time.monotonic() + POD_TIMEOUT
         try:
-            self._get_pod_status()
-            # waiting for pod to be deleted (expect ApiException with status 404)
-            raise ServerFixtureNotTerminatedException()
-        except ApiException as e:
-            if e.status == 404:
-                return
-            raise
+            while not self._watcher.wait_for_deletion(self.pod_name, STATUS_CHECK_INTERVAL):
+                try:
+                    self._v1api.read_namespaced_pod_status(namespace=self.namespace, name=self.pod_name)
+                except ApiException as e:
+                    if e.status == 404:
+                        return
+                    raise
+                if time.monotonic() > deadline:
+                    raise ServerFixtureNotTerminatedException()
+        finally:
+            self._watcher.forget(self.pod_name)
 
     @property
     def _log_prefix(self):
-        return "[K8S %s:%s]" % (self.namespace, self.name)
+        return "[K8S %s:%s]" % (self.namespace, self.pod_name)
@@ -0,0 +1,141 @@
+"""
+Kubernetes pod phases for server fixture pods, followed by a single watch for the whole session.
+
+`KubernetesServer` waits on these to find out as soon as its pod is running or has been
+deleted, rather than polling the pod status.
+"""
+import logging
+import threading
+import time
+
+from kubernetes import client as k8sclient
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+log = logging.getLogger(__name__)
+
+# Seconds before the API server ends a watch, after which we start a new one
+WATCH_TIMEOUT = 300
+
+
+class PodWatcher(object):
+    """
+    Records the latest status of each pod matching a label selector. The watch thread is
+    started on first use, and restarted if the watch fails.
+
+    Parameters
+    ----------
+    namespace: `str`
+        Namespace of the pods
+    label_selector: `str`
+        Selects the pods to watch, eg. those of this test session
+    """
+
+    def __init__(self, namespace, label_selector):
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self._cond = threading.Condition()
+        self._statuses = {}
+        self._deleted = set()
+        self._thread = None
+
+    def start(self):
+        """
+        Make sure the watch is running.
+        """
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='server-fixtures-pod-watch')
+            self._thread.daemon = True
+            self._thread.start()
+
+    @property
+    def running(self):
+        with self._cond:
+            return self._thread is not None
+
+    def _run(self):
+        v1api = k8sclient.CoreV1Api()
+        resource_version = None
+        try:
+            while True:
+                try:
+                    for event in watch.Watch().stream(v1api.list_namespaced_pod,
+                                                      namespace=self.namespace,
+                                                      label_selector=self.label_selector,
+                                                      resource_version=resource_version,
+                                                      timeout_seconds=WATCH_TIMEOUT):
+                        pod = event['object']
+                        resource_version = pod.metadata.resource_version
+                        self._record(event['type'], pod)
+                except ApiException as e:
+                    if e.status != 410:
+                        raise
+                    # Our resource version is too old, start again from the current state
+                    resource_version = None
+        except Exception as e:
+            log.warning("Kubernetes pod watch failed: %s", e)
+        finally:
+            with self._cond:
+                self._thread = None
+
+    def _record(self, event_type, pod):
+        name = pod.metadata.name
+        with self._cond:
+            if event_type == 'DELETED':
+                self._statuses.pop(name, None)
+                self._deleted.add(name)
+            else:
+                self._statuses[name] = pod.status
+            self._cond.notify_all()
+
+    def get_status(self, name):
+        """
+        Returns
+        -------
+        Latest `V1PodStatus` seen for a pod, or None
+        """
+        with self._cond:
+            return self._statuses.get(name)
+
+    def _wait(self, predicate, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                result = predicate()
+                remaining = deadline - time.monotonic()
+                if result or remaining <= 0:
+                    return result
+                self._cond.wait(remaining)
+
+    def wait_for_phase(self, name, phases, timeout):
+        """
+        Wait up to `timeout` seconds for a pod to reach one of `phases`.
+
+        Returns
+        -------
+        The pod's `V1PodStatus`, or None if it didn't reach any of them in time
+        """
+        def predicate():
+            status = self._statuses.get(name)
+            return status if status is not None and status.phase in phases else None
+        return self._wait(predicate, timeout)
+
+    def wait_for_deletion(self, name, timeout):
+        """
+        Wait up to `timeout` seconds for a pod to be deleted.
+
+        Returns
+        -------
+        True if the pod has been deleted.
+        """
+        return self._wait(lambda: name in self._deleted, timeout)
+
+    def forget(self, name):
+        """
+        Drop what we know about a pod that has gone away.
+        """
+        with self._cond:
+            self._statuses.pop(name, None)
+            self._deleted.discard(name)
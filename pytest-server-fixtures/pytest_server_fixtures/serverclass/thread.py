@@ -6,57 +6,28 @@ import os
 import signal
 import subprocess
 import traceback
-import time
-import psutil
-
-from retry import retry
 
 from pytest_server_fixtures import CONFIG
-from pytest_server_fixtures.base import ProcessReader
-from .common import ServerClass, is_debug
+from pytest_server_fixtures.logmux import MUX, ServerLog
+from pytest_server_fixtures.process import stop_process_tree
+from pytest_server_fixtures.reaper import server_env
+from .common import ServerClass
 
 log = logging.getLogger(__name__)
 
 
-# ThreadServer will attempt to kill all child processes recursively.
-KILL_RETRY_COUNT=15 # Total retry count to kill if not all child processes are terminated.
-KILL_RETRY_WAIT_SECS=1 # Wait time between two retries
-KILL_WAIT_SECS=5 # Time to wait for processes to terminate in a single retry.
+# ThreadServer kills the server's process group and any other child processes.
+KILL_WAIT_SECS=5 # Time to wait for processes to terminate after each signal.
 
 
 class ProcessStillRunningException(Exception):
     pass
 
 
-@retry(ProcessStillRunningException,
-       tries=KILL_RETRY_COUNT,
-       delay=KILL_RETRY_WAIT_SECS)
-def _kill_all(procs, sig):
-    log.debug("Killing %d processes with signal %s" % (len(procs), sig))
-    for p in procs:
-        p.send_signal(sig)
-
-    log.debug("Waiting for %d processes to die" % len(procs))
-    gone, alive = psutil.wait_procs(procs, timeout=KILL_WAIT_SECS)
-
-    if len(alive) == 0:
-        log.debug("All processes are terminated")
-        return
-
-    log.warning("%d processes remainings: %s" % (len(alive), ",".join([p.name() for p in alive])))
-    raise ProcessStillRunningException()
-
-
-def _kill_proc_tree(pid, sig=signal.SIGKILL, timeout=None):
-    parent = psutil.Process(pid)
-    children = parent.children(recursive=True)
-    children.append(parent)
-    log.debug("Killing process tree for %d (total_procs_to_kill=%d)" % (parent.pid, len(children)))
-    _kill_all(children, sig)
-
-
 class ThreadServer(ServerClass):
     """Thread server class."""
+    # Signal used to stop the server, escalated to SIGKILL after KILL_WAIT_SECS
+    kill_signal = signal.SIGKILL
 
     def __init__(self,
                  cmd,
@@ -64,13 +35,15 @@ class ThreadServer(ServerClass):
                  env,
                  workspace,
                  cwd=None,
-                 listen_hostname=None):
+                 listen_hostname=None,
+                 server_log=None):
         super(ThreadServer, self).__init__(cmd, get_args, env)
 
         self.exit = False
         self._workspace = workspace
         self._cwd = cwd
         self._hostname = listen_hostname
+        self._server_log = server_log
         self._proc = None
 
     def launch(self):
@@ -78,20 +51,16 @@ class ThreadServer(ServerClass):
 
         run_cmd = [self._cmd] + self._get_args(workspace=self._workspace)
 
-        debug = is_debug()
-
-        extra_args = dict()
-        if debug:
-            extra_args['stdout'] = subprocess.PIPE
-            extra_args['stderr'] = subprocess.PIPE
-
-        self._proc = subprocess.Popen(run_cmd, env=self._env, cwd=self._cwd, **extra_args)
+        # Run in a new session, so the server and its children form a process group we can kill together
+        # Tagged with our session id, so the server can be cleaned up if this session is killed
+        self._proc = subprocess.Popen(run_cmd, env=server_env(self._env), cwd=self._cwd, start_new_session=True,
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         log.debug("Running server: %s" % ' '.join(run_cmd))
         log.debug("CWD: %s" % self._cwd)
 
-        if debug:
-            ProcessReader(self._proc, self._proc.stdout, False).start()
-            ProcessReader(self._proc, self._proc.stderr, True).start()
+        if self._server_log is None:
+            self._server_log = ServerLog(self.name)
+        MUX.add(self._server_log, self._proc.stdout, self._proc.stderr)
 
         self.start()
 
@@ -116,11 +85,19 @@ class ThreadServer(ServerClass):
     def hostname(self):
         return self._hostname
 
+    @property
+    def process(self):
+        return self._proc
+
     def teardown(self):
         if not self._proc:
             log.warning("No process is running, skip teardown.")
             return
 
-        _kill_proc_tree(self._proc.pid)
+        alive = stop_process_tree(self._proc.pid, sig=self.kill_signal,
+                                  timeout=KILL_WAIT_SECS, kill_timeout=KILL_WAIT_SECS)
+        if alive:
+            log.warning("%d processes remaining: %s" % (len(alive), ",".join([p.name() for p in alive])))
+            raise ProcessStillRunningException()
         self._proc = None
 
@@ -0,0 +1,157 @@
+""" Cache of initialised server data directories.
+
+Some servers need an expensive initialisation step that produces the same directory every
+time, eg. Postgres' initdb. The first server to start produces the directory and saves a
+snapshot of it here, keyed on the server binary and its configuration. Later servers
+clone the snapshot into their workspace instead.
+
+Clones use reflinks where the filesystem supports them (btrfs, xfs), so they are
+copy-on-write and near-instant, then copy_file_range, then a plain copy. Files are never
+hard-linked, as the servers write to their data files in place.
+"""
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+from pytest_server_fixtures import CONFIG
+from .util import get_random_id
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# ioctl to share the extents of one file with another, from linux/fs.h
+FICLONE = 0x40049409
+
+
+def get_snapshot_dir():
+    """ Directory holding the snapshots.
+    """
+    return CONFIG.snapshot_dir or os.path.join(tempfile.gettempdir(),
+                                               'pytest-server-fixtures-snapshots-%d' % os.getuid())
+
+
+def get_key(*parts):
+    """
+    Returns
+    -------
+    Snapshot key for the given parts, eg. the server version and its configuration.
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def file_version(path):
+    """
+    Returns
+    -------
+    Identifies a version of the file at `path`, eg. a server binary, without having to run it
+    """
+    st = os.stat(path)
+    return (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+
+
+def _reflink(fsrc, fdst):
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        return False
+
+
+def _copy_file_range(fsrc, fdst):
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    size = os.fstat(fsrc.fileno()).st_size
+    copied = 0
+    try:
+        while copied < size:
+            n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+            if n == 0:
+                break
+            copied += n
+    except OSError as e:
+        if copied or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+            raise
+        return False
+    return True
+
+
+def clone_file(src, dst):
+    """ Copy a file with its metadata, sharing its data on disk where the filesystem allows.
+        Can be used as the copy_function of `shutil.copytree`.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if not _reflink(fsrc, fdst) and not _copy_file_range(fsrc, fdst):
+            shutil.copyfileobj(fsrc, fdst)
+    shutil.copystat(src, dst)
+    return dst
+
+
+def clone_tree(src, dst):
+    """ Clone the directory `src` to `dst`, which must not exist.
+    """
+    shutil.copytree(str(src), str(dst), symlinks=True, copy_function=clone_file)
+
+
+def _path(name, key):
+    return os.path.join(get_snapshot_dir(), '%s-%s' % (name, key))
+
+
+def restore(name, key, dest):
+    """
+    Clone the snapshot `name` with `key` to `dest`, which must not exist.
+
+    Returns
+    -------
+    True if the snapshot exists and was restored.
+    """
+    if not CONFIG.snapshots:
+        return False
+    path = _path(name, key)
+    if not os.path.isdir(path):
+        return False
+    log.debug("Restoring snapshot %s to %s" % (path, dest))
+    clone_tree(path, dest)
+    return True
+
+
+def save(name, key, src):
+    """
+    Save a snapshot of the directory `src` as `name` with `key`, unless one exists already.
+    """
+    if not CONFIG.snapshots:
+        return
+    path = _path(name, key)
+    if os.path.isdir(path):
+        return
+    # Build it under a temporary name and rename it into place, so no-one sees a partial snapshot.
+    tmp = '%s.tmp-%d-%s' % (path, os.getpid(), get_random_id(8))
+    try:
+        os.makedirs(get_snapshot_dir(), exist_ok=True)
+        clone_tree(src, tmp)
+        os.rename(tmp, path)
+        log.debug("Saved snapshot %s" % path)
+    except OSError as e:
+        # Most likely another process saved it first
+        log.debug("Not saving snapshot %s: %s" % (path, e))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def cached(name, key, dest, create):
+    """
+    Populate the directory `dest`, which must not exist, from a snapshot. If there is no
+    snapshot yet, call `create(dest)` to produce it and save a snapshot for next time.
+    """
+    if restore(name, key, dest):
+        return
+    create(dest)
+    save(name, key, dest)
@@ -0,0 +1,144 @@
+""" Timeline of server fixture lifecycle phases, written out in Chrome trace format.
+
+Load the trace file into chrome://tracing or https://ui.perfetto.dev to see where the time went.
+Tracing is enabled by the `--server-fixtures-trace` pytest option or the SERVER_FIXTURES_TRACE
+setting, see `pytest_server_fixtures.plugin`.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, errtype, value, traceback):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _now_us():
+    """ Microseconds since the epoch.
+    """
+    return int(time.time() * 1e6)
+
+
+class _Span(object):
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, errtype, value, traceback):
+        if errtype is not None:
+            self.args['error'] = '%s: %s' % (errtype.__name__, value)
+        self.tracer.add_span(self.name, self.cat, self.start, _now_us(), self.args)
+
+
+class Tracer(object):
+    """
+    Collects timed spans from any thread. Spans are only recorded while `enabled` is set.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._events = []
+        self._thread_names = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, cat='server', **args):
+        """
+        Context manager recording the time spent inside it as a span.
+
+        Parameters
+        ----------
+        name: `str`
+            Span name, eg. the lifecycle phase
+        cat: `str`
+            Category, for filtering in the trace viewer
+        args:
+            Extra details shown with the span
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def add_span(self, name, cat, start, end, args=None):
+        """
+        Record a span, with start and end in microseconds since the epoch.
+        """
+        thread = threading.current_thread()
+        with self._lock:
+            self._thread_names[thread.ident] = thread.name
+            self._events.append({
+                'name': name,
+                'cat': cat,
+                'ph': 'X',
+                'ts': start,
+                'dur': end - start,
+                'pid': os.getpid(),
+                'tid': thread.ident,
+                'args': args or {},
+            })
+
+    def get_events(self, process_name=None):
+        """
+        Returns
+        -------
+        List of trace events recorded so far, with metadata events naming the process and threads.
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                      for tid, name in self._thread_names.items()]
+            events.extend(self._events)
+        if process_name:
+            events.insert(0, {'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': process_name}})
+        return events
+
+    def write(self, path, process_name=None, merge_pattern=None):
+        """
+        Write the trace out as Chrome trace JSON.
+
+        Parameters
+        ----------
+        path: `str`
+            File to write
+        process_name: `str`
+            Name for this process in the trace viewer
+        merge_pattern: `str`
+            Glob of other trace files (eg. from xdist workers) to merge in and then delete
+        """
+        events = self.get_events(process_name)
+        merged = sorted(glob.glob(merge_pattern)) if merge_pattern else []
+        for other in merged:
+            with open(other) as f:
+                events.extend(json.load(f)['traceEvents'])
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        for other in merged:
+            os.unlink(other)
+        log.info("Wrote server fixtures trace to %s" % path)
+
+
+TRACER = Tracer()
+
+
+def span(name, cat='server', **args):
+    """
+    Record a span on the global tracer, see `Tracer.span`.
+    """
+    return TRACER.span(name, cat, **args)
@@ -27,7 +27,7 @@ install_requires = ['pytest',
 
 extras_require = {
     'jenkins':  ["python-jenkins"],
-    'mongodb':  ["pymongo>=3.6.0"],
+    'mongodb':  ["pymongo>=3.11"],
     'postgres': ["psycopg2-binary"],
     'redis':  ["redis"],
     's3': ["boto3"],
@@ -41,6 +41,7 @@ tests_require = [
 
 entry_points = {
     'pytest11': [
+        'server_fixtures = pytest_server_fixtures.plugin',
         'httpd_server = pytest_server_fixtures.httpd',
         'jenkins_server = pytest_server_fixtures.jenkins',
         'mongodb_server = pytest_server_fixtures.mongo',
@@ -14,3 +14,37 @@ def test_mongo_server_multi(count, mongo_server):
     assert coll.count_documents({}) == 0
     coll.insert_one({'a': 'b'})
     assert coll.count_documents({}) == 1
+
+
+@pytest.mark.parametrize('count', range(3))
+def test_mongo_db(count, mongo_db):
+    assert mongo_db.some_collection.count_documents({}) == 0
+    mongo_db.some_collection.insert_one({'a': 'b'})
+    assert mongo_db.some_collection.count_documents({}) == 1
+
+
+def test_mongo_replica_set(mongo_replica_set_sess):
+    coll = mongo_replica_set_sess.api.some_database.some_collection
+    coll.insert_one({'a': 'b'})
+    with mongo_replica_set_sess.api.start_session() as session:
+        with session.start_transaction():
+            coll.insert_one({'c': 'd'}, session=session)
+    assert coll.count_documents({}) == 2
+
+
+def test_mongo_sharded(mongo_sharded_sess):
+    shards = mongo_sharded_sess.api.admin.command('listShards')['shards']
+    assert sorted(s['_id'] for s in shards) == ['shard0', 'shard1']
+
+
+def test_mongo_load(tmpdir, mongo_server_sess):
+    from pymongo import IndexModel
+    path = tmpdir / 'users.jsonl'
+    path.write(''.join('{"email": "user%d@example.com"}\n' % i for i in range(2500)))
+    db = mongo_server_sess.create_database('test_mongo_load')
+    try:
+        assert mongo_server_sess.load(db.name, 'users', str(path), indexes=[IndexModel('email', unique=True)]) == 2500
+        assert db.users.count_documents({}) == 2500
+        assert 'email_1' in db.users.index_information()
+    finally:
+        mongo_server_sess.drop_database(db.name)
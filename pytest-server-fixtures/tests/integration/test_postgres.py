@@ -1,5 +1,7 @@
 import pytest
 
+from pytest_server_fixtures.background import join_background
+
 def test_postgres_server(postgres_server_sess):
     conn = postgres_server_sess.connect('integration')
     cursor = conn.cursor()
@@ -9,3 +11,34 @@ def test_postgres_server(postgres_server_sess):
     assert cursor.fetchone() == (1, 100, "abc'def")
 
 
+
+
+@pytest.fixture(scope='session')
+def postgres_template_setup():
+    def setup(conn):
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE TABLE users (id serial PRIMARY KEY, name varchar);")
+            cursor.execute("INSERT INTO users (name) VALUES ('admin');")
+    return setup
+
+
+@pytest.mark.parametrize('count', range(3))
+def test_postgres_db(count, postgres_db):
+    with postgres_db.connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM users;")
+        assert cursor.fetchall() == [('admin',)]
+        cursor.execute("INSERT INTO users (name) VALUES ('user');")
+    postgres_db.connection.commit()
+
+
+def test_postgres_db_dropped(postgres_server_sess, postgres_template_sess):
+    db = postgres_server_sess.clone_database(postgres_template_sess, 'test_dropped')
+    postgres_server_sess.drop_database(db.name)
+    assert join_background(timeout=30)
+    conn = postgres_server_sess.connect('postgres')
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_database WHERE datname = %s", (db.name,))
+            assert cursor.fetchone() == (0,)
+    finally:
+        conn.close()
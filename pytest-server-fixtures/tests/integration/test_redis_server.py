@@ -4,3 +4,45 @@ def test_server_runner(redis_server):
     assert redis_server.check_server_up()
     redis_server.api.set('foo', 'bar')
     assert redis_server.api.get('foo').decode('utf8') == 'bar'
+
+
+def test_redis_db(redis_db, redis_db_pool):
+    other = redis_db_pool.acquire()
+    try:
+        assert redis_db.api.dbsize() == 0
+        redis_db.api.set('foo', 'bar')
+        assert other.api.get('foo') is None
+    finally:
+        redis_db_pool.release(other)
+
+
+def test_seed(redis_server, tmpdir):
+    path = tmpdir / 'seed.json'
+    path.write('{"foo": "bar", "list": ["a", "b"], "hash": {"f": "v"}}')
+    assert redis_server.seed(path) == 3
+    assert redis_server.api.get('foo') == b'bar'
+    assert redis_server.api.lrange('list', 0, -1) == [b'a', b'b']
+    assert redis_server.api.hgetall('hash') == {b'f': b'v'}
+
+
+def test_rdb_preload(redis_server, tmpdir):
+    from pytest_server_fixtures.redis import RedisTestServer
+    redis_server.seed([('SET', 'key%d' % i, i) for i in range(1000)])
+    redis_server.api.config_set('dir', str(tmpdir))
+    redis_server.api.save()
+    with RedisTestServer(rdb=tmpdir / 'dump.rdb') as server:
+        server.start()
+        assert server.api.dbsize() == 1000
+
+
+def test_redis_cluster(redis_cluster_sess):
+    redis_cluster_sess.api.mset_nonatomic({'key%d' % i: i for i in range(100)})
+    assert redis_cluster_sess.api.get('key42') == b'42'
+    assert sum(node.api.dbsize() for node in redis_cluster_sess.nodes[:3]) == 100
+
+
+def test_redis_replicated(redis_replicated_sess):
+    redis_replicated_sess.api.set('foo', 'bar')
+    redis_replicated_sess.api.wait(2, 5000)
+    for replica in redis_replicated_sess.replicas:
+        assert replica.api.get('foo') == b'bar'
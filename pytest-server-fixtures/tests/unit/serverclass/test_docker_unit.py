@@ -4,7 +4,17 @@ except ImportError:
     # python 2
     from mock import sentinel, patch, Mock
 
-from pytest_server_fixtures.serverclass.docker import DockerServer
+import os
+import threading
+import uuid
+
+import pytest
+
+from pytest_server_fixtures.locks import get_lock_dir, try_lock
+from pytest_server_fixtures.serverclass.docker import (DockerServer, LOCK_KIND, REUSE_KEY_LABEL,
+                                                       get_reuse_key, reap_idle_containers)
+from pytest_server_fixtures.serverclass.common import ServerFixtureNotRunningException
+from pytest_server_fixtures.serverclass.docker_events import ContainerEvents
 
 @patch('pytest_server_fixtures.serverclass.docker.ServerClass.__init__')
 def test_init(mock_init):
@@ -17,3 +27,119 @@ def test_init(mock_init):
     mock_init.assert_called_with(sentinel.cmd,
                                  sentinel.get_args,
                                  sentinel.env)
+
+
+def _reusing_server(client, reuse='global'):
+    with patch('pytest_server_fixtures.serverclass.docker.docker.from_env', return_value=client), \
+            patch('pytest_server_fixtures.serverclass.docker.CONFIG') as config:
+        config.docker_reuse = reuse
+        config.session_id = 'session'
+        return DockerServer('RedisTestServer', 'redis-server', lambda: ['--port', '6379'], {}, 'redis')
+
+
+def _container(name, status='running'):
+    container = Mock(status=status, attrs={'NetworkSettings': {'IPAddress': '1.2.3.4'}})
+    container.name = name
+    return container
+
+
+def test_reuse_key_depends_on_image_command_and_env():
+    key = get_reuse_key('redis', ['redis-server', '--port', '6379'], {'A': '1'})
+    assert key == get_reuse_key('redis', ['redis-server', '--port', '6379'], {'A': '1'})
+    assert key != get_reuse_key('redis:6', ['redis-server', '--port', '6379'], {'A': '1'})
+    assert key != get_reuse_key('redis', ['redis-server', '--port', '6380'], {'A': '1'})
+    assert key != get_reuse_key('redis', ['redis-server', '--port', '6379'], {'A': '2'})
+
+
+def test_launch_reuses_running_container():
+    container = _container('server-fixtures-test-reuse-%s' % uuid.uuid4())
+    client = Mock()
+    client.containers.list.return_value = [container]
+    client.containers.run.return_value = _container('new')
+    server = _reusing_server(client)
+    with patch('pytest_server_fixtures.serverclass.docker.reap_idle_containers'):
+        server.launch()
+    assert server.reused
+    assert not client.containers.run.called
+
+    # A second server can't claim it while the first is using it
+    other = _reusing_server(client)
+    with patch('pytest_server_fixtures.serverclass.docker.reap_idle_containers'):
+        other.launch()
+    assert not other.reused
+    assert client.containers.run.call_args[1]['auto_remove'] is False
+    assert REUSE_KEY_LABEL in client.containers.run.call_args[1]['labels']
+
+    # Teardown leaves it running for the next user
+    server.teardown()
+    assert not container.stop.called
+    assert try_lock(LOCK_KIND, container.name) is not None
+
+
+def test_launch_without_claim_is_not_reusable():
+    client = Mock()
+    client.containers.list.return_value = []
+    client.containers.run.return_value = _container('new')
+    server = _reusing_server(client)
+    with patch('pytest_server_fixtures.serverclass.docker.reap_idle_containers'), \
+            patch('pytest_server_fixtures.serverclass.docker.try_lock', return_value=None), \
+            patch.object(server, '_wait_until_running'), patch.object(server, 'start'):
+        server.launch()
+    # Teardown stops it, so it has to remove itself
+    assert client.containers.run.call_args[1]['auto_remove'] is True
+    assert REUSE_KEY_LABEL not in client.containers.run.call_args[1]['labels']
+
+
+def test_reap_idle_containers():
+    busy = _container('server-fixtures-test-busy-%s' % uuid.uuid4())
+    idle = _container('server-fixtures-test-idle-%s' % uuid.uuid4())
+    fresh = _container('server-fixtures-test-fresh-%s' % uuid.uuid4())
+    stopped = _container('server-fixtures-test-stopped-%s' % uuid.uuid4(), status='exited')
+    client = Mock()
+    client.containers.list.return_value = [busy, idle, fresh, stopped]
+
+    busy_claim = try_lock(LOCK_KIND, busy.name)
+    for container in (idle, fresh, stopped):
+        lock = try_lock(LOCK_KIND, container.name)
+        lock.touch()
+        lock.release()
+    os.utime(get_lock_dir(LOCK_KIND) + '/%s.lock' % idle.name, (0, 0))
+
+    reap_idle_containers(client, ttl=60)
+    busy_claim.release()
+    assert not busy.remove.called
+    assert idle.remove.called
+    assert not fresh.remove.called
+    assert stopped.remove.called
+
+
+def test_container_events_wake_waiters():
+    release = threading.Event()
+
+    def events(**kwargs):
+        yield {'Action': 'start', 'id': 'abc'}
+        release.wait(10)
+        yield {'status': 'die', 'id': 'abc'}
+        yield {'Action': 'destroy', 'Actor': {'ID': 'abc'}}
+
+    client = Mock(**{'events.side_effect': events})
+    container_events = ContainerEvents()
+    with patch('pytest_server_fixtures.serverclass.docker_events.docker.from_env', return_value=client):
+        container_events.start()
+        assert container_events.wait('abc', ['start'], 10) == {'start'}
+        assert container_events.wait('abc', ['destroy'], 0.01) == set()
+        release.set()
+        assert container_events.wait('abc', ['destroy'], 10) == {'destroy'}
+    assert container_events.seen('abc') == {'start', 'die', 'destroy'}
+    container_events.forget('abc')
+    assert container_events.seen('abc') == set()
+
+
+def test_wait_until_running_fails_fast_when_container_dies():
+    client = Mock()
+    client.containers.run.return_value = _container('dead', status='exited')
+    server = _reusing_server(client, reuse=None)
+    with patch('pytest_server_fixtures.serverclass.docker.CONTAINER_EVENTS') as container_events:
+        container_events.seen.return_value = {'start', 'die'}
+        with pytest.raises(ServerFixtureNotRunningException):
+            server.launch()
@@ -1,3 +1,5 @@
+import threading
+
 import pytest
 
 try:
@@ -6,7 +8,10 @@ except ImportError:
     # python 2
     from mock import sentinel, patch, Mock
 
-from pytest_server_fixtures.serverclass.kubernetes import KubernetesServer
+from kubernetes.client.rest import ApiException
+
+from pytest_server_fixtures.serverclass.kubernetes import KubernetesServer, share_pod
+from pytest_server_fixtures.serverclass.kubernetes_watch import PodWatcher
 
 @pytest.mark.skip(reason="Need a way to run this test in Kubernetes")
 @patch('pytest_server_fixtures.serverclass.docker.ServerClass.__init__')
@@ -20,3 +25,82 @@ def test_init(mock_init):
     mock_init.assert_called_with(sentinel.cmd,
                                  sentinel.get_args,
                                  sentinel.env)
+
+
+def _pod(name, phase):
+    metadata = Mock(resource_version='1')
+    metadata.name = name
+    return Mock(metadata=metadata, status=Mock(phase=phase))
+
+
+def _watcher(events):
+    watcher = PodWatcher('ns', 'server-fixtures/session-id=abc')
+    stream = Mock(side_effect=[iter(events), iter([])] + [ApiException(status=500)])
+    with patch('pytest_server_fixtures.serverclass.kubernetes_watch.k8sclient'), \
+            patch('pytest_server_fixtures.serverclass.kubernetes_watch.watch.Watch') as mock_watch:
+        mock_watch.return_value.stream = stream
+        watcher.start()
+        watcher._thread.join(10)
+    return watcher
+
+
+def test_pod_watcher_tracks_phases():
+    watcher = _watcher([{'type': 'ADDED', 'object': _pod('a', 'Pending')},
+                        {'type': 'MODIFIED', 'object': _pod('a', 'Running')},
+                        {'type': 'ADDED', 'object': _pod('b', 'Running')},
+                        {'type': 'DELETED', 'object': _pod('b', 'Running')}])
+    assert watcher.wait_for_phase('a', ('Running',), 0).phase == 'Running'
+    assert watcher.wait_for_phase('a', ('Failed',), 0.01) is None
+    assert watcher.wait_for_deletion('b', 0)
+    assert not watcher.wait_for_deletion('a', 0.01)
+    assert watcher.get_status('b') is None
+    watcher.forget('b')
+    assert not watcher.wait_for_deletion('b', 0)
+
+
+def test_pod_watcher_stops_on_error():
+    watcher = _watcher([])
+    assert not watcher.running
+
+
+@patch('pytest_server_fixtures.serverclass.kubernetes.fixture_namespace', 'ns')
+@patch('pytest_server_fixtures.serverclass.kubernetes.k8sclient')
+def test_teardown_does_not_wait_for_deletion(mock_k8sclient):
+    server = KubernetesServer('RedisTestServer', 'redis-server', lambda: [], {}, 'redis')
+    server._watcher = Mock()
+    with patch('pytest_server_fixtures.serverclass.kubernetes.run_in_background') as mock_background:
+        server.teardown()
+    mock_k8sclient.CoreV1Api.return_value.delete_namespaced_pod.assert_called_once()
+    mock_background.assert_called_once_with(server._wait_until_teardown)
+
+
+@patch('pytest_server_fixtures.serverclass.kubernetes.fixture_namespace', 'ns')
+@patch('pytest_server_fixtures.serverclass.kubernetes.k8sclient')
+def test_shared_pod_is_created_once_all_servers_join(mock_k8sclient):
+    mock_k8sclient.V1Container.side_effect = lambda **kwargs: Mock(**kwargs)
+    servers = [Mock(kubernetes_pod=None) for _ in range(3)]
+    pod = share_pod(servers)
+    assert all(s.kubernetes_pod is pod for s in servers)
+
+    members = [KubernetesServer('RedisTestServer', 'redis-server', lambda: ['--port', str(i)], {}, 'redis', pod=pod)
+               for i in range(3)]
+    threads = [threading.Thread(target=m._create_pod) for m in members]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    create = mock_k8sclient.CoreV1Api.return_value.create_namespaced_pod
+    create.assert_called_once()
+    assert mock_k8sclient.V1ObjectMeta.call_args[1]['name'] == pod.name
+    containers = mock_k8sclient.V1PodSpec.call_args[1]['containers']
+    assert sorted(c.name for c in containers) == ['fixture-0', 'fixture-1', 'fixture-2']
+    assert all(m.pod_name == pod.name for m in members)
+
+    # Only the last server to be torn down deletes the pod
+    delete = mock_k8sclient.CoreV1Api.return_value.delete_namespaced_pod
+    with patch('pytest_server_fixtures.serverclass.kubernetes.run_in_background'):
+        for m in members:
+            assert not delete.called
+            m.teardown()
+    delete.assert_called_once()
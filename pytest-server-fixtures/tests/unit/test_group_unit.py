@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    # python 2
+    from mock import Mock
+
+from pytest_server_fixtures.group import ServerGroup, ServerGroupError
+
+
+def test_start_is_concurrent():
+    barrier = threading.Barrier(3, timeout=10)
+    servers = [Mock(**{'start.side_effect': barrier.wait}) for _ in range(3)]
+    group = ServerGroup(*servers)
+    # Would time out the barrier if the servers were started one after another
+    group.start()
+    for server in servers:
+        server.start.assert_called_once_with()
+
+
+def test_members_are_named():
+    redis, mongo = Mock(), Mock()
+    group = ServerGroup(redis=redis, mongo=mongo)
+    assert group['redis'] is redis
+    assert list(group) == [redis, mongo]
+    assert len(group) == 2
+
+
+def test_start_failure_reports_member_and_tears_down():
+    redis, mongo = Mock(), Mock()
+    mongo.start.side_effect = OSError("mongod not found")
+    group = ServerGroup(redis=redis, mongo=mongo)
+    with pytest.raises(ServerGroupError) as exc:
+        group.start()
+    assert list(exc.value.failures) == ['mongo']
+    assert 'mongod not found' in str(exc.value)
+    redis.teardown.assert_called_once_with()
+    mongo.teardown.assert_called_once_with()
+
+
+def test_teardown_failure_reports_member():
+    redis, mongo = Mock(), Mock()
+    redis.teardown.side_effect = RuntimeError("boom")
+    with pytest.raises(ServerGroupError) as exc:
+        with ServerGroup(redis=redis, mongo=mongo):
+            pass
+    assert list(exc.value.failures) == ['redis']
+    mongo.teardown.assert_called_once_with()
+
+
+def test_async_start_and_teardown():
+    servers = [Mock(), Mock()]
+
+    async def run():
+        async with ServerGroup(*servers) as group:
+            assert len(group) == 2
+            # Entering the group doesn't start it, as with `with`
+            assert not servers[0].start.called
+            await group.astart()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+    for server in servers:
+        server.start.assert_called_once_with()
+        server.teardown.assert_called_once_with()
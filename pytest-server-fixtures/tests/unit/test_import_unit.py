@@ -0,0 +1,62 @@
+""" Importing the plugins is paid for by every pytest run, so make sure it stays cheap.
+"""
+import subprocess
+import sys
+
+import pytest
+
+# The pytest11 entry points, see setup.py
+PLUGINS = [
+    'pytest_server_fixtures.plugin',
+    'pytest_server_fixtures.httpd',
+    'pytest_server_fixtures.jenkins',
+    'pytest_server_fixtures.mongo',
+    'pytest_server_fixtures.postgres',
+    'pytest_server_fixtures.redis',
+    'pytest_server_fixtures.xvfb',
+    'pytest_server_fixtures.s3',
+]
+
+# Client libraries that should only be imported by the fixtures using them
+HEAVY_MODULES = ['requests', 'docker', 'kubernetes', 'pymongo', 'redis', 'psycopg2', 'boto3', 'jenkins']
+
+# Generous limit on the import time of our own modules, not including their dependencies
+MAX_IMPORT_SECONDS = 0.5
+
+IMPORT_PLUGINS = """
+import socket
+import sys
+
+def no_dns(*args, **kwargs):
+    raise AssertionError("Looked up a hostname on import")
+
+socket.gethostbyname = socket.gethostname = socket.getaddrinfo = no_dns
+
+for plugin in %r:
+    __import__(plugin)
+print(' '.join(m for m in %r if m in sys.modules))
+"""
+
+
+def _import_plugins(*args):
+    return subprocess.run([sys.executable] + list(args) + ['-c', IMPORT_PLUGINS % (PLUGINS, HEAVY_MODULES)],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+
+def test_import_does_not_look_up_hostname_or_load_client_libraries():
+    assert _import_plugins().stdout.split() == []
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="-X importtime needs python 3.7")
+def test_import_time():
+    # Each line is: import time: self [us] | cumulative | imported package
+    total = 0
+    found = False
+    for line in _import_plugins('-X', 'importtime').stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip().startswith(('pytest_server_fixtures', 'pytest_fixture_config',
+                                                              'pytest_shutil')):
+            total += int(fields[0].split(':')[1])
+            found = True
+    assert found, "No import times reported"
+    assert total / 1e6 < MAX_IMPORT_SECONDS
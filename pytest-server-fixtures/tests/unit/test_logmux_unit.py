@@ -0,0 +1,97 @@
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    # python 2
+    from mock import Mock
+
+from pytest_server_fixtures.logmux import MUX, ServerLog, create_server_log, get_server_logs
+
+
+def _run(script, server_log):
+    p = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    MUX.add(server_log, p.stdout, p.stderr)
+    p.wait()
+    return p
+
+
+def _wait_for_lines(server_log, n, timeout=10):
+    deadline = time.monotonic() + timeout
+    while len(server_log.tail()) < n and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_ring_buffer_keeps_last_lines():
+    server_log = ServerLog('test', max_lines=3)
+    for i in range(5):
+        server_log.append('line %d' % i)
+    assert server_log.tail() == ['line 2', 'line 3', 'line 4']
+    assert server_log.tail(1) == ['line 4']
+
+
+def test_blank_lines_are_skipped():
+    server_log = ServerLog('test')
+    server_log.append('  ')
+    assert server_log.tail() == []
+
+
+def test_reads_stdout_and_stderr_from_one_thread(tmpdir):
+    threads_before = threading.active_count()
+    logs = [ServerLog('server-%d' % i, path=str(tmpdir.join('%d.log' % i))) for i in range(3)]
+    for i, server_log in enumerate(logs):
+        _run("import sys; print('out %d'); sys.stdout.flush(); sys.stderr.write('err %d')" % (i, i), server_log)
+    for i, server_log in enumerate(logs):
+        _wait_for_lines(server_log, 2)
+        assert sorted(server_log.tail()) == ['err %d' % i, 'out %d' % i]
+    # At most the multiplexer thread itself has been started
+    assert threading.active_count() <= threads_before + 1
+    for server_log in logs:
+        server_log.close()
+
+
+def test_listeners_and_log_file(tmpdir):
+    got = []
+    server_log = create_server_log('MyServer-127.0.0.1-1234', workspace=str(tmpdir), listeners=[got.append])
+    assert server_log not in get_server_logs()
+    _run("print('hello')\nprint('world')", server_log)
+    _wait_for_lines(server_log, 2)
+    assert server_log in get_server_logs()
+    server_log.close()
+    assert server_log not in get_server_logs()
+    assert got == ['hello\n', 'world\n']
+    assert tmpdir.join('server.log').read() == 'hello\nworld\n'
+
+
+def test_failing_stream_does_not_stop_other_servers():
+    bad = ServerLog('bad', listeners=[Mock(side_effect=Exception('boom'))])
+    _run("print('hello')", bad)
+    good = ServerLog('good')
+    _run("print('still reading')", good)
+    _wait_for_lines(good, 1)
+    assert good.tail() == ['still reading']
+    bad.close()
+    good.close()
+
+
+def test_failing_stream_is_drained():
+    # Much more than a pipe buffer, the server would block if nobody read it
+    bad = ServerLog('bad', listeners=[Mock(side_effect=Exception('boom'))])
+    p = _run("import sys\nfor i in range(20000): print('x' * 100)\nsys.stdout.flush()", bad)
+    assert p.returncode == 0
+    assert bad.tail() == []
+    bad.close()
+
+
+def test_stderr_only_echoed_in_debug(capsys, monkeypatch):
+    monkeypatch.delenv('DEBUG', raising=False)
+    server_log = ServerLog('test')
+    server_log.append('quiet', stderr=True)
+    assert capsys.readouterr().err == ''
+    monkeypatch.setenv('DEBUG', '1')
+    server_log.append('loud', stderr=True)
+    assert capsys.readouterr().err == 'loud\n'
+    assert server_log.tail() == ['quiet', 'loud']
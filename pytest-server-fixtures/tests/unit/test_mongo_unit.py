@@ -0,0 +1,248 @@
+import threading
+
+import pytest
+
+try:
+    from unittest.mock import Mock, MagicMock, PropertyMock, call, patch
+except ImportError:
+    # python 2
+    from mock import Mock, MagicMock, PropertyMock, call, patch
+
+from pymongo.errors import AutoReconnect
+
+from pytest_server_fixtures import mongo
+from pytest_server_fixtures.group import ServerTopologyError
+from pytest_server_fixtures.mongo import (MONGO_PROFILES, MongoTestServer, MongoReplicaSetTestServer,
+                                          MongoShardedTestServer, load, read_documents)
+
+
+def _server(**kwargs):
+    with patch('pytest_server_fixtures.mongo.TestServerV2.__init__', Mock(return_value=None)), \
+            patch('pytest_server_fixtures.mongo.TestServerV2._get_port', Mock(return_value=27017)):
+        server = MongoTestServer(**kwargs)
+    server.api = MagicMock()
+    server._listen_hostname = '127.0.0.1'
+    return server
+
+
+@patch('pytest_server_fixtures.mongo.TestServerV2.teardown', Mock())
+def test_profile_args():
+    args = _server(profile='tiny').get_args(workspace='/tmp/ws')
+    assert '--dbpath=/tmp/ws' in args
+    assert args[-len(MONGO_PROFILES['tiny']['args']):] == MONGO_PROFILES['tiny']['args']
+    assert '--wiredTigerCacheSizeGB=0.25' in args
+
+
+@patch('pytest_server_fixtures.mongo.CONFIG')
+@patch('pytest_server_fixtures.mongo.TestServerV2.teardown', Mock())
+def test_profile_defaults_to_config(mock_config):
+    mock_config.mongo_profile = 'throughput'
+    assert _server().profile == 'throughput'
+    assert _server(profile='tiny').profile == 'tiny'
+
+
+@patch('pytest_server_fixtures.mongo.CONFIG')
+def test_profile_storage(mock_config):
+    mock_config.mongo_profile = 'default'
+    mock_config.storage = None
+    with patch('pytest_server_fixtures.mongo.TestServerV2.__init__', Mock(return_value=None)) as init, \
+            patch('pytest_server_fixtures.mongo.TestServerV2._get_port', Mock(return_value=27017)), \
+            patch('pytest_server_fixtures.mongo.TestServerV2.teardown', Mock()):
+        MongoTestServer(profile='tiny')
+        assert init.call_args[1]['storage'] == 'memory'
+        MongoTestServer(profile='tiny', storage='/fast')
+        assert init.call_args[1]['storage'] == '/fast'
+        MongoTestServer()
+        assert init.call_args[1]['storage'] is None
+
+
+@patch('pytest_server_fixtures.mongo.MongoTestServer.hostname', PropertyMock(return_value='127.0.0.1'))
+@patch('pytest_server_fixtures.mongo.TestServerV2.teardown', Mock())
+def test_one_client_probes_and_becomes_api():
+    server = _server()
+    server.api = None
+    with patch('pymongo.MongoClient') as client_cls:
+        client_cls.return_value.admin.command.side_effect = [AutoReconnect('starting'), {'ok': 1}]
+        assert not server.check_server_up()
+        assert server.check_server_up()
+    client_cls.assert_called_once_with('127.0.0.1', 27017)
+    assert server.api is client_cls.return_value
+
+
+@patch('pytest_server_fixtures.mongo.CONFIG')
+@patch('pytest_server_fixtures.mongo.MongoTestServer.hostname', PropertyMock(return_value='127.0.0.1'))
+@patch('pytest_server_fixtures.mongo.TestServerV2.teardown', Mock())
+def test_client_pool_size(mock_config):
+    mock_config.mongo_profile = 'default'
+    mock_config.mongo_max_pool_size = '5'
+    with patch('pymongo.MongoClient') as client_cls:
+        for server in (_server(), _server(max_pool_size=2)):
+            server.api = None
+            server.check_server_up()
+    assert [c[1] for c in client_cls.call_args_list] == [{'maxPoolSize': 5}, {'maxPoolSize': 2}]
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        MongoTestServer(profile='huge')
+
+
+@patch('pytest_server_fixtures.mongo.TestServerV2.teardown', Mock())
+def test_create_database():
+    server = _server()
+    indexes = [Mock()]
+    db = server.create_database('test_foo[a/b.c]', {'users': indexes, 'events': []})
+    name = server.api.__getitem__.call_args[0][0]
+    assert name.startswith('test_foo_a_b_c__')
+    assert db is server.api[name]
+    db.create_collection.assert_any_call('users')
+    db.create_collection.assert_any_call('events')
+    db['users'].create_indexes.assert_called_once_with(indexes)
+
+
+@patch('pytest_server_fixtures.mongo.TestServerV2.teardown', Mock())
+def test_create_database_names_are_unique_and_short():
+    server = _server()
+    server.create_database('x' * 100)
+    server.create_database('x' * 100)
+    names = [c[0][0] for c in server.api.__getitem__.call_args_list]
+    assert names[0] != names[1]
+    assert all(len(n) < 64 for n in names)
+
+
+@patch('pytest_server_fixtures.mongo.TestServerV2.teardown', Mock())
+def test_teardown_waits_for_drops():
+    server = _server()
+    api = server.api
+    dropping = threading.Event()
+    api.drop_database.side_effect = lambda name: dropping.wait(10)
+    server.drop_database('test_db')
+    dropping.set()
+    server.teardown()
+    api.drop_database.assert_called_once_with('test_db')
+    api.close.assert_called_once_with()
+
+
+def _member(i, state='PRIMARY'):
+    member = Mock(hostname='127.0.0.1', port=27017 + i)
+    member.api.admin.command.side_effect = lambda cmd, *args: {
+        'replSetGetStatus': {'members': [{'stateStr': state}, {'stateStr': 'SECONDARY'}]},
+    }.get(cmd)
+    return member
+
+
+def test_replica_set_initiated_with_all_members():
+    members = [_member(i) for i in range(2)]
+    with patch('pytest_server_fixtures.mongo.MongoTestServer', Mock(side_effect=members)) as server_cls:
+        replica_set = MongoReplicaSetTestServer(members=2, name='rs1')
+    server_cls.assert_called_with(replica_set='rs1')
+    replica_set.start()
+    members[0].api.admin.command.assert_any_call('replSetInitiate', {
+        '_id': 'rs1',
+        'members': [{'_id': 0, 'host': '127.0.0.1:27017'}, {'_id': 1, 'host': '127.0.0.1:27018'}],
+    })
+    assert replica_set.connection_string == 'rs1/127.0.0.1:27017,127.0.0.1:27018'
+
+
+def test_replica_set_torn_down_without_primary():
+    members = [_member(i, state='STARTUP2') for i in range(2)]
+    with patch('pytest_server_fixtures.mongo.MongoTestServer', Mock(side_effect=members)):
+        replica_set = MongoReplicaSetTestServer(members=2)
+    replica_set.topology_timeout = 0.1
+    with pytest.raises(ServerTopologyError):
+        replica_set.start()
+    for member in members:
+        member.teardown.assert_called_once_with()
+
+
+def test_sharded_cluster_adds_shards_via_router():
+    members = [_member(i) for i in range(3)]
+    router = Mock()
+    with patch('pytest_server_fixtures.mongo.MongoTestServer', Mock(side_effect=members)), \
+            patch('pytest_server_fixtures.mongo.MongosTestServer', Mock(return_value=router)) as router_cls:
+        cluster = MongoShardedTestServer(shards=2)
+    assert len(cluster) == 3
+    router_cls.assert_called_once_with(cluster.config_servers)
+    cluster.start()
+    router.start.assert_called_once_with()
+    router.api.admin.command.assert_any_call('addShard', 'shard0/127.0.0.1:27017')
+    router.api.admin.command.assert_any_call('addShard', 'shard1/127.0.0.1:27018')
+    configsvr_init = members[2].api.admin.command.call_args_list[0][0]
+    assert configsvr_init[1]['configsvr'] is True
+
+    cluster.teardown()
+    router.teardown.assert_called_once_with()
+    for member in members:
+        member.teardown.assert_called_once_with()
+
+
+@pytest.fixture(autouse=True)
+def clear_batch_cache():
+    yield
+    mongo._batch_cache.clear()
+
+
+def _write_docs(tmpdir):
+    path = tmpdir / 'docs.jsonl'
+    path.write('{"_id": 1, "a": "b"}\n\n{"_id": 2, "when": {"$date": "2020-01-01T00:00:00Z"}}\n{"_id": 3}\n')
+    return path
+
+
+def test_read_documents_formats(tmpdir):
+    jsonl = _write_docs(tmpdir)
+    docs = list(read_documents(jsonl))
+    assert [d['_id'] for d in docs] == [1, 2, 3]
+    assert docs[1]['when'].year == 2020
+
+    json_path = tmpdir / 'docs.json'
+    json_path.write('[{"_id": 1}, {"_id": 2}]')
+    assert [d['_id'] for d in read_documents(json_path)] == [1, 2]
+
+    bson_path = tmpdir / 'docs.bson'
+    bson_path.write_binary(b''.join(d.raw for d in docs))
+    assert [d['_id'] for d in read_documents(bson_path)] == [1, 2, 3]
+
+    bson_path.write_binary(docs[0].raw[:-1])
+    with pytest.raises(ValueError):
+        list(read_documents(bson_path))
+
+    with pytest.raises(ValueError):
+        list(read_documents(tmpdir / 'docs.xml'))
+
+
+def test_load_batches_then_indexes(tmpdir):
+    collection = Mock()
+    indexes = [Mock()]
+    assert load(collection, _write_docs(tmpdir), indexes=indexes, batch_size=2) == 3
+    batches = [c[0][0] for c in collection.insert_many.call_args_list]
+    assert [[d['_id'] for d in batch] for batch in batches] == [[1, 2], [3]]
+    assert all(c[1] == {'ordered': False} for c in collection.insert_many.call_args_list)
+    assert collection.method_calls[-1] == call.create_indexes(indexes)
+
+
+def test_load_reuses_parsed_batches(tmpdir):
+    path = _write_docs(tmpdir)
+    first, second = Mock(), Mock()
+    load(first, path)
+    with patch('pytest_server_fixtures.mongo.read_documents') as read:
+        load(second, str(path))
+    assert not read.called
+    assert second.insert_many.call_args[0][0] is first.insert_many.call_args[0][0]
+
+
+@patch('pytest_server_fixtures.mongo.LOAD_CACHE_BYTES', 10)
+def test_load_does_not_cache_big_files(tmpdir):
+    path = _write_docs(tmpdir)
+    load(Mock(), path)
+    with patch('pytest_server_fixtures.mongo.read_documents', Mock(return_value=[])) as read:
+        load(Mock(), path)
+    assert read.called
+
+
+@patch('pytest_server_fixtures.mongo.TestServerV2.teardown', Mock())
+def test_create_database_loads_data_before_indexes(tmpdir):
+    server = _server()
+    indexes = [Mock()]
+    db = server.create_database('test', {'users': indexes}, {'users': str(_write_docs(tmpdir))})
+    assert not db.create_collection.called
+    assert [c[0] for c in db['users'].method_calls] == ['insert_many', 'create_indexes']
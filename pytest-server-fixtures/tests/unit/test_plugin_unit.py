@@ -0,0 +1,38 @@
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    # python 2
+    from mock import Mock, patch
+
+import pytest
+
+from pytest_server_fixtures import plugin
+from pytest_server_fixtures.group import ServerGroup
+from pytest_server_fixtures.logmux import ServerLog
+
+
+@patch('pytest_server_fixtures.plugin._write_trace')
+@patch('pytest_server_fixtures.plugin.join_background', Mock())
+@patch('docker.from_env', Mock(side_effect=Exception('Cannot connect to the Docker daemon')))
+def test_sessionfinish_survives_docker_errors(write_trace):
+    session = Mock()
+    with patch.object(plugin.CONFIG, 'server_class', 'docker'), \
+            patch.object(plugin.CONFIG, 'docker_reuse', 'session'):
+        plugin.pytest_sessionfinish(session)
+    write_trace.assert_called_once_with(session)
+
+
+def test_failure_report_only_shows_logs_of_the_test_servers():
+    used, unused, grouped = ServerLog('used'), ServerLog('unused'), ServerLog('grouped')
+    for server_log in (used, unused, grouped):
+        server_log.append('hello from %s' % server_log.name)
+    item = Mock(funcargs={'server': Mock(_server_log=used),
+                          'group': ServerGroup(Mock(_server_log=grouped)),
+                          'other': 'not a server'})
+    report = Mock(failed=True, sections=[])
+    outcome = Mock(get_result=Mock(return_value=report))
+    hook = plugin.pytest_runtest_makereport(item, Mock())
+    next(hook)
+    with pytest.raises(StopIteration):
+        hook.send(outcome)
+    assert [name for name, _ in report.sections] == ['Captured server log used', 'Captured server log grouped']
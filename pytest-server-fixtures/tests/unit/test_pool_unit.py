@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+try:
+    from unittest.mock import Mock, patch, sentinel
+except ImportError:
+    # python 2
+    from mock import Mock, patch, sentinel
+
+from pytest_server_fixtures.background import join_background, run_in_background
+from pytest_server_fixtures.pool import ServerPool, ServerPoolClosedException, server_pool
+
+
+def test_acquire_refills_pool():
+    factory = Mock(side_effect=lambda: Mock())
+    pool = ServerPool(factory, 2)
+    server = pool.acquire()
+    server.start.assert_called_once_with()
+    pool.close()
+    # Two spares plus one to replace the server we took
+    assert factory.call_count == 3
+    assert not server.teardown.called
+
+
+def test_release_tears_down_in_background():
+    pool = ServerPool(Mock, 1)
+    server = pool.acquire()
+    pool.release(server)
+    assert join_background(timeout=10)
+    server.teardown.assert_called_once_with()
+    pool.close()
+
+
+def test_close_tears_down_spares():
+    servers = [Mock(), Mock()]
+    pool = ServerPool(Mock(side_effect=servers), 2)
+    pool.close()
+    for server in servers:
+        server.teardown.assert_called_once_with()
+    with pytest.raises(ServerPoolClosedException):
+        pool.acquire()
+
+
+def test_close_does_not_wait_for_other_background_work():
+    blocker = threading.Event()
+    other = run_in_background(blocker.wait)
+    servers = [Mock(), Mock()]
+    pool = ServerPool(Mock(side_effect=servers), 1)
+    pool.release(pool.acquire())
+    pool.close()
+    for server in servers:
+        server.teardown.assert_called_once_with()
+    assert not other.done()
+    blocker.set()
+    other.result(timeout=10)
+
+
+def test_acquire_raises_start_failure():
+    server = Mock()
+    server.start.side_effect = OSError("no such file")
+    pool = ServerPool(Mock(return_value=server), 1)
+    with pytest.raises(OSError):
+        pool.acquire()
+    server.teardown.assert_called_with()
+    pool.close()
+
+
+def test_server_pool_disabled():
+    request = Mock()
+    with patch('pytest_server_fixtures.pool.CONFIG') as config:
+        config.server_pool_size = 0
+        assert server_pool(request, sentinel.factory) is None
+    assert not request.addfinalizer.called
+
+
+def test_server_pool_kubernetes_size():
+    request = Mock()
+    with patch('pytest_server_fixtures.pool.CONFIG') as config, \
+            patch('pytest_server_fixtures.pool.ServerPool') as mock_pool:
+        config.server_pool_size = 0
+        config.server_class = 'kubernetes'
+        config.k8s_pool_size = '4'
+        assert server_pool(request, sentinel.factory) is mock_pool.return_value
+    mock_pool.assert_called_once_with(sentinel.factory, 4)
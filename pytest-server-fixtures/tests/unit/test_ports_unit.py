@@ -0,0 +1,119 @@
+import errno
+import os
+import socket
+
+import pytest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # python 2
+    from mock import patch
+
+from pytest_server_fixtures import ports
+from pytest_server_fixtures.base import get_ephemeral_host, get_ephemeral_port
+from pytest_server_fixtures.locks import get_lock_dir, try_lock
+
+
+def test_reserved_port_is_not_handed_out_again():
+    first = ports.reserve_port('127.0.0.1')
+    try:
+        second = ports.reserve_port('127.0.0.1', port=first.port)
+        assert second.port != first.port
+        second.release()
+    finally:
+        first.release()
+    third = ports.reserve_port('127.0.0.1', port=first.port)
+    assert third.port == first.port
+    third.release()
+
+
+def test_bound_port_is_skipped():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    s.listen(1)
+    port = s.getsockname()[1]
+    try:
+        with patch.object(ports.CONFIG, 'port_range', '%d-%d' % (port, port + 10)):
+            reservation = ports.reserve_port('127.0.0.1', port=port)
+        assert reservation.port != port
+        reservation.release()
+    finally:
+        s.close()
+
+
+def test_allocate_and_release_port():
+    port = ports.allocate_port('127.0.0.1')
+    assert port in ports._reservations
+    ports.release_port(port)
+    assert port not in ports._reservations
+    # Releasing twice is harmless
+    ports.release_port(port)
+
+
+def test_ephemeral_port_is_not_left_reserved():
+    port = get_ephemeral_port(host='127.0.0.1')
+    assert port not in ports._reservations
+    reservation = ports.reserve_port('127.0.0.1', port=port)
+    assert reservation.port == port
+    reservation.release()
+
+
+def test_ports_allocated_without_lock_files():
+    read_only = OSError(errno.EROFS, 'Read-only file system')
+    with patch('pytest_server_fixtures.locks.os.makedirs', side_effect=read_only), \
+            patch.object(ports, '_locking_unavailable', False):
+        first = ports.allocate_port('127.0.0.1')
+        assert ports._locking_unavailable
+        # Still not handed out twice within this process
+        second = ports.allocate_port('127.0.0.1', port=first)
+        assert second != first
+        ports.release_port(first)
+        ports.release_port(second)
+
+
+@pytest.mark.parametrize('worker, expected', [('gw0', (1000, 1249)), ('gw3', (1750, 1999))])
+def test_port_range_partitioned_by_xdist_worker(worker, expected):
+    with patch.dict(os.environ, {'PYTEST_XDIST_WORKER': worker, 'PYTEST_XDIST_WORKER_COUNT': '4'}), \
+            patch.object(ports.CONFIG, 'port_range', '1000-1999'), \
+            patch.object(ports.CONFIG, 'xdist_partition', True):
+        assert ports.get_port_range() == expected
+
+
+def test_port_range_not_partitioned_by_default():
+    with patch.dict(os.environ, {'PYTEST_XDIST_WORKER': 'gw3', 'PYTEST_XDIST_WORKER_COUNT': '4'}), \
+            patch.object(ports.CONFIG, 'port_range', '1000-1999'), \
+            patch.object(ports.CONFIG, 'xdist_partition', False):
+        assert ports.get_port_range() == (1000, 1999)
+
+
+def test_ephemeral_host_in_worker_subnet():
+    with patch.dict(os.environ, {'PYTEST_XDIST_WORKER': 'gw2'}), \
+            patch.object(ports.CONFIG, 'xdist_partition', True), \
+            patch('pytest_server_fixtures.base.OSX', False):
+        assert get_ephemeral_host(cached=False).startswith('127.3.')
+
+
+def test_released_port_leaves_no_lock_file():
+    reservation = ports.reserve_port('127.0.0.1')
+    path = os.path.join(get_lock_dir('ports'), '%s.lock' % reservation.port)
+    assert os.path.exists(path)
+    reservation.release()
+    assert not os.path.exists(path)
+
+
+def test_lock_dir_without_uids():
+    with patch('pytest_server_fixtures.locks.os') as mock_os, \
+            patch('pytest_server_fixtures.locks.getpass.getuser', return_value='me'):
+        del mock_os.getuid
+        mock_os.path = os.path
+        assert get_lock_dir('ports').endswith('pytest-server-fixtures-ports-me')
+
+
+def test_lock_on_unlinked_file_is_retried():
+    first = try_lock('ports', 'unlink-test')
+    first.release(unlink=True)
+    second = try_lock('ports', 'unlink-test')
+    assert second is not None
+    assert try_lock('ports', 'unlink-test') is None
+    second.release(unlink=True)
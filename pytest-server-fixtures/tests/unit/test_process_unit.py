@@ -0,0 +1,79 @@
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+import psutil
+import pytest
+
+from pytest_server_fixtures.process import (ListeningPidFinder, _decode_address, find_listening_pids,
+                                            stop_process_tree, wait_for_exit)
+
+needs_proc = pytest.mark.skipif(not os.path.exists('/proc/net/tcp'), reason="Needs /proc")
+
+
+@pytest.fixture
+def listening_socket():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    s.listen(1)
+    yield s
+    s.close()
+
+
+@needs_proc
+def test_decode_address():
+    hex_addr = '%08X' % struct.unpack('=I', socket.inet_aton('127.1.2.3'))[0]
+    assert _decode_address(hex_addr) == '127.1.2.3'
+
+
+@needs_proc
+def test_find_listening_pids(listening_socket):
+    port = listening_socket.getsockname()[1]
+    assert find_listening_pids('127.0.0.1', port) == [os.getpid()]
+    assert find_listening_pids('127.0.0.2', port) == []
+
+
+@needs_proc
+def test_finder_notices_socket_closing(listening_socket):
+    finder = ListeningPidFinder('127.0.0.1', listening_socket.getsockname()[1])
+    assert finder.find() == [os.getpid()]
+    listening_socket.close()
+    assert finder.find() == []
+
+
+def _start(code):
+    return subprocess.Popen([sys.executable, '-c', code], start_new_session=True)
+
+
+def test_wait_for_exit():
+    p = _start('import time; time.sleep(30)')
+    assert not wait_for_exit(p.pid, 0.05)
+    p.kill()
+    start = time.monotonic()
+    assert wait_for_exit(p.pid, 10)
+    assert time.monotonic() - start < 5
+    p.wait()
+
+
+def test_stop_process_tree_kills_group():
+    p = _start('import subprocess, sys, time; '
+               'subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"]); time.sleep(30)')
+    time.sleep(0.5)
+    child = psutil.Process(p.pid).children()[0]
+    start = time.monotonic()
+    assert stop_process_tree(p.pid, timeout=10) == []
+    assert time.monotonic() - start < 5
+    assert not child.is_running()
+    p.wait()
+
+
+def test_stop_process_tree_escalates_to_sigkill():
+    p = _start('import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); '
+               'time.sleep(30)')
+    time.sleep(0.5)
+    assert stop_process_tree(p.pid, timeout=0.1, kill_timeout=10) == []
+    assert p.wait() == -signal.SIGKILL
@@ -0,0 +1,91 @@
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    # python 2
+    from mock import Mock
+
+from pytest_server_fixtures.readiness import (LogLineWatcher, ReadinessMonitor, ServerExitedError,
+                                              wait_for_go)
+
+
+def test_log_watcher_wakes_monitor():
+    watcher = LogLineWatcher(r'Ready to accept connections')
+    monitor = ReadinessMonitor(log_watcher=watcher)
+    try:
+        watcher("loading data\n")
+        assert not watcher.matched
+        threading.Timer(0.05, watcher, ["* Ready to accept connections tcp\n"]).start()
+        start = time.monotonic()
+        assert monitor.wait(10)
+        assert time.monotonic() - start < 5
+        assert watcher.matched
+    finally:
+        monitor.close()
+        watcher.close()
+
+
+def test_closed_log_watcher_ignores_output():
+    watcher = LogLineWatcher(r'ready')
+    watcher.close()
+    watcher("ready\n")
+    assert not watcher.matched
+
+
+def test_tcp_probe_wakes_monitor_when_port_opens():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    monitor = ReadinessMonitor(hostname='127.0.0.1', port=port)
+    try:
+        assert not monitor.wait(0.05)
+        sock.listen(1)
+        assert monitor.wait(10)
+        # The probe only fires once
+        assert not monitor.wait(0.05)
+    finally:
+        monitor.close()
+        sock.close()
+
+
+def test_monitor_raises_when_process_fails():
+    p = subprocess.Popen([sys.executable, '-c', 'import sys; sys.exit(3)'])
+    monitor = ReadinessMonitor(process=p)
+    try:
+        with pytest.raises(ServerExitedError):
+            monitor.wait(10)
+    finally:
+        monitor.close()
+
+
+def test_monitor_ignores_daemonising_process():
+    p = subprocess.Popen([sys.executable, '-c', 'pass'])
+    p.wait()
+    monitor = ReadinessMonitor(process=p)
+    try:
+        assert not monitor.wait(0.05)
+    finally:
+        monitor.close()
+
+
+def test_wait_for_go_checks_again_on_signal():
+    monitor = Mock()
+    monitor.wait.side_effect = [True, False]
+    check_server_up = Mock(side_effect=[False, True])
+    wait_for_go(check_server_up, monitor, start_interval=1)
+    assert check_server_up.call_count == 2
+    assert monitor.wait.call_count == 1
+
+
+def test_wait_for_go_gives_up():
+    check_server_up = Mock(return_value=False)
+    with pytest.raises(ValueError):
+        wait_for_go(check_server_up, start_interval=0.001, retries_per_interval=2, retry_limit=4)
+    assert check_server_up.call_count == 4
@@ -0,0 +1,72 @@
+import os
+import subprocess
+
+import pytest
+
+try:
+    from unittest.mock import patch, Mock
+except ImportError:
+    # python 2
+    from mock import patch, Mock
+
+from pytest_server_fixtures import reaper
+from pytest_server_fixtures.locks import try_lock
+from pytest_server_fixtures.process import wait_for_exit
+
+
+@pytest.fixture
+def session_id():
+    with patch('pytest_server_fixtures.reaper.CONFIG') as mock_config:
+        mock_config.session_id = 'reaper-test-%d' % os.getpid()
+        yield mock_config.session_id
+
+
+def test_server_env_is_a_tagged_copy(session_id):
+    env = {'FOO': 'bar'}
+    tagged = reaper.server_env(env)
+    assert tagged == {'FOO': 'bar', reaper.SESSION_ENV: session_id}
+    assert env == {'FOO': 'bar'}
+
+
+def test_find_dead_sessions(session_id):
+    live = try_lock(reaper.LOCK_KIND, session_id + '-live', shared=True)
+    dead = try_lock(reaper.LOCK_KIND, session_id + '-dead', shared=True)
+    dead.release()
+    try:
+        found = reaper.find_dead_sessions()
+        try:
+            assert session_id + '-dead' in found
+            assert session_id + '-live' not in found
+        finally:
+            for lock in found.values():
+                lock.release()
+    finally:
+        os.unlink(dead.path)
+        os.unlink(live.path)
+        live.release()
+
+
+def test_reap_processes_kills_tagged_processes(session_id):
+    proc = subprocess.Popen(['sleep', '60'], env=reaper.server_env(os.environ))
+    other = subprocess.Popen(['sleep', '60'])
+    try:
+        reaper.reap_processes({session_id})
+        assert wait_for_exit(proc.pid, 5)
+        assert other.poll() is None
+    finally:
+        for p in (proc, other):
+            p.kill()
+            p.wait()
+
+
+def test_reap_containers_leaves_reusable_containers():
+    docker = pytest.importorskip('docker')
+    containers = [Mock(labels={'server-fixtures/session-id': 'dead'}),
+                  Mock(labels={'server-fixtures/session-id': 'dead', 'server-fixtures/reuse-key': 'abc'}),
+                  Mock(labels={'server-fixtures/session-id': 'alive'})]
+    with patch.object(docker, 'from_env') as mock_from_env:
+        mock_from_env.return_value.containers.list.return_value = containers
+        reaper.reap_containers({'dead'})
+    assert containers[0].remove.called
+    assert not containers[1].remove.called
+    assert not containers[2].remove.called
@@ -0,0 +1,151 @@
+import pytest
+
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    # python 2
+    from mock import Mock, patch
+
+from pytest_server_fixtures.background import join_background
+from pytest_server_fixtures.group import ServerTopologyError
+from pytest_server_fixtures.redis import (RedisDatabasePool, RedisDatabasePoolExhausted, RedisTestServer,
+                                          RedisClusterTestServer, RedisReplicatedTestServer,
+                                          read_seed_commands, seed)
+
+
+@pytest.fixture
+def mock_redis():
+    with patch('pytest_server_fixtures.redis.redis', create=True) as mock_redis:
+        yield mock_redis
+
+
+def _pool(databases):
+    return RedisDatabasePool(Mock(hostname='localhost', port=6379, databases=databases, db=0), timeout=0.01)
+
+
+def test_databases_are_not_shared(mock_redis):
+    pool = _pool(3)
+    dbs = [pool.acquire(), pool.acquire()]
+    assert sorted(d.db for d in dbs) == [1, 2]
+    with pytest.raises(RedisDatabasePoolExhausted):
+        pool.acquire()
+
+
+def test_server_db_is_never_handed_out(mock_redis):
+    pool = _pool(16)
+    assert 0 not in [pool.acquire().db for _ in range(15)]
+    with pytest.raises(RedisDatabasePoolExhausted):
+        pool.acquire()
+
+
+def test_release_flushes_and_returns_database(mock_redis):
+    pool = _pool(2)
+    database = pool.acquire()
+    assert database.api is mock_redis.Redis.return_value
+    mock_redis.Redis.assert_called_once_with(host='localhost', port=6379, db=1)
+    pool.release(database)
+    assert join_background(timeout=10)
+    database.api.flushdb.assert_called_once_with(asynchronous=True)
+    assert pool.acquire().db == 1
+
+
+def test_failed_flush_does_not_return_database(mock_redis):
+    pool = _pool(2)
+    database = pool.acquire()
+    database.api.flushdb.side_effect = Exception('Connection refused')
+    pool.release(database)
+    assert join_background(timeout=10)
+    with pytest.raises(RedisDatabasePoolExhausted):
+        pool.acquire()
+
+
+@patch('pytest_server_fixtures.redis.CONFIG')
+@patch('pytest_server_fixtures.redis.TestServerV2.__init__', Mock(return_value=None))
+@patch('pytest_server_fixtures.redis.TestServerV2.teardown', Mock())
+@patch('pytest_server_fixtures.redis.TestServerV2._get_port', Mock(return_value=6379))
+def test_server_databases(mock_config):
+    mock_config.redis_databases = 8
+    assert RedisTestServer().databases == 8
+    assert RedisTestServer(databases=2).databases == 2
+
+
+def test_read_json_seed(tmpdir):
+    path = tmpdir / 'seed.json'
+    path.write('{"a": "1", "b": 2, "c": ["x", "y"], "d": {"f": "v"}, "e": []}')
+    assert list(read_seed_commands(path)) == [('SET', 'a', '1'), ('SET', 'b', 2), ('RPUSH', 'c', 'x', 'y'),
+                                              ('HSET', 'd', 'f', 'v')]
+
+
+def test_read_csv_seed(tmpdir):
+    path = tmpdir / 'seed.txt'
+    path.write('SET,a,1\n\nSADD,s,"x,y",z\n')
+    assert list(read_seed_commands(path, format='csv')) == [('SET', 'a', '1'), ('SADD', 's', 'x,y', 'z')]
+
+
+def test_read_resp_seed(tmpdir):
+    path = tmpdir / 'seed.resp'
+    path.write_binary(b'*3\r\n$3\r\nSET\r\n$1\r\na\r\n$4\r\n1\r\n2\r\n*2\r\n$4\r\nINCR\r\n$1\r\nb\r\n')
+    assert list(read_seed_commands(path)) == [(b'SET', b'a', b'1\r\n2'), (b'INCR', b'b')]
+
+
+def test_read_unknown_seed_format(tmpdir):
+    with pytest.raises(ValueError):
+        list(read_seed_commands(tmpdir / 'seed.xml'))
+
+
+def test_seed_pipelines_commands():
+    client = Mock()
+    pipe = client.pipeline.return_value
+    assert seed(client, [('SET', str(i), i) for i in range(25)], batch_size=10) == 25
+    client.pipeline.assert_called_once_with(transaction=False)
+    assert pipe.execute_command.call_count == 25
+    assert pipe.execute.call_count == 3
+
+
+def _node(i):
+    node = Mock(hostname='127.0.0.1', port=7000 + i)
+    node.api.execute_command.side_effect = lambda cmd, *args: {
+        'CLUSTER INFO': {'cluster_state': 'ok', 'cluster_known_nodes': '4'},
+        'CLUSTER MYID': ('id%d' % i).encode('utf-8'),
+    }.get(cmd)
+    node.api.info.return_value = {'master_link_status': 'up'}
+    return node
+
+
+def test_cluster_assigns_all_slots_and_replicas():
+    nodes = [_node(i) for i in range(4)]
+    with patch('pytest_server_fixtures.redis.RedisTestServer', Mock(side_effect=nodes)):
+        cluster = RedisClusterTestServer(primaries=2, replicas_per_primary=1)
+    cluster.start()
+
+    slots = [call[0][1:] for n in nodes for call in n.api.execute_command.call_args_list
+             if call[0][0] == 'CLUSTER ADDSLOTS']
+    assert sorted(s for node_slots in slots for s in node_slots) == list(range(16384))
+    for node in nodes[1:]:
+        node.api.execute_command.assert_any_call('CLUSTER MEET', '127.0.0.1', 7000)
+    nodes[2].api.execute_command.assert_any_call('CLUSTER REPLICATE', 'id0')
+    nodes[3].api.execute_command.assert_any_call('CLUSTER REPLICATE', 'id1')
+
+
+def test_replicas_follow_primary():
+    servers = [_node(i) for i in range(3)]
+    with patch('pytest_server_fixtures.redis.RedisTestServer', Mock(side_effect=servers)):
+        replicated = RedisReplicatedTestServer(replicas=2)
+    replicated.start()
+    primary = replicated.primary
+    assert replicated.api is primary.api
+    assert len(replicated.replicas) == 2
+    for replica in replicated.replicas:
+        replica.api.execute_command.assert_called_once_with('REPLICAOF', primary.hostname, primary.port)
+
+
+def test_topology_torn_down_if_it_fails_to_connect():
+    servers = [_node(i) for i in range(2)]
+    servers[1].api.info.return_value = {'master_link_status': 'down'}
+    with patch('pytest_server_fixtures.redis.RedisTestServer', Mock(side_effect=servers)):
+        replicated = RedisReplicatedTestServer(replicas=1)
+    replicated.topology_timeout = 0.1
+    with pytest.raises(ServerTopologyError):
+        replicated.start()
+    for server in servers:
+        server.teardown.assert_called_once_with()
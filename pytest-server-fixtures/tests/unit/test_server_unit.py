@@ -4,6 +4,8 @@ except ImportError:
     # python 2
     from mock import create_autospec, sentinel, call, patch, Mock
 
+import pytest
+
 from pytest_server_fixtures.base import TestServer as _TestServer  # So that pytest doesnt think this is a test case
 
 
@@ -12,7 +14,7 @@ def test_init():
     with patch('pytest_shutil.workspace.Workspace.__init__', autospec=True) as init:
         ts = _TestServer(workspace=ws, delete=sentinel.delete,
                          port=sentinel.port, hostname=sentinel.hostname)
-    assert init.call_args_list == [call(ts, workspace=ws, delete=sentinel.delete)]
+    assert init.call_args_list == [call(ts, workspace=ws, delete=sentinel.delete, storage=None)]
     assert ts.hostname == sentinel.hostname
     assert ts.port == sentinel.port
     assert ts.dead is False
@@ -24,13 +26,52 @@ def test_init():
 
 def test_kill_by_port():
     server = _TestServer(hostname=sentinel.hostname, port=sentinel.port)
-    server.run = Mock(side_effect=['100\n', '', ''])
     server._signal = Mock()
-    with patch('socket.gethostbyname', return_value=sentinel.ip):
+    with patch('socket.gethostbyname', return_value=sentinel.ip), \
+            patch('pytest_server_fixtures.base.ListeningPidFinder') as finder, \
+            patch('pytest_server_fixtures.base.OSX', False):
+        finder.return_value.find.side_effect = [[100], [], []]
         server._find_and_kill_by_port(2, sentinel.signal)
         server.dead = True
-    assert server.run.call_args_list == [call("netstat -anp 2>/dev/null | grep sentinel.ip:sentinel.port "
-                                            "| grep LISTEN | awk '{ print $7 }' | cut -d'/' -f1", capture=True, cd='/'),
-                                       call("netstat -anp 2>/dev/null | grep sentinel.ip:sentinel.port "
-                                            "| grep LISTEN | awk '{ print $7 }' | cut -d'/' -f1", capture=True, cd='/')]
+    # One finder per kill cycle, re-used between retries
+    assert finder.call_args_list == [call(sentinel.ip, sentinel.port)]
+    assert finder.return_value.find.call_count == 2
     assert server._signal.call_args_list == [call(100, sentinel.signal)]
+
+
+def test_old_style_serverclass_without_server_log():
+    created = []
+
+    class OldThread(object):
+        def __init__(self, hostname, port, run_cmd, run_stdin=None, env=None, cwd=None):
+            created.append(run_cmd)
+
+        def start(self):
+            pass
+
+    class Server(_TestServer):
+        serverclass = OldThread
+        run_cmd = ['server']
+
+    server = Server(hostname='127.0.0.1', port=1234)
+    server.wait_for_go = Mock()
+    server.start_server()
+    assert created == [['server']]
+    server.dead = True
+    server.teardown()
+
+
+def test_process_reader_is_deprecated():
+    from pytest_server_fixtures.base import ProcessReader
+    with pytest.warns(DeprecationWarning):
+        ProcessReader(Mock(), Mock(), False)
+
+
+def test_teardown_twice_only_kills_once():
+    server = _TestServer(hostname='127.0.0.1', port=1234)
+    with patch.object(server, '_find_and_kill_by_port') as kill:
+        server.teardown()
+        assert server.dead
+        # eg. __del__ after __exit__
+        server.teardown()
+    assert kill.call_count == 1
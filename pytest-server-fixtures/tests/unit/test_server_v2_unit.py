@@ -12,10 +12,31 @@ def test_init():
                            workspace=sentinel.workspace,
                            delete=sentinel.delete,
                            server_class=sentinel.server_class)
-        assert init.call_args_list == [call(ts, workspace=sentinel.workspace, delete=sentinel.delete)]
+        assert init.call_args_list == [call(ts, workspace=sentinel.workspace, delete=sentinel.delete, storage=None)]
         assert ts._cwd == sentinel.cwd
         assert ts._server_class == sentinel.server_class
 
 def test_hostname_when_server_is_not_started():
     ts = _TestServerV2()
     assert ts.hostname == None
+
+
+class _Server(_TestServerV2):
+    cmd = cmd_local = image = 'server'
+    ready_log_pattern = 'ready'
+
+
+def test_server_class_argument_is_used_for_server_and_log():
+    create_server = Mock(side_effect=RuntimeError('stop here'))
+    with patch('pytest_server_fixtures.base2.create_server', create_server), \
+            patch('pytest_server_fixtures.base2.CONFIG.server_class', 'docker'), \
+            patch.object(_Server, 'port', 1234, create=True):
+        ts = _Server(server_class='thread')
+        try:
+            ts.start()
+        except RuntimeError:
+            pass
+        finally:
+            ts.teardown()
+    assert create_server.call_args[1]['server_class'] == 'thread'
+    assert create_server.call_args[1]['server_log'] is not None
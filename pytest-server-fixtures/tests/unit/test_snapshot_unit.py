@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+try:
+    from unittest.mock import patch, Mock
+except ImportError:
+    # python 2
+    from mock import patch, Mock
+
+from pytest_server_fixtures import snapshot
+
+
+@pytest.fixture
+def snapshot_dir(tmpdir):
+    with patch('pytest_server_fixtures.snapshot.CONFIG') as mock_config:
+        mock_config.snapshots = True
+        mock_config.snapshot_dir = str(tmpdir / 'snapshots')
+        yield mock_config
+
+
+def _create(path):
+    os.makedirs(os.path.join(str(path), 'base'))
+    os.chmod(str(path), 0o700)
+    with open(os.path.join(str(path), 'base', 'data'), 'w') as f:
+        f.write('x' * 100000)
+    os.symlink('base/data', os.path.join(str(path), 'link'))
+
+
+def test_clone_tree(tmpdir):
+    _create(tmpdir / 'src')
+    snapshot.clone_tree(tmpdir / 'src', tmpdir / 'dst')
+    assert (tmpdir / 'dst' / 'base' / 'data').read() == 'x' * 100000
+    assert os.readlink(str(tmpdir / 'dst' / 'link')) == 'base/data'
+    assert os.stat(str(tmpdir / 'dst')).st_mode & 0o777 == 0o700
+    assert (os.stat(str(tmpdir / 'dst' / 'base' / 'data')).st_mtime ==
+            os.stat(str(tmpdir / 'src' / 'base' / 'data')).st_mtime)
+
+
+def test_cached_creates_once(snapshot_dir, tmpdir):
+    create = Mock(side_effect=_create)
+    key = snapshot.get_key('v1')
+    snapshot.cached('test', key, tmpdir / 'a', create)
+    snapshot.cached('test', key, tmpdir / 'b', create)
+    assert create.call_count == 1
+    assert (tmpdir / 'b' / 'base' / 'data').read() == 'x' * 100000
+
+    # Changes to the first server's directory don't leak into the snapshot
+    (tmpdir / 'a' / 'base' / 'data').write('changed')
+    snapshot.cached('test', key, tmpdir / 'c', create)
+    assert (tmpdir / 'c' / 'base' / 'data').read() == 'x' * 100000
+
+    snapshot.cached('test', snapshot.get_key('v2'), tmpdir / 'd', create)
+    assert create.call_count == 2
+
+
+def test_save_keeps_existing_snapshot(snapshot_dir, tmpdir):
+    _create(tmpdir / 'a')
+    snapshot.save('test', 'key', tmpdir / 'a')
+    (tmpdir / 'a' / 'base' / 'data').write('changed')
+    snapshot.save('test', 'key', tmpdir / 'a')
+    assert snapshot.restore('test', 'key', tmpdir / 'b')
+    assert (tmpdir / 'b' / 'base' / 'data').read() == 'x' * 100000
+    assert os.listdir(snapshot_dir.snapshot_dir) == ['test-key']
+
+
+def test_snapshots_disabled(snapshot_dir, tmpdir):
+    snapshot_dir.snapshots = False
+    create = Mock(side_effect=_create)
+    snapshot.cached('test', 'key', tmpdir / 'a', create)
+    snapshot.cached('test', 'key', tmpdir / 'b', create)
+    assert create.call_count == 2
+    assert not os.path.exists(snapshot_dir.snapshot_dir)
@@ -0,0 +1,58 @@
+import json
+import os
+
+import pytest
+
+from pytest_server_fixtures.trace import Tracer
+
+
+def test_spans_not_recorded_when_disabled():
+    tracer = Tracer()
+    with tracer.span('launch'):
+        pass
+    assert tracer.get_events() == []
+
+
+def test_span_recorded_when_enabled():
+    tracer = Tracer()
+    tracer.enabled = True
+    with tracer.span('launch', server='RedisTestServer'):
+        pass
+    spans = [e for e in tracer.get_events() if e['ph'] == 'X']
+    assert len(spans) == 1
+    assert spans[0]['name'] == 'launch'
+    assert spans[0]['cat'] == 'server'
+    assert spans[0]['args'] == {'server': 'RedisTestServer'}
+    assert spans[0]['pid'] == os.getpid()
+    assert spans[0]['dur'] >= 0
+
+
+def test_span_records_error():
+    tracer = Tracer()
+    tracer.enabled = True
+    with pytest.raises(ValueError):
+        with tracer.span('launch'):
+            raise ValueError('boom')
+    [span] = [e for e in tracer.get_events() if e['ph'] == 'X']
+    assert span['args']['error'] == 'ValueError: boom'
+
+
+def test_write_merges_worker_traces(tmpdir):
+    path = str(tmpdir.join('trace.json'))
+    worker = Tracer()
+    worker.enabled = True
+    with worker.span('launch'):
+        pass
+    worker.write(path + '.gw0', process_name='gw0')
+
+    controller = Tracer()
+    controller.enabled = True
+    with controller.span('setup', cat='pytest'):
+        pass
+    controller.write(path, process_name='pytest', merge_pattern=path + '.gw*')
+
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    assert set(e['name'] for e in events if e['ph'] == 'X') == {'launch', 'setup'}
+    assert set(e['args']['name'] for e in events if e['name'] == 'process_name') == {'pytest', 'gw0'}
+    assert not os.path.exists(path + '.gw0')
@@ -13,6 +13,58 @@ from . import cmdline
 
 log = logging.getLogger(__name__)
 
+# Memory-backed (tmpfs) directory used by the 'memory' storage backend
+MEMORY_STORAGE_DIR = '/dev/shm'
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(size):
+    """ Parses a size such as `512M` or `2G` into bytes.
+    """
+    size = str(size).strip().upper()
+    if size.endswith('B'):
+        size = size[:-1]
+    unit = size[-1:] if size[-1:] in _SIZE_UNITS else ''
+    try:
+        return int(float(size[:len(size) - len(unit)]) * _SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError("Invalid size: %r" % size)
+
+
+def get_storage_dir(storage=None):
+    """ Returns the directory to create workspaces in for a storage backend, to pass into
+        tempfile.mkdtemp(dir=xxx) or similar.
+
+    Parameters
+    ----------
+    storage : `str`
+        ``None`` for the default temp dir (see `Workspace.get_base_tempdir`);
+        ``memory`` for RAM-backed storage in /dev/shm;
+        ``memory:<size>``, eg. ``memory:2G``, for RAM-backed storage only if that much of it is free;
+        or the path of a directory, eg. on a fast local disk.
+        Falls back to the default temp dir if memory storage isn't available.
+    """
+    if not storage:
+        return Workspace.get_base_tempdir()
+
+    if storage == 'memory' or storage.startswith('memory:'):
+        if not os.path.isdir(MEMORY_STORAGE_DIR) or not os.access(MEMORY_STORAGE_DIR, os.W_OK):
+            log.warning("%s is not available, using the default temp dir" % MEMORY_STORAGE_DIR)
+            return Workspace.get_base_tempdir()
+        if ':' in storage:
+            size = parse_size(storage.split(':', 1)[1])
+            st = os.statvfs(MEMORY_STORAGE_DIR)
+            free = st.f_bavail * st.f_frsize
+            if free < size:
+                log.warning("Only %d bytes free in %s, %d needed. Using the default temp dir"
+                            % (free, MEMORY_STORAGE_DIR, size))
+                return Workspace.get_base_tempdir()
+        return MEMORY_STORAGE_DIR
+
+    os.makedirs(storage, exist_ok=True)
+    return storage
+
 
 @pytest.yield_fixture()
 def workspace():
@@ -36,17 +88,19 @@ class Workspace(object):
     """
     Creates a temp workspace, cleans up on teardown. Can also be used as a context manager.
     Has a 'run' method to execute commands relative to this directory.
+
+    The storage backend for a temp workspace can be chosen with `storage`, see `get_storage_dir`.
     """
     debug = False
     delete = True
 
-    def __init__(self, workspace=None, delete=None):
+    def __init__(self, workspace=None, delete=None, storage=None):
         self.delete = delete
 
         log.debug("")
         log.debug("=======================================================")
         if workspace is None:
-            self.workspace = Path(tempfile.mkdtemp(dir=self.get_base_tempdir()))
+            self.workspace = Path(tempfile.mkdtemp(dir=get_storage_dir(storage)))
             log.debug("pytest_shutil created workspace %s" % self.workspace)
 
         else:
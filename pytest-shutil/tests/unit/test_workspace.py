@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from pytest_shutil import workspace
+from pytest_shutil.workspace import Workspace, get_storage_dir, parse_size
+
+
+def test_parse_size():
+    assert parse_size('100') == 100
+    assert parse_size('4k') == 4096
+    assert parse_size('512M') == 512 * 1024 ** 2
+    assert parse_size('1.5GB') == 3 * 1024 ** 3 // 2
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+
+def test_default_storage(monkeypatch):
+    monkeypatch.setenv('WORKSPACE', '/some/ci/workspace')
+    assert get_storage_dir(None) == '/some/ci/workspace'
+
+
+def test_memory_storage(monkeypatch, tmpdir):
+    monkeypatch.setattr(workspace, 'MEMORY_STORAGE_DIR', str(tmpdir))
+    assert get_storage_dir('memory') == str(tmpdir)
+    assert get_storage_dir('memory:1k') == str(tmpdir)
+
+
+def test_memory_storage_falls_back_when_full(monkeypatch, tmpdir):
+    monkeypatch.setattr(workspace, 'MEMORY_STORAGE_DIR', str(tmpdir))
+    monkeypatch.setenv('WORKSPACE', '/some/ci/workspace')
+    assert get_storage_dir('memory:1000T') == '/some/ci/workspace'
+
+
+def test_memory_storage_falls_back_when_missing(monkeypatch, tmpdir):
+    monkeypatch.setattr(workspace, 'MEMORY_STORAGE_DIR', str(tmpdir / 'missing'))
+    monkeypatch.setenv('WORKSPACE', '/some/ci/workspace')
+    assert get_storage_dir('memory') == '/some/ci/workspace'
+
+
+def test_path_storage(tmpdir):
+    path = str(tmpdir / 'fast' / 'disk')
+    with Workspace(storage=path) as ws:
+        assert os.path.dirname(str(ws.workspace)) == path
+        assert ws.workspace.is_dir()
+    assert not ws.workspace.exists()